@@ -1545,20 +1545,13 @@ class GUIScheduler(QMainWindow):
         
         # 对于立即执行，检查是否为交易日
         from PyQt5.QtWidgets import QMessageBox
-        from datetime import timedelta
         
         today = datetime.now()
         today_str = today.strftime("%Y-%m-%d")
         
         if not self.tools.is_trade_day(today_str):
-            # 今天不是交易日，寻找最近的交易日
-            recent_trading_day = today
-            for i in range(1, 10):  # 向前查找最多10天
-                check_date = today - timedelta(days=i)
-                check_date_str = check_date.strftime("%Y-%m-%d")
-                if self.tools.is_trade_day(check_date_str):
-                    recent_trading_day = check_date
-                    break
+            # 今天不是交易日，从交易日历取最近的交易日
+            recent_trading_day = self.tools.calendar.prev(today)
             
             reply = QMessageBox.question(
                 self, 
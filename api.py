@@ -1,11 +1,24 @@
 from __future__ import annotations
 
+import datetime
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import traceback
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Union
 
-from backtest_result import BacktestResult, parse_backtest_dir
+import pandas as pd
+
+from backtest_result import BacktestResult, PortfolioResult, WalkForwardResult, parse_backtest_dir, parse_portfolio_dir
 from khConfig import KhConfig
-from khFrame import KhQuantFramework, PeriodMismatchError
+from khData import load_frames, save_frames
+from khFrame import KhQuantFramework, PeriodMismatchError, load_checkpoint, parse_strategy_specs
+from khQTTools import get_trading_calendar
 
 
 def _check_period_mismatch_policy(config: KhConfig, *, allow_period_mismatch: bool) -> None:
@@ -43,13 +56,12 @@ def _check_period_mismatch_policy(config: KhConfig, *, allow_period_mismatch: bo
     )
 
 
-def run_backtest(
+def _resolve_inputs(
     config: Union[str, Path, KhConfig],
     strategy_file: Union[str, Path],
     *,
-    allow_period_mismatch: bool = False,
-    init_data_enabled: Optional[bool] = None,
-) -> BacktestResult:
+    allow_period_mismatch: bool,
+) -> tuple[Path, Path]:
     if isinstance(config, KhConfig):
         config_path = Path(config.config_path)
     else:
@@ -64,6 +76,33 @@ def run_backtest(
 
     cfg = config if isinstance(config, KhConfig) else KhConfig(str(config_path))
     _check_period_mismatch_policy(cfg, allow_period_mismatch=allow_period_mismatch)
+    return config_path, strategy_path
+
+
+def run_backtest(
+    config: Union[str, Path, KhConfig],
+    strategy_file: Union[str, Path],
+    *,
+    allow_period_mismatch: bool = False,
+    init_data_enabled: Optional[bool] = None,
+    checkpoint_days: Optional[int] = None,
+    resume_from: Union[str, Path, None] = None,
+) -> BacktestResult:
+    """Run one backtest and parse its result directory.
+
+    ``checkpoint_days`` (default: ``backtest.checkpoint_days`` of the config)
+    snapshots the engine state to ``checkpoint.pkl`` in the result directory every
+    that many trading days, and when the run is stopped. ``resume_from`` (a
+    checkpoint file or a result directory containing one) continues such a run
+    from its snapshot with the same config and strategy instead of starting over;
+    results are written to the original result directory. Strategies keeping their
+    own state in module globals can expose it through ``khSaveState()`` /
+    ``khLoadState(state)``.
+    """
+
+    config_path, strategy_path = _resolve_inputs(
+        config, strategy_file, allow_period_mismatch=allow_period_mismatch
+    )
 
     framework = KhQuantFramework(
         str(config_path),
@@ -72,6 +111,10 @@ def run_backtest(
         init_data_enabled=init_data_enabled,
         allow_period_mismatch=allow_period_mismatch,
     )
+    if checkpoint_days is not None:
+        framework.checkpoint_days = checkpoint_days
+    if resume_from is not None:
+        framework.resume_from = str(resume_from)
     framework.run()
 
     output_dir = getattr(framework, "last_backtest_dir", None)
@@ -79,3 +122,623 @@ def run_backtest(
         raise RuntimeError("Backtest finished but output_dir is unavailable")
 
     return parse_backtest_dir(output_dir)
+
+
+def run_portfolio_backtest(
+    config: Union[str, Path, KhConfig],
+    strategies: Union[Mapping, Iterable],
+    *,
+    allow_period_mismatch: bool = False,
+    init_data_enabled: Optional[bool] = None,
+) -> PortfolioResult:
+    """Backtest several strategies as sub-accounts of one portfolio.
+
+    ``strategies`` is a mapping ``path -> weight`` or a list of paths,
+    ``(path, weight)`` tuples or dicts with ``file``, ``weight`` and optionally
+    ``name`` and ``stock_list``. Weights are normalized into shares of the config's
+    initial capital. Market data is loaded and the timeline is built once; every bar
+    then drives each strategy against its own account.
+
+    The result directory holds the combined account in the regular layout (trades
+    gain a ``strategy`` column), ``strategies.csv`` with per-strategy metrics and
+    each strategy's own results under ``strategies/<name>/``.
+    """
+
+    specs = parse_strategy_specs(strategies)
+    if len(specs) < 2:
+        raise ValueError("run_portfolio_backtest needs at least two strategies; use run_backtest for one")
+    config_path, _ = _resolve_inputs(
+        config, specs[0]["file"], allow_period_mismatch=allow_period_mismatch
+    )
+    for spec in specs[1:]:
+        if not Path(spec["file"]).is_file():
+            raise FileNotFoundError(f"Strategy file not found: {spec['file']}")
+
+    framework = KhQuantFramework(
+        str(config_path),
+        specs,
+        trader_callback=None,
+        init_data_enabled=init_data_enabled,
+        allow_period_mismatch=allow_period_mismatch,
+    )
+    framework.run()
+
+    output_dir = getattr(framework, "last_backtest_dir", None)
+    if not output_dir:
+        raise RuntimeError("Backtest finished but output_dir is unavailable")
+
+    return parse_portfolio_dir(output_dir)
+
+
+def extend_backtest(
+    output_dir: Union[str, Path],
+    new_end_date: str,
+    *,
+    allow_period_mismatch: bool = False,
+    init_data_enabled: Optional[bool] = None,
+) -> Union[BacktestResult, PortfolioResult]:
+    """Continue a finished backtest up to ``new_end_date`` without rerunning it.
+
+    Every backtest that runs to the end saves its final state (accounts,
+    positions, records, the strategy's ``khSaveState()`` and its config) as
+    ``final_state.pkl`` in the result directory. The final state is restored, only
+    the trading days after the run's last day are loaded and simulated, and the
+    result is written to a new result directory. That directory holds the
+    original ``trades``/``daily_stats`` with the new days appended, and it can be
+    extended again.
+
+    The result matches a full rerun for strategies whose state is in the
+    accounts or exposed through ``khSaveState()``/``khLoadState()``. The strategy
+    files must still exist at their original paths. Strategies that need the
+    whole period's panel (``KH_INDICATORS``, ``khVectorStrategy``) are rejected.
+    """
+
+    state_path = Path(output_dir) / "final_state.pkl"
+    if not state_path.is_file():
+        raise FileNotFoundError(f"Missing final state of the backtest: {state_path}")
+    state = load_checkpoint(str(state_path))
+
+    new_end = str(new_end_date).replace("-", "")[:8]
+    calendar = get_trading_calendar()
+    new_start = calendar.shift(state["last_date"], 1).strftime("%Y%m%d")
+    if new_start > new_end or not calendar.range(new_start, new_end):
+        raise ValueError(f"No trading days after {state['last_date']} up to {new_end}")
+
+    specs = state["strategy_specs"]
+    for spec in specs:
+        if not Path(spec["file"]).is_file():
+            raise FileNotFoundError(f"Strategy file not found: {spec['file']}")
+
+    work_dir = tempfile.mkdtemp(prefix="kh_extend_")
+    try:
+        config_path = _write_window_config(
+            state["config_dict"], new_start, new_end, os.path.join(work_dir, state["config_name"])
+        )
+        _check_period_mismatch_policy(KhConfig(config_path), allow_period_mismatch=allow_period_mismatch)
+        framework = KhQuantFramework(
+            config_path,
+            specs if len(specs) > 1 else specs[0]["file"],
+            trader_callback=None,
+            init_data_enabled=init_data_enabled,
+            allow_period_mismatch=allow_period_mismatch,
+        )
+        framework.extend_from = str(state_path)
+        framework.run()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    new_output_dir = getattr(framework, "last_backtest_dir", None)
+    if not new_output_dir:
+        raise RuntimeError("Backtest finished but output_dir is unavailable")
+    if len(specs) > 1:
+        return parse_portfolio_dir(new_output_dir)
+    return parse_backtest_dir(new_output_dir)
+
+
+def expand_param_grid(param_grid: Union[Mapping, Iterable[Mapping]]) -> List[Dict[str, Any]]:
+    """Expand a parameter grid into a list of parameter dicts.
+
+    A mapping of ``name -> list of values`` expands to the cartesian product in key
+    order; an iterable of mappings is taken as an explicit list of combinations.
+    """
+
+    if isinstance(param_grid, Mapping):
+        names = list(param_grid)
+        values = [
+            [v] if isinstance(v, (str, bytes)) or not isinstance(v, Iterable) else list(v)
+            for v in param_grid.values()
+        ]
+        return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+    return [dict(p) for p in param_grid]
+
+
+def _run_grid_point(
+    config_path: str,
+    strategy_path: str,
+    params: Dict[str, Any],
+    history_dir: Optional[str],
+    tag: str,
+    allow_period_mismatch: bool,
+    init_data_enabled: Optional[bool],
+) -> Dict[str, Any]:
+    """Run one grid combination; module-level so process pools can pickle it."""
+
+    row: Dict[str, Any] = dict(params)
+    try:
+        framework = KhQuantFramework(
+            config_path,
+            strategy_path,
+            trader_callback=None,
+            init_data_enabled=init_data_enabled,
+            allow_period_mismatch=allow_period_mismatch,
+        )
+        if history_dir:
+            framework.preloaded_history = load_frames(history_dir)
+        framework.backtest_tag = tag
+        framework.save_final_state = False
+        for name, value in params.items():
+            setattr(framework.strategy_module, name, value)
+        framework.run()
+
+        output_dir = getattr(framework, "last_backtest_dir", None)
+        if not output_dir:
+            raise RuntimeError("Backtest finished but output_dir is unavailable")
+        result = parse_backtest_dir(output_dir)
+        if len(result.summary):
+            for key, value in result.summary.iloc[0].to_dict().items():
+                row.setdefault(key, value)
+        trades = result.trades
+        if "status" in trades.columns:
+            # Rejected signals are kept in trades.csv but are not trades
+            trades = trades[trades["status"] != "rejected"]
+        row["trade_count"] = len(trades)
+        reason = result.config["stop_reason"].iloc[0] if "stop_reason" in result.config.columns and len(result.config) else None
+        row["stop_reason"] = reason if isinstance(reason, str) and reason else None
+        row["output_dir"] = output_dir
+        row["error"] = None
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        row["traceback"] = traceback.format_exc()
+    return row
+
+
+def _preload_history_dir(
+    config_path: Path,
+    strategy_path: Path,
+    *,
+    allow_period_mismatch: bool,
+    init_data_enabled: Optional[bool],
+) -> str:
+    """Load the config's market data once and save it for memory-mapped reuse."""
+
+    loader = KhQuantFramework(
+        str(config_path),
+        str(strategy_path),
+        trader_callback=None,
+        init_data_enabled=init_data_enabled,
+        allow_period_mismatch=allow_period_mismatch,
+    )
+    if init_data_enabled is not False:
+        loader.init_data()
+    history_dir = tempfile.mkdtemp(prefix="kh_grid_")
+    save_frames(loader.preload_history(), history_dir)
+    return history_dir
+
+
+def _run_grid_points(args: List[tuple], workers: int) -> List[Dict[str, Any]]:
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as executor:
+            return list(executor.map(_run_grid_point, *zip(*args)))
+    return [_run_grid_point(*a) for a in args]
+
+
+def run_backtests_grid(
+    config: Union[str, Path, KhConfig],
+    strategy_file: Union[str, Path],
+    param_grid: Union[Mapping, Iterable[Mapping]],
+    *,
+    workers: int = 1,
+    allow_period_mismatch: bool = False,
+    init_data_enabled: Optional[bool] = None,
+    share_data: bool = True,
+) -> pd.DataFrame:
+    """Run the strategy once per parameter combination and collect summary metrics.
+
+    Each combination is injected as module-level attributes of a freshly loaded
+    strategy module before the backtest starts, so strategies should read parameters
+    as globals at call time (e.g. ``FAST = 5`` used inside ``khHandlebar``). Market data is loaded once in this process and
+    written to a temporary directory of ``.npy`` files that every run memory-maps
+    read-only instead of querying xtdata again. With ``workers > 1`` the runs are
+    distributed over a process pool.
+
+    Returns one row per combination, in grid order: the parameters, the columns of
+    ``summary.csv``, ``trade_count``, ``output_dir`` and ``error`` (``None`` on
+    success; failed runs keep their row and traceback instead of aborting the sweep).
+    """
+
+    config_path, strategy_path = _resolve_inputs(
+        config, strategy_file, allow_period_mismatch=allow_period_mismatch
+    )
+    combos = expand_param_grid(param_grid)
+    if not combos:
+        return pd.DataFrame()
+
+    history_dir: Optional[str] = None
+    try:
+        if share_data:
+            history_dir = _preload_history_dir(
+                config_path,
+                strategy_path,
+                allow_period_mismatch=allow_period_mismatch,
+                init_data_enabled=init_data_enabled,
+            )
+
+        args = [
+            (
+                str(config_path),
+                str(strategy_path),
+                params,
+                history_dir,
+                f"p{i:04d}",
+                allow_period_mismatch,
+                # shared data was already downloaded once above
+                False if share_data else init_data_enabled,
+            )
+            for i, params in enumerate(combos)
+        ]
+        rows = _run_grid_points(args, workers)
+    finally:
+        if history_dir:
+            shutil.rmtree(history_dir, ignore_errors=True)
+
+    return pd.DataFrame(rows)
+
+
+def walk_forward_windows(
+    start: str,
+    end: str,
+    in_sample: int,
+    out_of_sample: int,
+    step: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """Split ``[start, end]`` into rolling in-sample / out-of-sample windows.
+
+    Window lengths are counted in trading days. Each window's out-of-sample
+    period starts on the trading day after its in-sample period; windows advance
+    by ``step`` trading days (default ``out_of_sample``, i.e. back-to-back
+    out-of-sample periods). The last out-of-sample period is truncated at ``end``.
+    """
+
+    if in_sample <= 0 or out_of_sample <= 0:
+        raise ValueError("in_sample and out_of_sample must be positive")
+    step = out_of_sample if step is None else step
+    if step <= 0:
+        raise ValueError("step must be positive")
+
+    days = [d.strftime("%Y%m%d") for d in get_trading_calendar().range(start, end)]
+    windows = []
+    i = 0
+    while i + in_sample < len(days):
+        oos = days[i + in_sample:i + in_sample + out_of_sample]
+        windows.append(
+            {
+                "is_start": days[i],
+                "is_end": days[i + in_sample - 1],
+                "oos_start": oos[0],
+                "oos_end": oos[-1],
+            }
+        )
+        i += step
+    return windows
+
+
+def _write_window_config(
+    base: Dict[str, Any], start: str, end: str, path: str, backtest: Optional[Dict[str, Any]] = None
+) -> str:
+    config_dict = json.loads(json.dumps(base))
+    config_dict.setdefault("backtest", {})
+    config_dict["backtest"].update(backtest or {})
+    config_dict["backtest"]["start_time"] = start
+    config_dict["backtest"]["end_time"] = end
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config_dict, f, indent=4, ensure_ascii=False)
+    return path
+
+
+def _summarize_equity(total_asset: pd.Series, init_capital: float) -> Dict[str, Any]:
+    """Same metrics and formulas as the engine's summary.csv."""
+
+    trade_days = len(total_asset)
+    final_capital = float(total_asset.iloc[-1]) if trade_days else float(init_capital)
+    total_return = annual_return = max_drawdown = 0.0
+    if trade_days >= 2 and init_capital > 0:
+        total_return = (final_capital - init_capital) / init_capital * 100
+        annual_return = (pow(final_capital / init_capital, 250 / trade_days) - 1) * 100
+        cummax = total_asset.cummax()
+        max_drawdown = float(((cummax - total_asset) / cummax * 100).max())
+    return {
+        "init_capital": init_capital,
+        "final_capital": final_capital,
+        "total_return": total_return,
+        "annual_return": annual_return,
+        "max_drawdown": max_drawdown,
+        "trade_days": trade_days,
+    }
+
+
+def _chain_out_of_sample(
+    windows: pd.DataFrame, init_capital: float, output_dir: Path
+) -> None:
+    """Chain the out-of-sample runs into one set of result files.
+
+    Every out-of-sample run starts flat with ``init_capital``; its equity columns
+    are rescaled so that it continues from the previous window's final equity.
+    Trades are concatenated unscaled with a ``window`` column.
+    """
+
+    daily_parts, trade_parts, benchmark_parts = [], [], []
+    scale = 1.0
+    for _, window in windows.iterrows():
+        oos_dir = window.get("oos_output_dir")
+        if not isinstance(oos_dir, str) or not oos_dir:
+            continue
+        result = parse_backtest_dir(oos_dir)
+        daily = result.daily_stats.copy()
+        if len(daily):
+            for col in ("total_asset", "cash", "market_value"):
+                if col in daily.columns:
+                    daily[col] = pd.to_numeric(daily[col], errors="coerce") * scale
+            daily.insert(0, "window", window["window"])
+            daily_parts.append(daily)
+            scale = float(daily["total_asset"].iloc[-1]) / init_capital
+        trades = result.trades.copy()
+        trades.insert(0, "window", window["window"])
+        trade_parts.append(trades)
+        benchmark_parts.append(result.benchmark)
+
+    daily_stats = pd.concat(daily_parts, ignore_index=True) if daily_parts else pd.DataFrame(
+        columns=["window", "date", "total_asset", "cash", "market_value", "daily_return", "benchmark_close", "positions"]
+    )
+    trades = pd.concat(trade_parts, ignore_index=True) if trade_parts else pd.DataFrame(columns=["window"])
+    benchmark = pd.DataFrame(columns=["date", "close"])
+    if benchmark_parts:
+        benchmark = pd.concat(benchmark_parts, ignore_index=True).drop_duplicates("date", keep="last")
+    total_asset = pd.to_numeric(daily_stats["total_asset"], errors="coerce").dropna() if len(daily_stats) else pd.Series(dtype=float)
+    summary = pd.DataFrame([_summarize_equity(total_asset.reset_index(drop=True), init_capital)])
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    daily_stats.to_csv(output_dir / "daily_stats.csv", index=False, encoding="utf-8-sig")
+    trades.to_csv(output_dir / "trades.csv", index=False, encoding="utf-8-sig")
+    benchmark.to_csv(output_dir / "benchmark.csv", index=False, encoding="utf-8-sig")
+    summary.to_csv(output_dir / "summary.csv", index=False, encoding="utf-8-sig")
+    windows.to_csv(output_dir / "windows.csv", index=False, encoding="utf-8-sig")
+
+
+def run_walk_forward(
+    config: Union[str, Path, KhConfig],
+    strategy_file: Union[str, Path],
+    param_grid: Union[Mapping, Iterable[Mapping]],
+    *,
+    in_sample: int,
+    out_of_sample: int,
+    step: Optional[int] = None,
+    metric: str = "total_return",
+    maximize: bool = True,
+    workers: int = 1,
+    output_dir: Union[str, Path, None] = None,
+    allow_period_mismatch: bool = False,
+    init_data_enabled: Optional[bool] = None,
+) -> WalkForwardResult:
+    """Walk-forward optimization over the config's backtest period.
+
+    The period is split with :func:`walk_forward_windows`. For every window the
+    parameter grid is evaluated on the in-sample period and the combination with
+    the best ``metric`` (a ``summary.csv`` column) is then run on the following
+    out-of-sample period. All in-sample runs of all windows are scheduled on one
+    process pool, followed by the out-of-sample runs. Market data for the whole
+    period is loaded once and memory-mapped by every run, which only slices its
+    own window.
+
+    The chained out-of-sample equity curve is written to ``output_dir`` (default
+    ``backtest_results/walkforward_<start>_<end>_<timestamp>``) in the regular
+    result layout plus ``windows.csv`` with the chosen parameters per window.
+    """
+
+    config_path, strategy_path = _resolve_inputs(
+        config, strategy_file, allow_period_mismatch=allow_period_mismatch
+    )
+    cfg = KhConfig(str(config_path))
+    windows = walk_forward_windows(cfg.backtest_start, cfg.backtest_end, in_sample, out_of_sample, step)
+    if not windows:
+        raise ValueError(
+            f"Backtest period {cfg.backtest_start}-{cfg.backtest_end} is too short for "
+            f"in_sample={in_sample} + out_of_sample={out_of_sample} trading days"
+        )
+    combos = expand_param_grid(param_grid)
+    if not combos:
+        raise ValueError("param_grid is empty")
+
+    if output_dir is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = Path("backtest_results") / f"walkforward_{cfg.backtest_start}_{cfg.backtest_end}_{stamp}"
+    output_dir = Path(output_dir)
+
+    work_dir = tempfile.mkdtemp(prefix="kh_wf_")
+    history_dir: Optional[str] = None
+    try:
+        history_dir = _preload_history_dir(
+            config_path,
+            strategy_path,
+            allow_period_mismatch=allow_period_mismatch,
+            init_data_enabled=init_data_enabled,
+        )
+
+        # In-sample: every combination of every window in one pool.
+        is_args, is_keys = [], []
+        for w, window in enumerate(windows):
+            window_config = _write_window_config(
+                cfg.config_dict, window["is_start"], window["is_end"], os.path.join(work_dir, f"w{w:03d}_is.kh")
+            )
+            for c, params in enumerate(combos):
+                is_args.append(
+                    (window_config, str(strategy_path), params, history_dir, f"w{w:03d}_is_p{c:04d}", allow_period_mismatch, False)
+                )
+                is_keys.append(w)
+        is_rows = _run_grid_points(is_args, workers)
+
+        rows = []
+        oos_args, oos_windows = [], []
+        for w, window in enumerate(windows):
+            candidates = pd.DataFrame([r for key, r in zip(is_keys, is_rows) if key == w])
+            row: Dict[str, Any] = {"window": w, **window}
+            scored = candidates
+            if "error" in scored.columns:
+                scored = scored[scored["error"].isna()]
+            if metric in scored.columns:
+                scored = scored[pd.to_numeric(scored[metric], errors="coerce").notna()]
+            if len(scored) == 0 or metric not in scored.columns:
+                row["error"] = f"No successful in-sample run with metric {metric!r}"
+                rows.append(row)
+                continue
+            values = pd.to_numeric(scored[metric])
+            best = scored.loc[values.idxmax() if maximize else values.idxmin()]
+            params = {name: best[name] for name in combos[0]}
+            params = {name: value.item() if hasattr(value, "item") else value for name, value in params.items()}
+            row.update(params)
+            row[f"is_{metric}"] = float(best[metric])
+            rows.append(row)
+
+            window_config = _write_window_config(
+                cfg.config_dict, window["oos_start"], window["oos_end"], os.path.join(work_dir, f"w{w:03d}_oos.kh")
+            )
+            oos_args.append((window_config, str(strategy_path), params, history_dir, f"w{w:03d}_oos", allow_period_mismatch, False))
+            oos_windows.append(len(rows) - 1)
+
+        for index, oos in zip(oos_windows, _run_grid_points(oos_args, workers)):
+            row = rows[index]
+            if oos.get("error"):
+                row["error"] = oos["error"]
+                continue
+            row[f"oos_{metric}"] = oos.get(metric)
+            row["oos_output_dir"] = oos.get("output_dir")
+            row["error"] = None
+
+        windows_df = pd.DataFrame(rows)
+        _chain_out_of_sample(windows_df, float(cfg.init_capital), output_dir)
+    finally:
+        if history_dir:
+            shutil.rmtree(history_dir, ignore_errors=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # config.csv: the first out-of-sample run's config, spanning the chained period
+    config_rows = [
+        pd.read_csv(Path(d) / "config.csv") for d in windows_df.get("oos_output_dir", pd.Series(dtype=object)).dropna()
+    ]
+    config_df = config_rows[0].copy() if config_rows else pd.DataFrame([{}])
+    config_df["start_time"] = windows[0]["oos_start"]
+    config_df["end_time"] = windows[-1]["oos_end"]
+    config_df.to_csv(output_dir / "config.csv", index=False, encoding="utf-8-sig")
+
+    return WalkForwardResult(
+        output_dir=str(output_dir),
+        windows=windows_df,
+        result=parse_backtest_dir(str(output_dir)),
+    )
+
+
+def run_successive_halving(
+    config: Union[str, Path, KhConfig],
+    strategy_file: Union[str, Path],
+    param_grid: Union[Mapping, Iterable[Mapping]],
+    *,
+    min_days: int,
+    eta: int = 3,
+    metric: str = "total_return",
+    maximize: bool = True,
+    stop_drawdown: Optional[float] = None,
+    workers: int = 1,
+    allow_period_mismatch: bool = False,
+    init_data_enabled: Optional[bool] = None,
+) -> pd.DataFrame:
+    """Successive-halving search over a parameter grid.
+
+    Rung ``r`` backtests the surviving combinations on the first
+    ``min_days * eta**r`` trading days of the config's period (capped at the full
+    period); the best ``1/eta`` of them by ``metric`` are promoted to the next,
+    longer rung until a rung covers the whole period. Combinations that fail or
+    are stopped early are never promoted.
+
+    ``stop_drawdown`` (percent) overrides ``backtest.stop_drawdown`` of the config:
+    a run whose drawdown from its peak total asset reaches it is ended early and
+    reported with its partial metrics and a ``stop_reason``.
+
+    Market data is loaded once for the full period and shared by every run.
+    Returns one row per run of every rung with the grid-run columns plus
+    ``candidate`` (index into the expanded grid), ``rung``, ``days``,
+    ``end_time`` and ``promoted``. The best combination is the top row of the
+    last rung by ``metric``.
+    """
+
+    if min_days <= 0:
+        raise ValueError("min_days must be positive")
+    if eta < 2:
+        raise ValueError("eta must be at least 2")
+
+    config_path, strategy_path = _resolve_inputs(
+        config, strategy_file, allow_period_mismatch=allow_period_mismatch
+    )
+    cfg = KhConfig(str(config_path))
+    days = [d.strftime("%Y%m%d") for d in get_trading_calendar().range(cfg.backtest_start, cfg.backtest_end)]
+    if not days:
+        raise ValueError(f"No trading days in backtest period {cfg.backtest_start}-{cfg.backtest_end}")
+    combos = expand_param_grid(param_grid)
+    if not combos:
+        raise ValueError("param_grid is empty")
+    backtest_overrides = {} if stop_drawdown is None else {"stop_drawdown": stop_drawdown}
+
+    work_dir = tempfile.mkdtemp(prefix="kh_sh_")
+    history_dir: Optional[str] = None
+    rows: List[Dict[str, Any]] = []
+    try:
+        history_dir = _preload_history_dir(
+            config_path,
+            strategy_path,
+            allow_period_mismatch=allow_period_mismatch,
+            init_data_enabled=init_data_enabled,
+        )
+
+        candidates = list(range(len(combos)))
+        rung = 0
+        while candidates:
+            n_days = min(min_days * eta ** rung, len(days))
+            rung_config = _write_window_config(
+                cfg.config_dict, days[0], days[n_days - 1], os.path.join(work_dir, f"r{rung:02d}.kh"), backtest_overrides
+            )
+            args = [
+                (rung_config, str(strategy_path), combos[c], history_dir, f"r{rung:02d}_p{c:04d}", allow_period_mismatch, False)
+                for c in candidates
+            ]
+            rung_rows = _run_grid_points(args, workers)
+            for c, row in zip(candidates, rung_rows):
+                row.update({"candidate": c, "rung": rung, "days": n_days, "end_time": days[n_days - 1], "promoted": False})
+
+            final = n_days == len(days)
+            scored = [
+                row for row in rung_rows
+                if not row.get("error") and not row.get("stop_reason")
+                and pd.notna(pd.to_numeric(row.get(metric), errors="coerce"))
+            ]
+            scored.sort(key=lambda row: float(row[metric]), reverse=maximize)
+            promoted = [] if final else scored[:max(1, len(candidates) // eta)]
+            for row in promoted:
+                row["promoted"] = True
+            rows.extend(rung_rows)
+
+            candidates = [row["candidate"] for row in promoted]
+            rung += 1
+    finally:
+        if history_dir:
+            shutil.rmtree(history_dir, ignore_errors=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return pd.DataFrame(rows)
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 import pandas as pd
 
@@ -17,6 +17,21 @@ class BacktestResult:
     config: pd.DataFrame
 
 
+@dataclass(frozen=True)
+class WalkForwardResult:
+    output_dir: str
+    windows: pd.DataFrame
+    result: BacktestResult
+
+
+@dataclass(frozen=True)
+class PortfolioResult:
+    output_dir: str
+    result: BacktestResult
+    strategies: Dict[str, BacktestResult]
+    summary: pd.DataFrame
+
+
 def required_files() -> List[str]:
     return [
         "trades.csv",
@@ -59,3 +74,43 @@ def parse_backtest_dir(output_dir: str) -> BacktestResult:
         benchmark=benchmark,
         config=config,
     )
+
+
+def read_records(output_dir: str, name: str = "trades") -> pd.DataFrame:
+    """Read the chunked ``records/<name>/`` files of a backtest directory.
+
+    The chunks are written while the backtest runs (Parquet when pyarrow is
+    installed, CSV otherwise), so this also works before ``trades.csv`` and
+    ``daily_stats.csv`` exist.
+    """
+
+    dir_path = Path(output_dir) / "records" / name
+    if not dir_path.is_dir():
+        raise FileNotFoundError(f"Missing records directory: {dir_path}")
+    frames = [
+        pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_csv(p)
+        for p in sorted(dir_path.glob("part-*"))
+        if p.suffix in (".parquet", ".csv")
+    ]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def parse_portfolio_dir(output_dir: str) -> PortfolioResult:
+    """Parse a multi-strategy backtest directory.
+
+    The directory itself holds the combined account; ``strategies.csv`` lists the
+    strategies, whose own results are under ``strategies/<name>/``.
+    """
+
+    dir_path = Path(output_dir)
+    summary = pd.read_csv(_require_file(dir_path, "strategies.csv"))
+    return PortfolioResult(
+        output_dir=str(dir_path),
+        result=parse_backtest_dir(str(dir_path)),
+        strategies={
+            name: parse_backtest_dir(str(dir_path / "strategies" / name)) for name in summary["strategy"]
+        },
+        summary=summary,
+    )
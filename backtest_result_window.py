@@ -23,6 +23,7 @@ import numpy as np
 import sys
 import time
 from khQTTools import KhQuTools
+from khData import get_benchmark_store
 from xtquant import xtdata
 
 # 设置matplotlib的字体和其他参数
@@ -3021,11 +3022,8 @@ class BacktestResultWindow(QMainWindow):
                 end_price = benchmark_df['close'].iloc[-1]
                 
                 # 起始价格应该是回测期间第一个日期的前一个交易日的收盘价
-                # 尝试通过xtdata获取前一个交易日的数据
+                # 通过基准缓存获取前一个交易日的收盘价
                 try:
-                    # 导入xtdata
-                    from xtquant import xtdata
-                    
                     # 获取benchmark_df中第一天的日期
                     first_date = pd.to_datetime(benchmark_df['date'].iloc[0])
                     
@@ -3036,40 +3034,19 @@ class BacktestResultWindow(QMainWindow):
                     first_date_str = first_date.strftime('%Y%m%d')
                     
                     # 计算前一个交易日的日期（往前推5天，确保能获取到前一个交易日）
-                    from datetime import datetime, timedelta
                     prev_date = (first_date - timedelta(days=5)).strftime('%Y%m%d')
                     
-                    # 获取沪深300指数（000300.SH）在这段时间的数据
-                    extra_data = xtdata.get_market_data(
-                        field_list=['close'],
-                        stock_list=['000300.SH'],
-                        period='1d',
-                        start_time=prev_date,
-                        end_time=first_date_str
-                    )
+                    # 获取沪深300指数（000300.SH）在这段时间的数据（优先读取本地缓存）
+                    series = get_benchmark_store().get('000300.SH', prev_date, first_date_str)
+                    prev_close = series.prev_close(int(first_date_str))
                     
-                    # 检查是否成功获取到数据
-                    if extra_data and 'close' in extra_data:
-                        extra_close = extra_data['close']
-                        
-                        # 根据实际数据结构检查，索引应该是股票代码，列是日期
-                        if isinstance(extra_close, pd.DataFrame) and '000300.SH' in extra_close.index and len(extra_close.columns) > 1:
-                            # 获取日期列表并排序
-                            date_columns = sorted(extra_close.columns)
-                            
-                            # 获取倒数第二个日期的收盘价（前一交易日）
-                            start_price = extra_close.loc['000300.SH', date_columns[-2]]
-                            
-                            # 记录日志
-                            print(f"成功获取到前一交易日沪深300指数收盘价: {start_price}, 日期: {date_columns[-2]}")
-                        else:
-                            # 获取额外数据失败，使用首日价格
-                            start_price = benchmark_df['close'].iloc[0]
-                            print(f"获取前一交易日数据失败，数据格式可能异常: 索引={extra_close.index if isinstance(extra_close, pd.DataFrame) else '非DataFrame'}, 使用首日价格: {start_price}")
+                    if prev_close is not None:
+                        start_price = prev_close
+                        print(f"成功获取到前一交易日沪深300指数收盘价: {start_price}")
                     else:
                         # 获取额外数据失败，使用首日价格
                         start_price = benchmark_df['close'].iloc[0]
-                        print(f"获取前一交易日数据失败，extra_data格式: {extra_data}, 使用首日价格: {start_price}")
+                        print(f"获取前一交易日数据失败，使用首日价格: {start_price}")
                 except Exception as e:
                     # 发生异常时，使用首日价格
                     start_price = benchmark_df['close'].iloc[0]
@@ -0,0 +1,1451 @@
+# coding: utf-8
+"""
+回测行情数据结构
+
+将逐股票加载的 DataFrame 对齐为 时间 × 股票 × 字段 的 NumPy 面板，
+回测主循环按整数位置索引，避免逐时间点的字典查找与 df.iloc 行构造。
+"""
+import datetime
+import os
+import pickle
+import threading
+import time as _time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# 依次尝试的时间字段名称（与回测引擎保持一致）
+TIME_FIELDS = ('time', 'timestamp', 'date', 'datetime')
+
+PANEL_MEMORY_LIMIT_MB = 4096  # 行情面板允许占用的最大内存（MB）
+HISTORY_CACHE_MAX_MB = 1024  # khHistory 进程内缓存允许占用的最大内存（MB）
+
+
+def to_epoch_ms(values) -> np.ndarray:
+    """将时间戳数组统一转换为毫秒级 int64
+
+    秒级时间戳（< 1e10）乘以1000，毫秒级保持不变；datetime64 按毫秒换算。
+
+    Args:
+        values: 时间戳序列（秒级/毫秒级数值，或 datetime64）
+
+    Returns:
+        np.ndarray: 毫秒级 int64 数组
+    """
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype('datetime64[ms]').astype(np.int64)
+    arr = arr.astype(np.float64)
+    return np.where(arr < 1e10, arr * 1000, arr).astype(np.int64)
+
+
+def find_time_field(df: pd.DataFrame) -> Optional[str]:
+    """查找 DataFrame 中的时间字段名，找不到返回 None"""
+    for field in TIME_FIELDS:
+        if field in df.columns:
+            return field
+    return None
+
+
+def local_utc_offsets(seconds: np.ndarray) -> np.ndarray:
+    """计算每个秒级时间戳对应的本地时区UTC偏移（秒）
+
+    偏移按整点小时去重后逐个查询，结果与 datetime.fromtimestamp 的本地时间一致。
+    """
+    seconds = np.asarray(seconds, dtype=np.int64)
+    if len(seconds) == 0:
+        return np.zeros(0, dtype=np.int64)
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.array([_time.localtime(int(h) * 3600).tm_gmtoff for h in hours], dtype=np.int64)
+    return offsets[inverse]
+
+
+def seconds_of_day(times) -> np.ndarray:
+    """计算时间戳数组中每个时间点的当日秒数（本地时间，从午夜开始）"""
+    seconds = to_epoch_ms(times) // 1000
+    return (seconds + local_utc_offsets(seconds)) % 86400
+
+
+def near_seconds_mask(sod: np.ndarray, targets: Sequence[int], tolerance: int = 1) -> np.ndarray:
+    """标记当日秒数与任一目标秒数相差不超过 tolerance 的位置
+
+    Args:
+        sod: 当日秒数数组
+        targets: 目标秒数（如自定义触发时间点）
+        tolerance: 允许的误差（秒，闭区间）
+
+    Returns:
+        np.ndarray: bool 数组
+    """
+    sod = np.asarray(sod, dtype=np.int64)
+    targets = np.unique(np.asarray(list(targets), dtype=np.int64))
+    if len(targets) == 0 or len(sod) == 0:
+        return np.zeros(len(sod), dtype=bool)
+    pos = np.searchsorted(targets, sod)
+    upper = targets[np.minimum(pos, len(targets) - 1)]
+    lower = targets[np.maximum(pos - 1, 0)]
+    distance = np.minimum(np.abs(upper - sod), np.abs(sod - lower))
+    return distance <= tolerance
+
+
+class TimeTable:
+    """回测时间轴的时间信息表
+
+    对整条时间轴一次性向量化计算本地日期、当日秒数、整数日期键(YYYYMMDD)等，
+    日期/时间字符串只对去重后的日期与当日秒数各生成一次，按下标提供。
+
+    Attributes:
+        ms: 毫秒级时间戳 (int64)
+        seconds: 秒级时间戳 (int64)
+        day_index: 每个时间点所属交易日在 dates 中的下标
+        day_keys: 每个时间点的整数日期键，如 20240102
+        sod: 每个时间点的当日秒数（本地时间）
+        dates: 去重后的日期字符串列表，格式 YYYY-MM-DD
+        day_starts/day_ends: 每个日期在时间轴上的起止下标（左闭右开）
+        is_day_start/is_day_end: 是否为当日第一个/最后一个时间点
+    """
+
+    def __init__(self, times: Sequence):
+        self.raw_times = times if isinstance(times, np.ndarray) else list(times)
+        try:
+            self.ms = to_epoch_ms(self.raw_times) if len(self.raw_times) else np.zeros(0, dtype=np.int64)
+            self.seconds = self.ms // 1000
+        except (TypeError, ValueError):
+            # 无法识别的时间格式，退化为直接使用原始值的字符串
+            self.seconds = None
+            self.dates = []
+            self.is_day_start = self.is_day_end = None
+            return
+
+        local = self.seconds + local_utc_offsets(self.seconds)
+        day_numbers = local // 86400
+        self.sod = local - day_numbers * 86400
+        unique_days, self.day_index = np.unique(day_numbers, return_inverse=True)
+        self.day_index = self.day_index.astype(np.int64)
+
+        epoch = datetime.date(1970, 1, 1)
+        self._day_dates = [epoch + datetime.timedelta(days=int(d)) for d in unique_days]
+        self.dates = [d.strftime("%Y-%m-%d") for d in self._day_dates]
+        self.unique_day_keys = np.array([d.year * 10000 + d.month * 100 + d.day for d in self._day_dates],
+                                        dtype=np.int64)
+        self.day_keys = self.unique_day_keys[self.day_index] if len(self.day_index) else np.zeros(0, dtype=np.int64)
+
+        # 每个交易日在时间轴上的起止下标（[start, end)），以及日首/日末时间点标记
+        self.day_starts = np.searchsorted(self.day_keys, self.unique_day_keys, side='left')
+        self.day_ends = np.searchsorted(self.day_keys, self.unique_day_keys, side='right')
+        self.is_day_start = np.zeros(len(self.day_keys), dtype=bool)
+        self.is_day_start[self.day_starts] = True
+        self.is_day_end = np.zeros(len(self.day_keys), dtype=bool)
+        self.is_day_end[self.day_ends - 1] = True
+
+        unique_sod, self._sod_index = np.unique(self.sod, return_inverse=True)
+        self._time_strs = [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in unique_sod.tolist()]
+
+    def __len__(self):
+        return len(self.raw_times)
+
+    def date(self, i: int) -> str:
+        return self.dates[self.day_index[i]]
+
+    def time(self, i: int) -> str:
+        return self._time_strs[self._sod_index[i]]
+
+    def info(self, i: int) -> Dict[str, Any]:
+        """第i个时间点的时间信息字典（即 data["__current_time__"]）"""
+        raw = self.raw_times[i]
+        if self.seconds is None:
+            return {
+                "timestamp": raw,
+                "datetime": str(raw),
+                "date": str(raw),
+                "time": str(raw),
+                "raw_time": raw
+            }
+        date_str = self.dates[self.day_index[i]]
+        time_str = self._time_strs[self._sod_index[i]]
+        return {
+            "timestamp": int(raw),
+            "datetime": f"{date_str} {time_str}",
+            "date": date_str,
+            "time": time_str,
+            "raw_time": raw
+        }
+
+    def to_date(self, i: int) -> datetime.date:
+        return self._day_dates[self.day_index[i]]
+
+    def to_datetime(self, i: int) -> datetime.datetime:
+        """第i个时间点的本地 datetime"""
+        d = self._day_dates[self.day_index[i]]
+        sod = int(self.sod[i])
+        return datetime.datetime(d.year, d.month, d.day, sod // 3600, sod % 3600 // 60, sod % 60,
+                                 int(self.ms[i] % 1000) * 1000)
+
+
+def frame_times(df: pd.DataFrame) -> Optional[np.ndarray]:
+    """提取 DataFrame 的时间戳数组
+
+    依次尝试 time/timestamp/date/datetime 字段，都没有时若索引为 DatetimeIndex
+    则使用索引（转换为秒级时间戳），否则返回 None。
+    """
+    field = find_time_field(df)
+    if field is not None:
+        return df[field].values
+    if isinstance(df.index, pd.DatetimeIndex):
+        return np.asarray(df.index.astype(np.int64) // 10**9)
+    return None
+
+
+def merge_timelines(code_times: Dict[str, np.ndarray]):
+    """合并各股票的时间轴
+
+    全程使用 NumPy 数组：拼接后 np.unique 去重排序，再用 searchsorted
+    记录每只股票的每一行在合并后时间轴上的位置。
+
+    Args:
+        code_times: {股票代码: 时间戳数组}
+
+    Returns:
+        tuple: (合并后的升序时间轴数组, {股票代码: 行位置数组})
+    """
+    arrays = [np.asarray(t) for t in code_times.values() if len(t)]
+    if not arrays:
+        return np.array([], dtype=np.int64), {code: np.array([], dtype=np.int64) for code in code_times}
+    times = np.unique(np.concatenate(arrays))
+    positions = {code: np.searchsorted(times, np.asarray(t)) for code, t in code_times.items()}
+    return times, positions
+
+
+class MarketPanel:
+    """按 时间 × 股票 × 字段 对齐的行情面板
+
+    Attributes:
+        times: 回测时间轴（原始时间戳，与 all_times 一致）
+        codes: 股票代码列表，顺序即面板第二维
+        fields: 数值字段列表，顺序即面板第三维
+        values: float64 数组，形状 (T, N, F)，缺失位置为 NaN
+        valid: bool 数组，形状 (T, N)，标记该股票在该时间点是否有数据
+        extra: 非数值字段（如tick的五档盘口列表），{字段: object数组 (T, N)}
+        object_fields: 非数值字段列表
+    """
+
+    def __init__(self, times, codes: List[str], fields: List[str], values: np.ndarray,
+                 valid: np.ndarray, extra: Optional[Dict[str, np.ndarray]] = None,
+                 columns: Optional[Dict[str, List[str]]] = None):
+        self.times = np.asarray(times)
+        self.codes = list(codes)
+        self.fields = list(fields)
+        self.values = values
+        self.valid = valid
+        self.extra = extra or {}
+        self.object_fields = list(self.extra)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.field_index = {field: i for i, field in enumerate(self.fields)}
+        # 每只股票原始的列顺序（数值字段与非数值字段混合）
+        self.columns = columns or {code: list(self.fields) for code in self.codes}
+        self._column_sets = {code: frozenset(cols) for code, cols in self.columns.items()}
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], times: Sequence,
+                    positions: Optional[Dict[str, np.ndarray]] = None,
+                    memory_limit_mb: float = PANEL_MEMORY_LIMIT_MB) -> 'MarketPanel':
+        """由 {股票代码: DataFrame} 构建面板
+
+        每只股票的行按时间字段匹配到时间轴上的位置；秒级/毫秒级时间戳统一按毫秒比较。
+        没有任何时间字段的股票会被跳过。分配前按 时间点×股票×字段 估算稠密面板的内存，
+        超过 memory_limit_mb 时（如长区间的tick、各股票时间点不对齐的大股票池）改为
+        逐股票存储的 SparseMarketPanel，内存与逐股票的原始数据相当。
+
+        Args:
+            frames: 逐股票的历史数据
+            times: 已排序的回测时间轴
+            positions: merge_timelines 记录的各股票行位置（可选，提供时直接使用）
+            memory_limit_mb: 稠密面板的内存上限（MB），不大于0表示不限制
+
+        Returns:
+            MarketPanel: 对齐后的面板
+        """
+        times = np.asarray(times)
+        times_ms = to_epoch_ms(times) if len(times) else np.array([], dtype=np.int64)
+
+        codes = []
+        fields = []
+        object_fields = []
+        columns = {}
+        for code, df in frames.items():
+            if not isinstance(df, pd.DataFrame) or find_time_field(df) is None:
+                continue
+            codes.append(code)
+            columns[code] = list(df.columns)
+            for col in df.columns:
+                if pd.api.types.is_numeric_dtype(df[col].dtype) or pd.api.types.is_bool_dtype(df[col].dtype):
+                    if col not in fields:
+                        fields.append(col)
+                elif col not in object_fields:
+                    object_fields.append(col)
+        object_fields = [f for f in object_fields if f not in fields]
+
+        T, N, F = len(times), len(codes), len(fields)
+        # 数值字段按float64、非数值字段按对象指针（8字节）、有效标记按1字节估算
+        estimated_mb = T * N * (F * 8 + len(object_fields) * 8 + 1) / 1024 ** 2
+        sparse = bool(memory_limit_mb) and memory_limit_mb > 0 and estimated_mb > memory_limit_mb
+
+        valid = np.zeros((T, N), dtype=bool)
+        field_index = {field: i for i, field in enumerate(fields)}
+        if sparse:
+            code_rows, code_values, code_extra = [], [], []
+        else:
+            values = np.full((T, N, F), np.nan, dtype=np.float64)
+            extra = {field: np.full((T, N), None, dtype=object) for field in object_fields}
+
+        for n, code in enumerate(codes):
+            df = frames[code]
+            if len(df) == 0 or T == 0:
+                if sparse:
+                    code_rows.append(np.array([], dtype=np.int64))
+                    code_values.append(np.full((0, F), np.nan, dtype=np.float64))
+                    code_extra.append({})
+                continue
+            if positions is not None and code in positions and len(positions[code]) == len(df):
+                pos = positions[code]
+                hit = np.ones(len(pos), dtype=bool)
+            else:
+                code_ms = to_epoch_ms(df[find_time_field(df)].values)
+                pos = np.searchsorted(times_ms, code_ms)
+                pos_clipped = np.minimum(pos, T - 1)
+                hit = (pos < T) & (times_ms[pos_clipped] == code_ms)
+            rows = pos[hit]
+            valid[rows, n] = True
+            if sparse:
+                # 与稠密面板的赋值一致：同一时间点有多行时保留最后一行
+                order = np.argsort(rows, kind='stable')
+                rows = rows[order]
+                keep = np.append(rows[1:] != rows[:-1], True)
+                take = np.flatnonzero(hit)[order[keep]]
+                rows = rows[keep]
+                block = np.full((len(rows), F), np.nan, dtype=np.float64)
+                objects = {}
+                for col in df.columns:
+                    col_values = df[col].values
+                    if col in field_index:
+                        block[:, field_index[col]] = col_values[take].astype(np.float64)
+                    elif col in object_fields:
+                        objects[col] = col_values[take]
+                code_rows.append(rows)
+                code_values.append(block)
+                code_extra.append(objects)
+                continue
+            for col in df.columns:
+                col_values = df[col].values
+                if col in field_index:
+                    values[rows, n, field_index[col]] = col_values[hit].astype(np.float64)
+                elif col in extra:
+                    extra[col][rows, n] = col_values[hit]
+
+        if sparse:
+            return SparseMarketPanel(times, codes, fields, code_rows, code_values, valid,
+                                     code_extra=code_extra, object_fields=object_fields, columns=columns)
+        return cls(times, codes, fields, values, valid, extra=extra, columns=columns)
+
+    def __len__(self):
+        return len(self.times)
+
+    def field(self, name: str) -> np.ndarray:
+        """获取某个字段的 (T, N) 视图"""
+        if name in self.field_index:
+            return self.values[:, :, self.field_index[name]]
+        if name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def cell(self, t: int, n: int, name: str):
+        """第t个时间点、第n只股票某个字段的值"""
+        fi = self.field_index.get(name)
+        if fi is not None:
+            return self.values[t, n, fi]
+        if name in self.extra:
+            return self.extra[name][t, n]
+        raise KeyError(name)
+
+    def cross_section(self, t: int, field_positions: Sequence[int], codes: Optional[np.ndarray] = None) -> np.ndarray:
+        """第t个时间点各股票的数值字段，形状 (股票数, 字段数)；codes 为股票下标，省略时为全部股票"""
+        if codes is None:
+            return self.values[t][:, field_positions]
+        return self.values[t, codes][:, field_positions]
+
+    def code_rows(self, n: int) -> np.ndarray:
+        """第n只股票有数据的时间点下标（升序）"""
+        return np.flatnonzero(self.valid[:, n])
+
+    def code_column(self, n: int, name: str) -> np.ndarray:
+        """第n只股票在其有数据的时间点（code_rows）上某个字段的值"""
+        return self.field(name)[self.code_rows(n), n]
+
+    def row(self, t: int, n: int) -> 'BarRow':
+        """获取第t个时间点、第n只股票的行视图"""
+        return BarRow(self, t, n)
+
+    def _check_new_fields(self, new_fields: Dict[str, Any]):
+        for name in new_fields:
+            if name in self.field_index or name in self.object_fields:
+                raise ValueError(f"字段 {name} 已存在")
+
+    def _append_field_names(self, names: List[str]):
+        for name in names:
+            self.field_index[name] = len(self.fields)
+            self.fields.append(name)
+        for code in self.codes:
+            self.columns[code] = list(self.columns[code]) + list(names)
+            self._column_sets[code] = frozenset(self.columns[code])
+
+    def add_fields(self, new_fields: Dict[str, Any]):
+        """追加数值字段（如预计算的指标），各股票的列表中同时追加这些字段
+
+        Args:
+            new_fields: {字段名: (T, N) 数组，或按股票顺序排列、与各股票 code_rows 对齐的数组列表}
+        """
+        if not new_fields:
+            return
+        self._check_new_fields(new_fields)
+        T, N = self.valid.shape
+        stacked = np.full((T, N, len(new_fields)), np.nan, dtype=np.float64)
+        for k, value in enumerate(new_fields.values()):
+            if isinstance(value, np.ndarray) and value.shape == (T, N):
+                stacked[:, :, k] = value
+            else:
+                for n, code_value in enumerate(value):
+                    stacked[self.code_rows(n), n, k] = code_value
+        self.values = np.concatenate([self.values, stacked], axis=2)
+        self._append_field_names(list(new_fields))
+
+
+class SparseMarketPanel(MarketPanel):
+    """逐股票存储的行情面板（稠密面板超过内存上限时由 MarketPanel.from_frames 构建）
+
+    接口与 MarketPanel 一致，只有 valid 为 (T, N) 的稠密数组；各股票的数值字段保存为
+    (该股票时间点数, F) 数组，按时间点取值时在该股票的时间下标上二分查找。
+    field() 会临时展开为 (T, N) 数组，向量化策略在这种面板上按字段读取时内存与一个字段的稠密数组相当。
+
+    Attributes:
+        rows: 各股票有数据的时间点下标列表（升序）
+        code_values: 各股票的数值字段数组列表，形状 (len(rows[n]), F)
+        code_extra: 各股票的非数值字段列表，{字段: object数组}
+    """
+
+    def __init__(self, times, codes: List[str], fields: List[str], rows: List[np.ndarray],
+                 code_values: List[np.ndarray], valid: np.ndarray,
+                 code_extra: Optional[List[Dict[str, np.ndarray]]] = None,
+                 object_fields: Optional[List[str]] = None,
+                 columns: Optional[Dict[str, List[str]]] = None):
+        super().__init__(times, codes, fields, None, valid, columns=columns)
+        self.rows = rows
+        self.code_values = code_values
+        self.code_extra = code_extra or [{} for _ in self.codes]
+        self.object_fields = list(object_fields or [])
+
+    def _locate(self, t: int, n: int) -> int:
+        rows = self.rows[n]
+        i = int(np.searchsorted(rows, t))
+        if i >= len(rows) or rows[i] != t:
+            raise KeyError(t)
+        return i
+
+    def field(self, name: str) -> np.ndarray:
+        """获取某个字段的 (T, N) 数组（临时展开，返回副本）"""
+        T, N = self.valid.shape
+        fi = self.field_index.get(name)
+        if fi is not None:
+            out = np.full((T, N), np.nan, dtype=np.float64)
+            for n in range(N):
+                out[self.rows[n], n] = self.code_values[n][:, fi]
+            return out
+        if name in self.object_fields:
+            out = np.full((T, N), None, dtype=object)
+            for n in range(N):
+                if name in self.code_extra[n]:
+                    out[self.rows[n], n] = self.code_extra[n][name]
+            return out
+        raise KeyError(name)
+
+    def cell(self, t: int, n: int, name: str):
+        fi = self.field_index.get(name)
+        if fi is not None:
+            return self.code_values[n][self._locate(t, n), fi]
+        if name in self.object_fields:
+            return self.code_extra[n][name][self._locate(t, n)]
+        raise KeyError(name)
+
+    def cross_section(self, t: int, field_positions: Sequence[int], codes: Optional[np.ndarray] = None) -> np.ndarray:
+        if codes is None:
+            codes = np.arange(len(self.codes))
+        out = np.full((len(codes), len(field_positions)), np.nan, dtype=np.float64)
+        for k, n in enumerate(codes):
+            rows = self.rows[n]
+            i = int(np.searchsorted(rows, t))
+            if i < len(rows) and rows[i] == t:
+                out[k] = self.code_values[n][i, field_positions]
+        return out
+
+    def code_rows(self, n: int) -> np.ndarray:
+        return self.rows[n]
+
+    def code_column(self, n: int, name: str) -> np.ndarray:
+        fi = self.field_index.get(name)
+        if fi is not None:
+            return self.code_values[n][:, fi]
+        if name in self.object_fields:
+            return self.code_extra[n].get(name, np.full(len(self.rows[n]), None, dtype=object))
+        raise KeyError(name)
+
+    def add_fields(self, new_fields: Dict[str, Any]):
+        if not new_fields:
+            return
+        self._check_new_fields(new_fields)
+        for n in range(len(self.codes)):
+            rows = self.rows[n]
+            columns = []
+            for value in new_fields.values():
+                if isinstance(value, np.ndarray) and value.shape == self.valid.shape:
+                    columns.append(np.asarray(value[rows, n], dtype=np.float64))
+                else:
+                    columns.append(np.broadcast_to(np.asarray(value[n], dtype=np.float64), rows.shape))
+            self.code_values[n] = np.column_stack([self.code_values[n]] + columns)
+        self._append_field_names(list(new_fields))
+
+
+def compute_indicators(panel: MarketPanel, specs: Dict[str, tuple]) -> Dict[str, List[np.ndarray]]:
+    """按策略声明的 KH_INDICATORS 在整个面板上一次性计算指标
+
+    声明格式为 {指标名: (函数, 字段, *参数)}，例如::
+
+        KH_INDICATORS = {
+            "ma5": ("MA", "close", 5),
+            "atr": ("ATR", ("close", "high", "low"), 14),
+            "boll_up": ("BOLL[0]", "close", 20, 2),
+        }
+
+    函数为 MyTT 中的函数名（或直接传入可调用对象），返回多个序列的函数用 "函数名[i]" 指定输出；
+    字段为单个字段名或字段名元组，依次作为函数的序列参数。每只股票只在其有数据的时间点上
+    按时间顺序计算，其余时间点没有指标值。第t个时间点的值只使用t及之前的数据。
+
+    Args:
+        panel: 行情面板
+        specs: 指标声明
+
+    Returns:
+        dict: {指标名: 按股票顺序排列、与各股票 code_rows 对齐的数组列表}，可直接传给 panel.add_fields
+    """
+    import MyTT
+
+    N = len(panel.codes)
+    results = {}
+    for name, spec in specs.items():
+        if not isinstance(spec, (tuple, list)) or len(spec) < 2:
+            raise ValueError(f"指标 {name} 的声明格式应为 (函数, 字段, *参数)，实际为: {spec!r}")
+        func, fields, params = spec[0], spec[1], spec[2:]
+        output = None
+        if isinstance(func, str):
+            func_name = func
+            if func.endswith(']') and '[' in func:
+                func, output = func[:-1].split('[', 1)
+                output = int(output)
+            func = getattr(MyTT, func, None)
+            if func is None:
+                raise ValueError(f"指标 {name} 使用了不存在的MyTT函数: {func_name}")
+        else:
+            func_name = getattr(func, '__name__', repr(func))
+        if isinstance(fields, str):
+            fields = (fields,)
+        for field in fields:
+            if field not in panel.field_index and field not in panel.object_fields:
+                raise KeyError(field)
+
+        out = []
+        for n in range(N):
+            rows = panel.code_rows(n)
+            if len(rows) == 0:
+                out.append(np.array([], dtype=np.float64))
+                continue
+            value = func(*[np.asarray(panel.code_column(n, field), dtype=np.float64) for field in fields], *params)
+            if output is not None:
+                value = value[output]
+            elif isinstance(value, tuple):
+                raise ValueError(f"指标 {name} 的函数 {func_name} 返回多个序列，请用 \"{func_name}[i]\" 指定输出")
+            out.append(np.broadcast_to(np.asarray(value, dtype=np.float64), rows.shape))
+        results[name] = out
+    return results
+
+
+class BarRow(Mapping):
+    """面板中单只股票单个时间点的只读行视图
+
+    行为与原先的 df.iloc[idx] 行（pd.Series）保持一致：支持 row['close']、row.get('close')、
+    'close' in row、row.empty 以及 row.close 属性访问；取值时才读取底层数组，不复制数据。
+    无数据时表现为空行（empty 为 True，不包含任何字段）。
+    """
+    __slots__ = ('_panel', '_t', '_n')
+
+    def __init__(self, panel: MarketPanel, t: int, n: int):
+        self._panel = panel
+        self._t = t
+        self._n = n
+
+    @property
+    def empty(self) -> bool:
+        return not self._panel.valid[self._t, self._n]
+
+    def _columns(self) -> List[str]:
+        if not self._panel.valid[self._t, self._n]:
+            return []
+        return self._panel.columns[self._panel.codes[self._n]]
+
+    def __getitem__(self, field: str):
+        panel = self._panel
+        # 只有该股票自身数据中的字段可取（其他股票才有的字段与原先的Series行一样抛出KeyError）
+        if panel.valid[self._t, self._n] and field in panel._column_sets[panel.codes[self._n]]:
+            return panel.cell(self._t, self._n, field)
+        raise KeyError(field)
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, field) -> bool:
+        panel = self._panel
+        return bool(panel.valid[self._t, self._n]) and field in panel._column_sets[panel.codes[self._n]]
+
+    def __iter__(self):
+        return iter(self._columns())
+
+    def __len__(self) -> int:
+        return len(self._columns())
+
+    @property
+    def index(self) -> List[str]:
+        """字段列表（兼容 pd.Series.index 的用法）"""
+        return list(self._columns())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: self[field] for field in self._columns()}
+
+    def to_series(self) -> pd.Series:
+        """转换为 pd.Series（会复制数据）"""
+        if self.empty:
+            return pd.Series({}, dtype=object)
+        return pd.Series(self.to_dict())
+
+    def __repr__(self):
+        return f"BarRow({self._panel.codes[self._n]}, {self.to_dict()})"
+
+
+class BarContext(Mapping):
+    """单个时间点传给策略的只读数据上下文
+
+    替代每个时间点重新构建的 current_data 字典，构建开销与股票数量无关：
+    股票数据以 BarRow 视图按需生成，账户、持仓等对象直接引用交易管理器中的实例。
+    键的顺序与原字典一致：__current_time__、各股票代码、__account__、__positions__、
+    __stock_list__、__framework__；策略启用滚动历史时最后追加 __history__。
+    """
+    __slots__ = ('_panel', '_t', '_time_info', '_account', '_positions', '_stock_list', '_framework',
+                 '_history')
+
+    def __init__(self, panel: MarketPanel, t: int, time_info: Dict, account: Dict = None,
+                 positions: Dict = None, stock_list: List[str] = None, framework: Any = None,
+                 history: 'RollingHistory' = None):
+        self._panel = panel
+        self._t = t
+        self._time_info = time_info
+        self._account = account
+        self._positions = positions
+        self._stock_list = stock_list
+        self._framework = framework
+        self._history = history
+
+    @property
+    def time_index(self) -> int:
+        """当前时间点在回测时间轴上的下标"""
+        return self._t
+
+    def replace(self, time_info: Dict = None, stock_list: List[str] = None) -> 'BarContext':
+        """返回替换了时间信息（或股票池）的新上下文，行情数据仍指向同一时间点
+
+        用于盘前/盘后回调：沿用当日某个时间点的行情，但时间显示为盘前/盘后时间。
+        """
+        return BarContext(self._panel, self._t,
+                          self._time_info if time_info is None else time_info,
+                          self._account, self._positions,
+                          self._stock_list if stock_list is None else stock_list,
+                          self._framework, self._history)
+
+    def _special(self) -> Dict[str, Any]:
+        special = {
+            '__current_time__': self._time_info,
+            '__account__': self._account,
+            '__positions__': self._positions,
+            '__stock_list__': self._stock_list,
+        }
+        if self._framework is not None:
+            special['__framework__'] = self._framework
+        if self._history is not None:
+            special['__history__'] = self._history
+        return special
+
+    def __getitem__(self, key):
+        n = self._panel.code_index.get(key)
+        if n is not None:
+            return BarRow(self._panel, self._t, n)
+        if key == '__current_time__':
+            return self._time_info
+        if key == '__account__':
+            return self._account
+        if key == '__positions__':
+            return self._positions
+        if key == '__stock_list__':
+            return self._stock_list
+        if key == '__framework__' and self._framework is not None:
+            return self._framework
+        if key == '__history__' and self._history is not None:
+            return self._history
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        if key in self._panel.code_index:
+            return True
+        return key in ('__current_time__', '__account__', '__positions__', '__stock_list__') or \
+            (key == '__framework__' and self._framework is not None) or \
+            (key == '__history__' and self._history is not None)
+
+    def __iter__(self):
+        yield '__current_time__'
+        yield from self._panel.codes
+        yield '__account__'
+        yield '__positions__'
+        yield '__stock_list__'
+        if self._framework is not None:
+            yield '__framework__'
+        if self._history is not None:
+            yield '__history__'
+
+    def __len__(self) -> int:
+        return len(self._panel.codes) + 4 + (self._framework is not None) + (self._history is not None)
+
+    def copy(self) -> Dict[str, Any]:
+        """复制为普通字典（股票数据仍为行视图）"""
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"BarContext(time={self._time_info.get('datetime') if self._time_info else None}, codes={len(self._panel.codes)})"
+
+
+class RollingHistory(Mapping):
+    """每只股票最近 size 根K线的环形缓冲区（策略中通过 data["__history__"] 访问）
+
+    回测引擎按时间顺序调用 advance(t) 推进：第 t 个时间点及之前有数据的K线依次写入各股票的
+    缓冲区，每根K线的写入与缓冲区长度无关。读取时只会看到已推进到的时间点，不存在未来数据。
+
+    用法::
+
+        closes = data["__history__"]["000001.SZ"]["close"]        # 最近 size 根收盘价（时间升序）
+        closes = data["__history__"].series("000001.SZ", "close", 20)  # 最近20根
+    """
+
+    def __init__(self, panel: MarketPanel, size: int, fields: Optional[Sequence[str]] = None):
+        if size <= 0:
+            raise ValueError("滚动历史长度必须大于0")
+        self._panel = panel
+        self.size = int(size)
+        self.fields = [f for f in (fields or panel.fields) if f in panel.field_index]
+        missing = [f for f in (fields or []) if f not in panel.field_index]
+        if missing:
+            raise ValueError(f"滚动历史字段不存在: {missing}")
+        self._field_pos = [panel.field_index[f] for f in self.fields]
+        self._local_index = {f: i for i, f in enumerate(self.fields)}
+        N = len(panel.codes)
+        self._buffer = np.full((N, self.size, len(self.fields)), np.nan, dtype=np.float64)
+        self._count = np.zeros(N, dtype=np.int64)
+        self._next_t = 0
+
+    def advance(self, t: int):
+        """推进到第 t 个时间点（含），写入尚未写入的K线"""
+        panel = self._panel
+        for row in range(self._next_t, t + 1):
+            codes = np.flatnonzero(panel.valid[row])
+            if len(codes) == 0:
+                continue
+            slots = self._count[codes] % self.size
+            self._buffer[codes, slots, :] = panel.cross_section(row, self._field_pos, codes)
+            self._count[codes] += 1
+        self._next_t = max(self._next_t, t + 1)
+
+    def state(self) -> Dict[str, Any]:
+        """导出各股票缓冲区的内容（用于在另一段数据上接续，见 restore）"""
+        return {
+            'codes': list(self._panel.codes),
+            'fields': list(self.fields),
+            'size': self.size,
+            'buffer': self._buffer.copy(),
+            'count': self._count.copy(),
+        }
+
+    def restore(self, state: Dict[str, Any]):
+        """载入 state() 导出的缓冲区，作为当前面板第一个时间点之前的K线
+
+        缓冲区长度和字段必须一致；按股票代码对应，当前面板中没有的股票忽略。
+        """
+        if state['size'] != self.size or state['fields'] != self.fields:
+            raise ValueError("滚动历史的长度或字段与保存时不一致，无法接续")
+        if self._next_t:
+            raise RuntimeError("滚动历史已开始推进，无法再载入之前的K线")
+        code_index = self._panel.code_index
+        for i, code in enumerate(state['codes']):
+            n = code_index.get(code)
+            if n is not None:
+                self._buffer[n] = state['buffer'][i]
+                self._count[n] = state['count'][i]
+
+    def series(self, code: str, field: str, count: int = None) -> np.ndarray:
+        """某只股票某个字段最近 count 根K线的值（时间升序，返回副本）
+
+        Args:
+            code: 股票代码
+            field: 字段名
+            count: K线数量，默认取缓冲区全部；不足时返回已有的部分
+
+        Returns:
+            np.ndarray: 一维数组
+        """
+        n = self._panel.code_index[code]
+        fi = self._local_index[field]
+        available = min(int(self._count[n]), self.size)
+        count = available if count is None else min(int(count), available)
+        if count <= 0:
+            return np.zeros(0, dtype=np.float64)
+        end = int(self._count[n]) % self.size
+        index = (np.arange(end - count, end)) % self.size
+        return self._buffer[n, index, fi]
+
+    def __getitem__(self, code: str) -> Dict[str, np.ndarray]:
+        if code not in self._panel.code_index:
+            raise KeyError(code)
+        return {field: self.series(code, field) for field in self.fields}
+
+    def __contains__(self, code) -> bool:
+        return code in self._panel.code_index
+
+    def __iter__(self):
+        return iter(self._panel.codes)
+
+    def __len__(self) -> int:
+        return len(self._panel.codes)
+
+    def __repr__(self):
+        return f"RollingHistory(size={self.size}, fields={self.fields}, codes={len(self._panel.codes)})"
+
+
+def save_frames(frames: Dict[str, pd.DataFrame], directory: str):
+    """将 {股票代码: DataFrame} 保存到目录，供其他进程以内存映射方式共享读取
+
+    每个数值列把所有股票的数据首尾相接保存为一个 .npy 文件；索引和非数值列
+    （如tick的五档盘口列表）连同各股票的行偏移一起保存在 meta.pkl 中。
+
+    Args:
+        frames: 逐股票的历史数据
+        directory: 保存目录（不存在时创建）
+    """
+    os.makedirs(directory, exist_ok=True)
+    codes = [code for code, df in frames.items() if isinstance(df, pd.DataFrame)]
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(frames[code]) for code in codes])
+
+    column_dtypes = {}
+    for code in codes:
+        for col, dtype in frames[code].dtypes.items():
+            column_dtypes.setdefault(col, []).append(dtype)
+    numeric = {}
+    for col, dtypes in column_dtypes.items():
+        if all(pd.api.types.is_numeric_dtype(d) or pd.api.types.is_bool_dtype(d) for d in dtypes):
+            numeric[col] = np.result_type(*[np.dtype(d) for d in dtypes])
+
+    files = {}
+    for i, (col, dtype) in enumerate(numeric.items()):
+        merged = np.zeros(int(offsets[-1]), dtype=dtype)
+        for k, code in enumerate(codes):
+            df = frames[code]
+            if col in df.columns:
+                merged[offsets[k]:offsets[k + 1]] = df[col].to_numpy()
+        files[col] = f"col_{i}.npy"
+        np.save(os.path.join(directory, files[col]), merged)
+
+    meta = {
+        'codes': codes,
+        'offsets': offsets,
+        'columns': {code: list(frames[code].columns) for code in codes},
+        'files': files,
+        'index': {code: frames[code].index for code in codes},
+        'objects': {code: {col: frames[code][col].to_numpy() for col in frames[code].columns if col not in numeric}
+                    for code in codes},
+    }
+    with open(os.path.join(directory, 'meta.pkl'), 'wb') as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_frames(directory: str) -> Dict[str, pd.DataFrame]:
+    """读取 save_frames 保存的数据，数值列以只读内存映射方式引用，不复制到进程内存
+
+    Args:
+        directory: save_frames 的保存目录
+
+    Returns:
+        Dict[str, pd.DataFrame]: {股票代码: 历史数据}
+    """
+    with open(os.path.join(directory, 'meta.pkl'), 'rb') as f:
+        meta = pickle.load(f)
+    arrays = {col: np.load(os.path.join(directory, name), mmap_mode='r') for col, name in meta['files'].items()}
+    offsets = meta['offsets']
+    frames = {}
+    for k, code in enumerate(meta['codes']):
+        start, end = int(offsets[k]), int(offsets[k + 1])
+        objects = meta['objects'][code]
+        columns = {}
+        for col in meta['columns'][code]:
+            columns[col] = objects[col] if col in objects else arrays[col][start:end]
+        frames[code] = pd.DataFrame(columns, index=meta['index'][code], copy=False)
+    return frames
+
+
+def trim_frames(frames: Dict[str, pd.DataFrame], start: str, end: str) -> Dict[str, pd.DataFrame]:
+    """按日期区间 [start, end]（YYYYMMDD，结束日含全天）截取各股票的数据
+
+    时间已排序时按 searchsorted 取行切片，不复制数据；没有时间字段的数据原样返回。
+
+    Args:
+        frames: 逐股票的历史数据
+        start: 开始日期
+        end: 结束日期
+
+    Returns:
+        Dict[str, pd.DataFrame]: 截取后的数据
+    """
+    start_day = datetime.datetime.strptime(str(start)[:8], '%Y%m%d')
+    end_day = datetime.datetime.strptime(str(end)[:8], '%Y%m%d') + datetime.timedelta(days=1)
+    lo, hi = int(start_day.timestamp() * 1000), int(end_day.timestamp() * 1000)
+    trimmed = {}
+    for code, df in frames.items():
+        field = find_time_field(df) if isinstance(df, pd.DataFrame) else None
+        if field is None or len(df) == 0:
+            trimmed[code] = df
+            continue
+        ms = to_epoch_ms(df[field].values)
+        if len(ms) < 2 or np.all(ms[1:] >= ms[:-1]):
+            i, j = np.searchsorted(ms, [lo, hi], side='left')
+            trimmed[code] = df.iloc[int(i):int(j)]
+        else:
+            trimmed[code] = df[(ms >= lo) & (ms < hi)]
+    return trimmed
+
+
+def _close_frame_to_matrix(close_df: pd.DataFrame, codes: List[str]):
+    """将 get_market_data 返回的收盘价表（行为股票、列为日期）转换为 (日期键数组, 价格矩阵)"""
+    if close_df is None or close_df.empty:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(codes)))
+    day_keys = np.array([int(str(col)[:8]) for col in close_df.columns], dtype=np.int64)
+    frame = close_df.reindex(index=codes)
+    closes = frame.to_numpy(dtype=np.float64, na_value=np.nan).T
+    order = np.argsort(day_keys, kind='stable')
+    return day_keys[order], closes[order]
+
+
+class DailyClosePanel:
+    """回测区间内股票池的日线收盘价矩阵
+
+    一次性加载 (日期 × 股票) 的收盘价，用于每日收盘后的持仓估值；
+    持有股票池以外的股票时按需补充加载该股票的整段数据。
+
+    Attributes:
+        day_keys: 升序的整数日期数组（YYYYMMDD）
+        codes: 股票代码列表
+        closes: float64 数组，形状 (D, N)，缺失为 NaN
+    """
+
+    def __init__(self, codes: List[str], day_keys: np.ndarray, closes: np.ndarray,
+                 start: str = "", end: str = "", dividend_type: str = "none"):
+        self.codes = list(codes)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.day_keys = np.asarray(day_keys, dtype=np.int64)
+        self.closes = np.asarray(closes, dtype=np.float64).reshape(len(self.day_keys), len(self.codes))
+        self.start = start
+        self.end = end
+        self.dividend_type = dividend_type
+
+    @staticmethod
+    def _fetch(codes: List[str], start: str, end: str, dividend_type: str):
+        from xtquant import xtdata
+        daily_data = xtdata.get_market_data(
+            field_list=['close'],
+            stock_list=list(codes),
+            period='1d',
+            start_time=start,
+            end_time=end,
+            dividend_type=dividend_type
+        )
+        close_df = daily_data.get('close') if isinstance(daily_data, dict) else None
+        if not isinstance(close_df, pd.DataFrame):
+            close_df = None
+        return _close_frame_to_matrix(close_df, list(codes))
+
+    @classmethod
+    def load(cls, codes: List[str], start: str, end: str, dividend_type: str = "none") -> 'DailyClosePanel':
+        """一次请求加载全部股票在 [start, end] 内的日线收盘价
+
+        Args:
+            codes: 股票代码列表
+            start: 开始日期 YYYYMMDD
+            end: 结束日期 YYYYMMDD
+            dividend_type: 复权方式，与回测数据保持一致
+        """
+        codes = list(dict.fromkeys(codes))
+        if codes:
+            day_keys, closes = cls._fetch(codes, start, end, dividend_type)
+        else:
+            day_keys, closes = np.zeros(0, dtype=np.int64), np.zeros((0, 0))
+        return cls(codes, day_keys, closes, start, end, dividend_type)
+
+    def ensure_codes(self, codes: Sequence[str]):
+        """补充加载尚未包含在矩阵中的股票"""
+        missing = [code for code in dict.fromkeys(codes) if code not in self.code_index]
+        if not missing:
+            return
+        day_keys, closes = self._fetch(missing, self.start, self.end, self.dividend_type)
+        all_keys = np.union1d(self.day_keys, day_keys)
+        merged = np.full((len(all_keys), len(self.codes) + len(missing)), np.nan)
+        merged[np.searchsorted(all_keys, self.day_keys), :len(self.codes)] = self.closes
+        if len(day_keys):
+            merged[np.searchsorted(all_keys, day_keys), len(self.codes):] = closes
+        self.codes.extend(missing)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.day_keys = all_keys
+        self.closes = merged
+
+    def prices(self, day_key: int, codes: Sequence[str]) -> np.ndarray:
+        """指定日期一组股票的收盘价（无数据为 NaN）"""
+        self.ensure_codes(codes)
+        result = np.full(len(codes), np.nan)
+        pos = np.searchsorted(self.day_keys, day_key)
+        if pos < len(self.day_keys) and self.day_keys[pos] == day_key:
+            result[:] = self.closes[pos, [self.code_index[code] for code in codes]]
+        return result
+
+
+class BenchmarkSeries:
+    """基准指数日线收盘价序列（整数日期 → 收盘价）
+
+    Attributes:
+        code: 基准代码
+        day_keys: 升序的整数日期数组（YYYYMMDD）
+        closes: 与 day_keys 对应的收盘价
+    """
+
+    def __init__(self, code: str, day_keys: np.ndarray, closes: np.ndarray):
+        self.code = code
+        self.day_keys = np.asarray(day_keys, dtype=np.int64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.day_keys)
+
+    def close_on(self, day_key: int) -> Optional[float]:
+        """指定日期的收盘价，无数据返回 None"""
+        pos = np.searchsorted(self.day_keys, day_key)
+        if pos < len(self.day_keys) and self.day_keys[pos] == day_key and not np.isnan(self.closes[pos]):
+            return float(self.closes[pos])
+        return None
+
+    def prev_close(self, day_key: int) -> Optional[float]:
+        """指定日期之前（不含当日）最近一个交易日的收盘价，无数据返回 None"""
+        pos = np.searchsorted(self.day_keys, day_key, side='left') - 1
+        if pos >= 0:
+            return float(self.closes[pos])
+        return None
+
+    def slice(self, start_key: int, end_key: int) -> 'BenchmarkSeries':
+        """[start_key, end_key] 闭区间内的子序列"""
+        i = np.searchsorted(self.day_keys, start_key, side='left')
+        j = np.searchsorted(self.day_keys, end_key, side='right')
+        return BenchmarkSeries(self.code, self.day_keys[i:j], self.closes[i:j])
+
+    def to_frame(self) -> pd.DataFrame:
+        """转换为 date/close 两列的 DataFrame（与 benchmark.csv 格式一致）"""
+        return pd.DataFrame({
+            'date': pd.to_datetime(self.day_keys.astype(str), format='%Y%m%d'),
+            'close': self.closes
+        })
+
+
+class BenchmarkStore:
+    """基准指数日线序列的本地缓存
+
+    每个 (基准代码, 复权方式) 保存为缓存目录下的一个 .npz 文件，记录已覆盖的日期区间；
+    请求超出已覆盖区间时只下载缺失的部分并合并写回。进程内同时保留一份内存缓存。
+    当天及以后的日期不计入已覆盖区间，下次请求时重新获取。
+    """
+
+    def __init__(self, cache_dir: str = None):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'benchmark_cache')
+        self.cache_dir = cache_dir
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _cache_file(self, code: str, fq: str) -> str:
+        return os.path.join(self.cache_dir, f"{code}_{fq}.npz")
+
+    def _load(self, code: str, fq: str):
+        """读取缓存，返回 (day_keys, closes, covered_start, covered_end)"""
+        key = (code, fq)
+        if key in self._series:
+            return self._series[key]
+        entry = (np.zeros(0, dtype=np.int64), np.zeros(0), 0, 0)
+        path = self._cache_file(code, fq)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as cached:
+                    entry = (cached['day_keys'].astype(np.int64), cached['closes'].astype(np.float64),
+                             int(cached['covered'][0]), int(cached['covered'][1]))
+            except Exception as e:
+                print(f"读取基准缓存失败，将重新下载: {path}, {str(e)}")
+        self._series[key] = entry
+        return entry
+
+    def _save(self, code: str, fq: str, entry):
+        self._series[(code, fq)] = entry
+        day_keys, closes, covered_start, covered_end = entry
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._cache_file(code, fq)
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path, day_keys=day_keys, closes=closes,
+                     covered=np.array([covered_start, covered_end], dtype=np.int64))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"写入基准缓存失败: {str(e)}")
+
+    @staticmethod
+    def _fetch(code: str, start: int, end: int, fq: str):
+        """从数据接口获取 [start, end] 区间的日线收盘价"""
+        from xtquant import xtdata
+        start_str, end_str = str(start), str(end)
+        xtdata.download_history_data(stock_code=code, period="1d", start_time=start_str, end_time=end_str)
+        data = xtdata.get_market_data_ex(
+            field_list=['time', 'close'],
+            stock_list=[code],
+            period='1d',
+            start_time=start_str,
+            end_time=end_str,
+            dividend_type=fq
+        )
+        df = data.get(code) if data else None
+        if df is None or len(df) == 0 or 'time' not in df.columns or 'close' not in df.columns:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        day_keys = TimeTable(df['time'].values).day_keys
+        return day_keys, df['close'].to_numpy(dtype=np.float64)
+
+    def get(self, code: str, start, end, fq: str = 'none') -> BenchmarkSeries:
+        """获取 [start, end] 区间的基准收盘价序列，缺失的部分自动下载并写入缓存
+
+        Args:
+            code: 基准代码，如 "000300.SH"
+            start: 开始日期（YYYYMMDD 字符串或整数）
+            end: 结束日期（YYYYMMDD 字符串或整数）
+            fq: 复权方式
+
+        Returns:
+            BenchmarkSeries: 区间内的收盘价序列
+        """
+        start, end = int(str(start)[:8]), int(str(end)[:8])
+        today = datetime.date.today()
+        today_key = today.year * 10000 + today.month * 100 + today.day
+        with self._lock:
+            day_keys, closes, covered_start, covered_end = self._load(code, fq)
+            missing = []
+            if covered_start == 0:
+                missing.append((start, end))
+            else:
+                if start < covered_start:
+                    missing.append((start, covered_start))
+                if end > covered_end:
+                    missing.append((covered_end, end))
+            if missing:
+                parts_keys, parts_closes = [day_keys], [closes]
+                cover_start, cover_end = covered_start, covered_end
+                for lo, hi in missing:
+                    keys, values = self._fetch(code, lo, hi, fq)
+                    # 未取到数据（未连接、数据未就绪或下载出错）的区间不计入已覆盖区间，下次重新获取
+                    if len(keys) == 0:
+                        continue
+                    parts_keys.append(keys)
+                    parts_closes.append(values)
+                    cover_start = lo if cover_start == 0 else min(cover_start, lo)
+                    cover_end = max(cover_end, hi)
+                if len(parts_keys) > 1:
+                    all_keys = np.concatenate(parts_keys)
+                    all_closes = np.concatenate(parts_closes)
+                    # 去重时以后获取的数据为准
+                    rev_keys, rev_idx = np.unique(all_keys[::-1], return_index=True)
+                    day_keys = rev_keys
+                    closes = all_closes[::-1][rev_idx]
+                    # 当天及以后的数据可能不完整，不计入已覆盖区间
+                    cover_end = max(covered_end, min(cover_end, today_key - 1))
+                    self._save(code, fq, (day_keys, closes, cover_start, max(cover_start, cover_end)))
+        return BenchmarkSeries(code, day_keys, closes).slice(start, end)
+
+
+_benchmark_store = None
+
+
+def get_benchmark_store() -> BenchmarkStore:
+    """获取全局共享的基准数据缓存"""
+    global _benchmark_store
+    if _benchmark_store is None:
+        _benchmark_store = BenchmarkStore()
+    return _benchmark_store
+
+
+class HistoryCache:
+    """历史K线的进程内缓存（供 khHistory 在回测中按时间点切片）
+
+    每个 (股票代码, 周期, 复权方式) 只从 xtdata 读取一次完整序列，时间转换为北京时间的
+    datetime64 并排序；之后每次查询只需在时间数组上 searchsorted 后切片。
+    缓存按条目数和数组占用的总字节数做 LRU 淘汰（分钟线完整序列较大，单按条目数无法限制内存），
+    下载新数据后需调用 invalidate/clear 使对应条目失效。
+    """
+
+    def __init__(self, max_entries: int = 512, max_mb: float = HISTORY_CACHE_MAX_MB):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """缓存条目中数组占用的总字节数"""
+        return self._bytes
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def invalidate(self, codes: Sequence[str], period: str, dividend_type: str):
+        """使指定股票在该周期、复权方式下的缓存失效"""
+        with self._lock:
+            for code in codes:
+                self._discard((code, period, dividend_type))
+
+    def _store(self, key, entry):
+        """写入条目并移到LRU末尾（调用方持有锁）"""
+        self._discard(key)
+        size = 0
+        if entry[1] is not None:
+            size = entry[0].nbytes + sum(values.nbytes for values in entry[1].values())
+        self._entries[key] = entry
+        self._sizes[key] = size
+        self._bytes += size
+
+    def _discard(self, key):
+        """移除条目（调用方持有锁）"""
+        if self._entries.pop(key, None) is not None:
+            self._bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        """按LRU淘汰超出条目数或字节上限的条目，至少保留最近使用的一条（调用方持有锁）"""
+        while len(self._entries) > self.max_entries or \
+                (self._bytes > self.max_bytes and len(self._entries) > 1):
+            self._discard(next(iter(self._entries)))
+
+    def series_lengths(self, codes: Sequence[str], period: str, dividend_type: str) -> Dict[str, int]:
+        """各股票已缓存完整序列的长度，未缓存或无数据时为0"""
+        with self._lock:
+            lengths = {}
+            for code in codes:
+                entry = self._entries.get((code, period, dividend_type))
+                lengths[code] = 0 if entry is None or entry[0] is None else len(entry[0])
+            return lengths
+
+    def _load(self, codes: List[str], fields: List[str], period: str, dividend_type: str):
+        """一次性读取多只股票的完整序列，返回 {code: (times, {field: values})}"""
+        from xtquant import xtdata
+        data = xtdata.get_market_data_ex(
+            field_list=['time'] + fields,
+            stock_list=codes,
+            period=period,
+            start_time='',
+            end_time='',
+            count=-1,
+            dividend_type=dividend_type,
+            fill_data=True
+        )
+        loaded = {}
+        for code in codes:
+            df = data.get(code) if data else None
+            if df is None or df.empty or 'time' not in df.columns:
+                loaded[code] = None
+                continue
+            # 与 khHistory 原实现一致：毫秒时间戳按 UTC+8 转为北京时间
+            times = (df['time'].to_numpy(dtype=np.float64).astype(np.int64).astype('datetime64[ms]')
+                     + np.timedelta64(8, 'h')).astype('datetime64[ns]')
+            order = None
+            if len(times) > 1 and np.any(times[1:] < times[:-1]):
+                order = np.argsort(times, kind='stable')
+                times = times[order]
+            values = {}
+            for field in fields:
+                if field in df.columns:
+                    column = df[field].to_numpy()
+                    values[field] = column[order] if order is not None else column
+            loaded[code] = (times, values)
+        return loaded
+
+    def _entries_for(self, codes: List[str], fields: List[str], period: str, dividend_type: str):
+        """取出（必要时加载）各股票的缓存条目，缺少的字段补充读取"""
+        result = {}
+        missing = {}
+        with self._lock:
+            for code in codes:
+                key = (code, period, dividend_type)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    if entry[1] is None:
+                        result[code] = None
+                        continue
+                    lacking = [f for f in fields if f not in entry[1] and f not in entry[2]]
+                    if not lacking:
+                        result[code] = entry
+                        continue
+                    missing[code] = lacking
+                else:
+                    missing[code] = list(fields)
+
+        # 需要相同字段的股票合并为一次查询
+        reload, stale = {}, {}
+        for lacking, group_codes in self._group_by_fields(missing).items():
+            loaded = self._load(group_codes, list(lacking), period, dividend_type)
+            with self._lock:
+                for code in group_codes:
+                    key = (code, period, dividend_type)
+                    item = loaded.get(code)
+                    old = self._entries.get(key)
+                    has_old = old is not None and old[1] is not None
+                    if item is None:
+                        # 读取失败时保留已有条目
+                        entry = old if has_old else (None, None, frozenset())
+                    elif has_old and len(old[0]) == len(item[0]):
+                        # 补充字段：合并到已有条目，记录数据源中不存在的字段避免重复查询
+                        merged = dict(old[1])
+                        merged.update(item[1])
+                        absent = old[2] | frozenset(f for f in lacking if f not in item[1])
+                        entry = (old[0], merged, absent)
+                    elif has_old:
+                        # 缓存后序列长度已变化：已有字段与新字段一起重新读取
+                        reload[code] = list(old[1]) + [f for f in lacking if f not in old[1]]
+                        stale[code] = old
+                        continue
+                    else:
+                        absent = frozenset(f for f in lacking if f not in item[1])
+                        entry = (item[0], item[1], absent)
+                    self._store(key, entry)
+                    result[code] = entry
+
+        for reload_fields, group_codes in self._group_by_fields(reload).items():
+            loaded = self._load(group_codes, list(reload_fields), period, dividend_type)
+            with self._lock:
+                for code in group_codes:
+                    key = (code, period, dividend_type)
+                    item = loaded.get(code)
+                    if item is None:
+                        entry = stale[code]
+                    else:
+                        entry = (item[0], item[1], frozenset(f for f in reload_fields if f not in item[1]))
+                    self._store(key, entry)
+                    result[code] = entry
+
+        with self._lock:
+            self._evict()
+        return result
+
+    @staticmethod
+    def _group_by_fields(code_fields: Dict[str, List[str]]) -> Dict[tuple, List[str]]:
+        groups = {}
+        for code, fields in code_fields.items():
+            groups.setdefault(tuple(fields), []).append(code)
+        return groups
+
+    def history(self, codes: List[str], fields: List[str], bar_count: int, period: str,
+                dividend_type: str, current_datetime: datetime.datetime,
+                skip_paused: bool = False) -> Dict[str, pd.DataFrame]:
+        """返回 current_datetime 之前（不含）最近 bar_count 条记录
+
+        Args:
+            codes: 股票代码列表
+            fields: 数据字段列表
+            bar_count: K线数量
+            period: 数据周期
+            dividend_type: xtdata 复权方式
+            current_datetime: 当前时间（北京时间）
+            skip_paused: 是否跳过成交量为0的停牌数据
+
+        Returns:
+            dict: {股票代码: DataFrame}，包含 time 列和指定字段，无数据时为空 DataFrame
+        """
+        if period in ('1m', '5m'):
+            # 分钟数据按精确时间截止
+            cutoff = np.datetime64(current_datetime, 'ns')
+        else:
+            # 日线等按日期截止，不包含当前日期
+            cutoff = np.datetime64(current_datetime.date(), 'ns')
+
+        entries = self._entries_for(codes, fields, period, dividend_type)
+        result = {}
+        for code in codes:
+            entry = entries.get(code)
+            if entry is None or entry[1] is None:
+                print(f"警告: 股票 {code} 无数据")
+                result[code] = pd.DataFrame()
+                continue
+            times, values, _ = entry
+            end = int(np.searchsorted(times, cutoff, side='left'))
+            present = [f for f in fields if f in values]
+            if skip_paused and 'volume' in present:
+                index = np.flatnonzero(values['volume'][:end] > 0)[-bar_count:]
+                columns = {'time': times[index]}
+                for field in present:
+                    columns[field] = values[field][index]
+            else:
+                start = max(0, end - bar_count)
+                columns = {'time': times[start:end]}
+                for field in present:
+                    columns[field] = values[field][start:end]
+            result[code] = pd.DataFrame(columns, copy=False)
+        return result
+
+
+_history_cache = None
+
+
+def get_history_cache() -> HistoryCache:
+    """获取全局共享的历史K线缓存"""
+    global _history_cache
+    if _history_cache is None:
+        _history_cache = HistoryCache()
+    return _history_cache
@@ -7,18 +7,27 @@ from typing import Dict, List, Optional, Union, Any
 import logging
 import sys
 import shutil
+import gzip
+import heapq
+import pickle
 from types import SimpleNamespace
 import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from xtquant import xtdata
 from xtquant.xttrader import XtQuantTrader, XtQuantTraderCallback
 from xtquant.xttype import StockAccount
 from xtquant import xtconstant
 
-from khTrade import KhTradeManager
+from khTrade import KhTradeManager, PositionLedger
 from khRisk import KhRiskManager
-from khQTTools import KhQuTools, determine_pool_type, format_price, round_price, get_price_decimals, check_t0_support, get_t0_details
+from khQTTools import KhQuTools, determine_pool_type, format_price, round_price, get_price_decimals, check_t0_support, get_t0_details, generate_signal
 from khConfig import KhConfig
+from khData import (MarketPanel, SparseMarketPanel, BarContext, TimeTable, DailyClosePanel, seconds_of_day,
+                    near_seconds_mask, frame_times, merge_timelines, get_benchmark_store,
+                    get_history_cache, compute_indicators, RollingHistory, trim_frames,
+                    PANEL_MEMORY_LIMIT_MB)
 
 import numpy as np
 import pandas as pd
@@ -40,6 +49,14 @@ try:
 except ImportError:
     pass
 
+# 回测记录分块优先写成Parquet（需要pyarrow），未安装时写成CSV
+try:
+    import pyarrow  # noqa: F401
+
+    parquet_available = True
+except ImportError:
+    parquet_available = False
+
 # 简单的GUI类，用于处理日志记录
 class DummySignal:
     """虚拟信号类，用于非GUI模式下替代PyQt5信号"""
@@ -261,6 +278,20 @@ class TriggerBase:
         """
         return False
         
+    def compute_mask(self, times, time_table=None):
+        """一次性计算整条时间轴上哪些时间点触发策略
+        
+        默认实现逐个调用 should_trigger；内置触发器按当日秒数/日期向量化计算。
+        
+        Args:
+            times: 回测时间轴（all_times）
+            time_table: 与 times 对应的 TimeTable（可选）
+            
+        Returns:
+            np.ndarray: bool 数组，True 表示该时间点触发策略
+        """
+        return np.array([bool(self.should_trigger(t, None)) for t in times], dtype=bool)
+        
     def get_data_period(self):
         """获取数据周期，用于数据加载
         
@@ -286,6 +317,10 @@ class TickTrigger(TriggerBase):
         # Tick触发方式下，每个Tick都触发
         return True
         
+    def compute_mask(self, times, time_table=None):
+        """每个时间点都触发"""
+        return np.ones(len(times), dtype=bool)
+        
     def get_data_period(self):
         """获取数据周期
         
@@ -354,6 +389,25 @@ class KLineTrigger(TriggerBase):
             
         return False
         
+    def compute_mask(self, times, time_table=None):
+        """按当日秒数/日期向量化计算触发点
+        
+        1m: 秒数为0；5m: 分钟为5的倍数且秒数为0；1d: 每个日期的第一个时间点。
+        """
+        if time_table is None:
+            time_table = TimeTable(times)
+        if time_table.seconds is None:
+            return super().compute_mask(times, time_table)
+        if self.period == "1m":
+            return time_table.sod % 60 == 0
+        elif self.period == "5m":
+            return time_table.sod % 300 == 0
+        elif self.period == "1d":
+            mask = np.ones(len(times), dtype=bool)
+            mask[1:] = time_table.day_index[1:] != time_table.day_index[:-1]
+            return mask
+        return np.zeros(len(times), dtype=bool)
+        
     def get_data_period(self):
         """获取数据周期
         
@@ -418,6 +472,14 @@ class CustomTimeTrigger(TriggerBase):
                 
         return False
         
+    def compute_mask(self, times, time_table=None):
+        """按当日秒数与触发时间点的距离向量化计算触发点（误差小于5秒）"""
+        if time_table is None:
+            time_table = TimeTable(times)
+        if time_table.seconds is None:
+            return super().compute_mask(times, time_table)
+        return near_seconds_mask(time_table.sod, self.trigger_seconds, 4)
+        
     def get_data_period(self):
         """获取数据周期
         
@@ -677,6 +739,301 @@ class MyTraderCallback(XtQuantTraderCallback):
             self.gui.log_message(f"处理资金变动时出错: {str(e)}", "ERROR")
             '''
 
+class StrategySlot:
+    """组合回测中的一个策略：独立的策略模块、子账户（交易管理器）和回测记录"""
+
+    def __init__(self, name: str, file: str, module, weight: float, stock_list: Optional[List[str]] = None):
+        self.name = name  # 策略名称（结果子目录名）
+        self.file = file  # 策略文件路径
+        self.module = module  # 策略模块
+        self.weight = weight  # 资金占比（各策略之和为1）
+        self.stock_list = stock_list  # 策略自己的股票池（None表示使用配置中的股票池）
+        self.trade_mgr = None  # 子账户交易管理器
+        self.backtest_records = None  # 子账户回测记录
+        self.vector_signal_matrix = None  # 向量化策略的信号矩阵
+        self.trigger_mask = None  # 该策略需要调用的时间点
+        self.rolling_history = None  # 滚动历史
+        self.day_data = None  # 当日最后一个时间点的数据（盘后回调用）
+
+
+def parse_strategy_specs(strategy_file) -> List[Dict[str, Any]]:
+    """整理策略参数为 [{"name", "file", "weight", "stock_list"}]
+
+    支持以下写法：
+        - 单个策略文件路径
+        - {策略文件路径: 资金权重}
+        - 列表，元素为策略文件路径、(路径, 权重) 或 {"file": 路径, "weight": 权重, "name": 名称, "stock_list": [...]}
+
+    未指定的权重按1计，所有权重按总和归一化为初始资金的分配比例。
+    """
+    if isinstance(strategy_file, (str, os.PathLike)):
+        items = [strategy_file]
+    elif isinstance(strategy_file, Mapping):
+        items = [{"file": path, "weight": weight} for path, weight in strategy_file.items()]
+    else:
+        items = list(strategy_file)
+    if not items:
+        raise ValueError("至少需要一个策略文件")
+
+    specs = []
+    for item in items:
+        if isinstance(item, (str, os.PathLike)):
+            spec = {"file": item}
+        elif isinstance(item, (tuple, list)):
+            spec = {"file": item[0], "weight": item[1]}
+        else:
+            spec = dict(item)
+            if "file" not in spec and "path" in spec:
+                spec["file"] = spec.pop("path")
+        spec["file"] = os.fspath(spec["file"])
+        spec["weight"] = float(spec.get("weight", 1.0))
+        if spec["weight"] <= 0:
+            raise ValueError(f"策略 {spec['file']} 的资金权重必须为正数: {spec['weight']}")
+        specs.append(spec)
+
+    total_weight = sum(spec["weight"] for spec in specs)
+    used_names = set()
+    for spec in specs:
+        spec["weight"] = spec["weight"] / total_weight
+        name = spec.get("name") or os.path.splitext(os.path.basename(spec["file"]))[0]
+        unique, n = name, 2
+        while unique in used_names:
+            unique, n = f"{name}_{n}", n + 1
+        used_names.add(unique)
+        spec["name"] = unique
+        spec.setdefault("stock_list", None)
+    return specs
+
+
+def _merge_positions(snapshots: List[Dict]) -> Dict:
+    """合并多个子账户的持仓快照（同一股票的数量、市值、盈亏相加）"""
+    merged = {}
+    for snapshot in snapshots:
+        for code, pos in snapshot.items():
+            if code not in merged:
+                merged[code] = dict(pos)
+                continue
+            total = merged[code]
+            cost = total['avg_price'] * total['volume'] + pos['avg_price'] * pos['volume']
+            total['volume'] += pos['volume']
+            total['market_value'] += pos['market_value']
+            total['profit'] += pos['profit']
+            total['price'] = pos['price']
+            total['avg_price'] = cost / total['volume'] if total['volume'] else 0
+            total['profit_ratio'] = total['profit'] / cost if cost > 0 else 0
+    return merged
+
+
+def summarize_daily_stats(daily_stats_df: pd.DataFrame, init_capital) -> Dict[str, Any]:
+    """根据每日统计计算回测汇总指标（summary.csv 的内容）
+
+    Args:
+        daily_stats_df: 每日统计数据
+        init_capital: 初始资金
+
+    Returns:
+        dict: init_capital, final_capital, total_return, annual_return, max_drawdown, trade_days
+    """
+    trade_days = len(daily_stats_df)
+    total_asset_series = pd.Series(dtype=float)
+    if 'total_asset' in daily_stats_df.columns:
+        total_asset_series = pd.to_numeric(daily_stats_df['total_asset'], errors='coerce').dropna()
+
+    final_capital = float(total_asset_series.iloc[-1]) if len(total_asset_series) > 0 else float(init_capital)
+    total_return = 0.0
+    annual_return = 0.0
+    max_drawdown = 0.0
+
+    if trade_days >= 2 and init_capital > 0 and len(total_asset_series) > 0:
+        total_return = (final_capital - init_capital) / init_capital * 100
+        total_return_decimal = (final_capital / init_capital) - 1
+        annual_return = (pow(1 + total_return_decimal, 250 / trade_days) - 1) * 100
+
+        cummax = total_asset_series.cummax()
+        drawdown = (cummax - total_asset_series) / cummax * 100
+        max_drawdown = float(drawdown.max()) if len(drawdown) > 0 else 0.0
+
+    return {
+        'init_capital': init_capital,
+        'final_capital': final_capital,
+        'total_return': total_return,
+        'annual_return': annual_return,
+        'max_drawdown': max_drawdown,
+        'trade_days': trade_days
+    }
+
+
+RECORD_CHUNK_SIZE = 5000  # 回测记录每个分块的行数
+RECORD_FLUSH_SECONDS = 30  # 回测记录最长的落盘间隔（秒），回测运行中也能读到较新的记录
+
+
+class RecordLog:
+    """按列缓存、分块写入磁盘的回测记录（交易记录、每日统计）
+
+    追加的记录先按列缓存，缓存达到 chunk_size 行或距上次写入超过 flush_seconds 秒时
+    写成目录下的一个分块文件（安装了pyarrow时为Parquet，否则为CSV），内存占用不随回测长度增长，
+    回测运行中也可以读取已写入的分块。持仓快照等嵌套值按 str() 保存，与导出的CSV内容一致；
+    最后一条记录另外保留原始对象，供计算日收益率、回撤等使用。
+    """
+
+    def __init__(self, chunk_size: int = RECORD_CHUNK_SIZE, flush_seconds: float = RECORD_FLUSH_SECONDS):
+        self.chunk_size = max(1, int(chunk_size))
+        self.flush_seconds = flush_seconds
+        self.path = None  # 分块文件目录，attach 之前只缓存在内存中
+        self.parts = []  # 已写入的分块文件名
+        self.columns = []  # 记录的全部列（按首次出现的顺序）
+        self.str_columns = set()  # 值为字符串的列，CSV分块读回时保持为字符串
+        self._buffer = {}  # 尚未写入的记录 {列名: 值列表}
+        self._buffered = 0
+        self._count = 0
+        self._last = None
+        self._last_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        # 记录大部分已写入磁盘，只支持直接读取最后一条；其他记录用 rows()/to_frame() 读取
+        if index in (-1, self._count - 1) and self._last is not None:
+            return self._last
+        if self._count == 0:
+            raise IndexError("回测记录为空")
+        raise TypeError("回测记录只支持读取最后一条记录（[-1]），其他记录请使用 rows() 或 to_frame()")
+
+    def __iter__(self):
+        return self.rows()
+
+    def append(self, row: Dict):
+        for key, value in row.items():
+            if key not in self._buffer:
+                if key not in self.columns:
+                    self.columns.append(key)
+                self._buffer[key] = [None] * self._buffered
+            if isinstance(value, (dict, list, tuple, set)):
+                value = str(value)
+            if isinstance(value, str):
+                self.str_columns.add(key)
+            self._buffer[key].append(value)
+        for values in self._buffer.values():
+            if len(values) == self._buffered:  # 本条记录缺少该列
+                values.append(None)
+        self._buffered += 1
+        self._count += 1
+        self._last = row
+
+        if self.path is not None and (
+                self._buffered >= self.chunk_size
+                or (self.flush_seconds and time.monotonic() - self._last_flush >= self.flush_seconds)):
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def attach(self, path: str):
+        """指定分块文件目录
+
+        从断点继续时目录不变，删除断点之后写入的分块；在已完成回测的基础上接续时，
+        将原有分块复制到新的目录。
+        """
+        path = os.path.abspath(path)
+        os.makedirs(path, exist_ok=True)
+        if self.path is not None and self.path != path:
+            for name in self.parts:
+                shutil.copy2(os.path.join(self.path, name), os.path.join(path, name))
+        for name in os.listdir(path):
+            if name.startswith("part-") and name not in self.parts:
+                os.remove(os.path.join(path, name))
+        self.path = path
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """将缓存的记录写成一个分块（先写临时文件再替换，读取方不会读到写了一半的分块）"""
+        if self.path is None or self._buffered == 0:
+            return
+        chunk = pd.DataFrame(self._buffer)
+        stem = os.path.join(self.path, f"part-{len(self.parts):05d}")
+        name = None
+        if parquet_available:
+            try:
+                chunk.to_parquet(f"{stem}.tmp", index=False)
+                name = f"{stem}.parquet"
+            except (ValueError, TypeError):
+                # 同一列混有不同类型等无法写成Parquet的分块改写为CSV
+                pass
+        if name is None:
+            chunk.to_csv(f"{stem}.tmp", index=False, encoding='utf-8')
+            name = f"{stem}.csv"
+        os.replace(f"{stem}.tmp", name)
+        self.parts.append(os.path.basename(name))
+        self._buffer = {key: [] for key in self._buffer}
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def frames(self):
+        """依次返回各分块（包括尚未写入的缓存）的 DataFrame"""
+        for name in self.parts:
+            file_path = os.path.join(self.path, name)
+            if name.endswith(".parquet"):
+                yield pd.read_parquet(file_path)
+            else:
+                yield pd.read_csv(file_path, dtype={column: str for column in self.str_columns},
+                                  float_precision='round_trip')
+        if self._buffered:
+            yield pd.DataFrame(self._buffer)
+
+    def rows(self):
+        """逐条返回记录（字典）"""
+        for frame in self.frames():
+            yield from frame.to_dict('records')
+
+    def to_frame(self) -> pd.DataFrame:
+        """读入全部记录"""
+        frames = list(self.frames())
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True, sort=False).reindex(columns=self.columns)
+
+    def to_csv(self, path: str, index: bool = False, encoding: str = 'utf-8-sig'):
+        """逐个分块导出为CSV文件，不需要一次读入全部记录"""
+        mode = 'w'
+        for frame in self.frames():
+            frame.reindex(columns=self.columns).to_csv(
+                path, index=index, encoding=encoding, mode=mode, header=(mode == 'w'))
+            mode = 'a'
+        if mode == 'w':
+            pd.DataFrame(columns=self.columns).to_csv(path, index=index, encoding=encoding)
+
+
+CHECKPOINT_VERSION = 2  # 断点文件格式版本
+
+
+def save_checkpoint(state: Dict, path: str):
+    """将断点状态以压缩的pickle格式写入文件（先写临时文件再替换，避免中途崩溃留下损坏的断点）"""
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=5) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> Dict:
+    """读取断点文件
+
+    Args:
+        path: 断点文件路径，或包含 checkpoint.pkl 的回测结果目录
+
+    Returns:
+        dict: 断点状态
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "checkpoint.pkl")
+    with gzip.open(path, "rb") as f:
+        state = pickle.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"不支持的断点文件版本: {state.get('version')}")
+    return state
+
+
 class KhQuantFramework:
     """量化交易框架主类"""
     
@@ -690,10 +1047,11 @@ class KhQuantFramework:
         allow_period_mismatch: bool = False,
     ):
         """初始化框架
-        
+
         Args:
             config_path: 配置文件路径
-            strategy_file: 策略文件路径
+            strategy_file: 策略文件路径；传入多个策略（见 parse_strategy_specs）时进行组合回测，
+                各策略按资金权重分得独立的子账户，共用一次数据加载和同一个回测循环
             trader_callback: 交易回调函数
         """
         print(f"[DEBUG] KhQuantFramework.__init__ 开始")
@@ -711,8 +1069,8 @@ class KhQuantFramework:
         self.risk_mgr = KhRiskManager(self.config)  # 风险管理器
         self.tools = KhQuTools()  # 工具类
         self.backtest_records = {}  # 回测记录
-        self.daily_price_cache = {}  # 日线价格缓存，用于存储所有股票的日线数据
-        self._cached_benchmark_close = {}  # 基准指数收盘价缓存
+        self.daily_close_panel = None  # 回测区间的日线收盘价矩阵（DailyClosePanel）
+        self.benchmark_series = None  # 基准指数日线序列（BenchmarkSeries）
         
         # T+0交易模式标识（默认关闭，在run()中根据股票池判断）
         self.t0_mode = False
@@ -731,7 +1089,12 @@ class KhQuantFramework:
         # 加载策略模块
         print(f"[DEBUG] 准备加载策略模块: {strategy_file}")
         try:
-            self.strategy_module = self.load_strategy(strategy_file)
+            self.strategy_slots = [
+                StrategySlot(spec["name"], spec["file"], self.load_strategy(spec["file"]),
+                             spec["weight"], spec["stock_list"])
+                for spec in parse_strategy_specs(strategy_file)
+            ]
+            self.strategy_module = self.strategy_slots[0].module
             print(f"[DEBUG] 策略模块加载成功")
         except Exception as e:
             print(f"[DEBUG] 策略模块加载失败: {str(e)}")
@@ -770,16 +1133,32 @@ class KhQuantFramework:
         # 交易回调
         self.callback = None
         
-        # 初始化交易管理器
+        # 初始化交易管理器（组合回测时每个策略一个子账户，第一个策略使用 self.trade_mgr）
         self.trade_mgr = KhTradeManager(self.config, self)
-        
+        for i, slot in enumerate(self.strategy_slots):
+            slot.trade_mgr = self.trade_mgr if i == 0 else KhTradeManager(self.config, self)
+
         # 清除可能存在的历史数据缓存，确保每次运行都是干净的状态
-        if hasattr(self, 'historical_data_ref'):
-            delattr(self, 'historical_data_ref')
-        if hasattr(self, 'time_field_cache'):
-            delattr(self, 'time_field_cache')
-        if hasattr(self, 'time_idx_cache'):
-            delattr(self, 'time_idx_cache')
+        self.market_panel = None
+        self.time_table = None
+        self._vector_signal_matrix = None  # 向量化策略（khVectorStrategy）的信号矩阵
+        self.preloaded_history = None  # 预加载的历史数据 {股票代码: DataFrame}，设置后回测不再请求数据接口
+        self.backtest_tag = None  # 回测结果目录名后缀（并行回测时区分同一秒生成的目录）
+        # 回撤止损阈值（百分比），回测中净值回撤达到该值时提前结束并保存已有结果
+        self.stop_drawdown = self.config.config_dict.get("backtest", {}).get("stop_drawdown")
+        self.stop_reason = None  # 提前结束回测的原因
+        self._peak_asset = None  # 回测期间的最高总资产（计算回撤用）
+        # 断点续跑：每隔 checkpoint_days 个交易日将回测状态保存到结果目录的 checkpoint.pkl
+        self.checkpoint_days = self.config.config_dict.get("backtest", {}).get("checkpoint_days")
+        self.resume_from = None  # 断点文件路径，设置后从该断点继续回测
+        self.extend_from = None  # 已完成回测的最终状态文件（final_state.pkl），设置后在其基础上接续新的日期
+        self.save_final_state = True  # 回测正常结束后保存最终状态到结果目录的 final_state.pkl
+        # 交易记录和每日统计按块写入结果目录的 records/ 下（每块行数、最长写入间隔秒数）
+        self.record_chunk_size = self.config.config_dict.get("backtest", {}).get("record_chunk_size", RECORD_CHUNK_SIZE)
+        self.record_flush_seconds = self.config.config_dict.get("backtest", {}).get("record_flush_seconds", RECORD_FLUSH_SECONDS)
+        self.portfolio_daily_stats = None  # 组合回测时合计账户的每日统计
+        # 稠密行情面板的内存上限（MB），超过时改为逐股票存储的面板
+        self.panel_memory_limit_mb = self.config.config_dict.get("backtest", {}).get("panel_memory_limit_mb", PANEL_MEMORY_LIMIT_MB)
         
         # 初始化风控管理器
         self.risk_mgr = KhRiskManager(self.config)
@@ -852,7 +1231,8 @@ class KhQuantFramework:
         self._init_virtual_account()
         # 在回测模式下也设置回调
         if self.trader_callback:
-            self.trade_mgr.callback = self.trader_callback
+            for slot in self.strategy_slots:
+                slot.trade_mgr.callback = self.trader_callback
         
     def _init_virtual_account(self):
         """初始化虚拟账户"""
@@ -875,28 +1255,33 @@ class KhQuantFramework:
         # 从回测配置中获取初始资金
         init_capital = self.config.config_dict["backtest"]["init_capital"]
         
-        # 初始化资产字典
-        self.trade_mgr.assets = {
-            "account_type": xtconstant.SECURITY_ACCOUNT,
-            "account_id": self.config.account_id,
-            "cash": init_capital,
-            "frozen_cash": 0.0,
-            "market_value": 0.0,
-            "total_asset": init_capital,
-            "benchmark": self.benchmark
-        }
-        
-        # 初始化持仓字典
-        self.trade_mgr.positions = {}  # 初始持仓为空
-        
-        # 初始化委托字典
-        self.trade_mgr.orders = {}  # 初始委托为空
-        
-        # 初始化成交字典
-        self.trade_mgr.trades = {}  # 初始成交为空
-        
+        # 按资金权重初始化各策略的子账户（单策略时即为整个账户）
+        for slot in self.strategy_slots:
+            slot_capital = init_capital * slot.weight if len(self.strategy_slots) > 1 else init_capital
+
+            # 初始化资产字典
+            slot.trade_mgr.assets = {
+                "account_type": xtconstant.SECURITY_ACCOUNT,
+                "account_id": self.config.account_id,
+                "cash": slot_capital,
+                "frozen_cash": 0.0,
+                "market_value": 0.0,
+                "total_asset": slot_capital,
+                "benchmark": self.benchmark
+            }
+
+            # 初始化持仓字典
+            slot.trade_mgr.positions = PositionLedger()  # 初始持仓为空
+
+            # 初始化委托字典
+            slot.trade_mgr.orders = {}  # 初始委托为空
+
+            # 初始化成交字典
+            slot.trade_mgr.trades = {}  # 初始成交为空
+
         print(f"虚拟账户初始化完成: {self.config.account_id}")
-        print(f"初始资产: {self.trade_mgr.assets}")
+        for slot in self.strategy_slots:
+            print(f"初始资产[{slot.name}]: {slot.trade_mgr.assets}")
         print(f"基准合约: {self.benchmark}")
         
     def create_callback(self) -> XtQuantTraderCallback:
@@ -1130,8 +1515,8 @@ class KhQuantFramework:
                 self.trader_callback.gui.log_message(f"交易接口初始化耗时: {init_time:.2f}秒", "INFO")
             
             # 初始化缓存
-            self.daily_price_cache = {}
-            self._cached_benchmark_close = {}
+            self.daily_close_panel = None
+            self.benchmark_series = None
             
             init_data_enabled = self.init_data_enabled
             if init_data_enabled is None:
@@ -1164,7 +1549,8 @@ class KhQuantFramework:
             # 判断股票池类型并设置价格精度
             self.pool_type, self.price_decimals = determine_pool_type(stock_codes)
             # 将精度设置传递给交易管理器
-            self.trade_mgr.set_price_decimals(self.price_decimals)
+            for slot in self.strategy_slots:
+                slot.trade_mgr.set_price_decimals(self.price_decimals)
             # 将精度设置传递给回调对象（用于日志格式化）
             if self.trader_callback and hasattr(self.trader_callback, 'set_price_decimals'):
                 self.trader_callback.set_price_decimals(self.price_decimals)
@@ -1185,7 +1571,8 @@ class KhQuantFramework:
             t0_support_type, self.t0_mode = check_t0_support(stock_codes)
             
             # 将T+0模式设置传递给交易管理器
-            self.trade_mgr.set_t0_mode(self.t0_mode)
+            for slot in self.strategy_slots:
+                slot.trade_mgr.set_t0_mode(self.t0_mode)
             
             if t0_support_type == 'all_t0':
                 # 全部支持T+0，进入T+0模式
@@ -1224,23 +1611,27 @@ class KhQuantFramework:
                 if self.trader_callback:
                     self.trader_callback.gui.log_message("交易模式: T+1（标准A股交易规则）", "INFO")
             
-            # 准备初始化数据结构，包含时间、账户、持仓、股票池等信息
-            init_data = {
-                "__current_time__": {
-                    "timestamp": int(time.time()),
-                    "datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                    "time": datetime.datetime.now().strftime("%H:%M:%S")
-                },
-                "__account__": self.trade_mgr.assets,
-                "__positions__": self.trade_mgr.positions,
-                "__stock_list__": stock_codes,
-                "__framework__": self
-            }
-            
-            # 调用策略初始化函数，并传递完整数据结构
+            # 调用各策略的初始化函数，并传递包含时间、账户、持仓、股票池等信息的完整数据结构
             strategy_init_start = time.time()
-            self.strategy_module.init(stock_codes, init_data)
+            for slot in self.strategy_slots:
+                slot_stocks = self._slot_stock_list(slot, stock_codes)
+                if slot.stock_list is not None and len(slot_stocks) < len(slot.stock_list) and self.trader_callback:
+                    self.trader_callback.gui.log_message(
+                        f"策略 {slot.name} 的股票池中有 {len(slot.stock_list) - len(slot_stocks)} 只股票不在回测股票池中，已忽略",
+                        "WARNING")
+                init_data = {
+                    "__current_time__": {
+                        "timestamp": int(time.time()),
+                        "datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "date": datetime.datetime.now().strftime("%Y-%m-%d"),
+                        "time": datetime.datetime.now().strftime("%H:%M:%S")
+                    },
+                    "__account__": slot.trade_mgr.assets,
+                    "__positions__": slot.trade_mgr.positions,
+                    "__stock_list__": slot_stocks,
+                    "__framework__": self
+                }
+                slot.module.init(slot_stocks, init_data)
             strategy_init_time = time.time() - strategy_init_start
             
             if self.trader_callback:
@@ -1332,6 +1723,20 @@ class KhQuantFramework:
         
         return stock_codes
     
+    def _slot_stock_list(self, slot: StrategySlot, stock_codes: List[str]) -> List[str]:
+        """策略使用的股票池：未单独指定时为回测股票池，否则为其中属于回测股票池的部分"""
+        if slot.stock_list is None:
+            return stock_codes
+        available = set(stock_codes)
+        return [code for code in slot.stock_list if code in available]
+
+    def _use_slot(self, slot: StrategySlot):
+        """切换到指定策略：策略模块、交易管理器、回测记录等指向该策略的子账户"""
+        self.strategy_module = slot.module
+        self.trade_mgr = slot.trade_mgr
+        self.backtest_records = slot.backtest_records
+        self._vector_signal_matrix = slot.vector_signal_matrix
+
     def _check_period_consistency(self):
         """检查数据周期和触发周期的一致性"""
         try:
@@ -1432,19 +1837,35 @@ class KhQuantFramework:
             # 检查数据周期和触发周期的一致性
             self._check_period_consistency()
             
-            # 初始化回测记录字典
-            self.backtest_records = {
-                'trades': [],  # 交易记录
-                'daily_stats': [],  # 每日统计数据
-                'benchmark_data': [],  # 基准指数数据
-                'start_time': self.config.backtest_start,
-                'end_time': self.config.backtest_end,
-                'init_capital': self.config.config_dict["backtest"]["init_capital"]
-            }
+            # 初始化回测记录字典（每个策略一份，组合回测时记录各自子账户的数据）
+            init_capital = self.config.config_dict["backtest"]["init_capital"]
+            slots = self.strategy_slots
+            multi_strategy = len(slots) > 1
+            for slot in slots:
+                slot.backtest_records = {
+                    'trades': self._new_record_log(),  # 交易记录
+                    'daily_stats': self._new_record_log(),  # 每日统计数据
+                    'benchmark_data': [],  # 基准指数数据
+                    'start_time': self.config.backtest_start,
+                    'end_time': self.config.backtest_end,
+                    'init_capital': init_capital * slot.weight if multi_strategy else init_capital
+                }
+                slot.vector_signal_matrix = None
+                slot.rolling_history = None
+                slot.day_data = None
+            self.portfolio_daily_stats = self._new_record_log() if multi_strategy else None
+            self._use_slot(slots[0])
             
             # 缓存日志开关状态，避免在回测循环中重复检查
             self._cache_should_log()
 
+            # 重置提前结束状态
+            self.stop_reason = None
+            self._peak_asset = None
+
+            # 清空khHistory的历史K线缓存，确保本次回测读取到最新下载的数据
+            get_history_cache().clear()
+
             if self.trader_callback:
                 self.trader_callback.gui.log_message("开始回测...", "INFO")
 
@@ -1457,10 +1878,20 @@ class KhQuantFramework:
             # 获取策略文件名（不含路径和扩展名）
             strategy_file = self.config.config_dict.get("strategy_file", "")
             strategy_name = os.path.splitext(os.path.basename(strategy_file))[0] if strategy_file else "unknown"
+            if multi_strategy:
+                strategy_name = "+".join(slot.name for slot in slots)
             
             self._log(f"策略文件路径: {strategy_file}", "INFO")
             self._log(f"解析的策略名称: {strategy_name}", "INFO")
 
+            # 从断点继续、或在已完成回测的基础上接续新日期时，先读取保存的状态
+            resume_state = load_checkpoint(self.resume_from) if self.resume_from else None
+            extend_state = load_checkpoint(self.extend_from) if self.extend_from else None
+            if extend_state is not None and not extend_state.get('final'):
+                raise ValueError(f"{self.extend_from} 不是已完成回测保存的最终状态，无法接续")
+            # 回测记录的起始日期（接续回测时为原回测的起始日期）
+            period_start = (resume_state or extend_state or {}).get('records_start', self.config.backtest_start)
+
             # 生成回测时间戳
             backtest_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             
@@ -1470,14 +1901,23 @@ class KhQuantFramework:
                 # 直接使用ASCII安全的策略名
                 import hashlib
                 strategy_hash = hashlib.md5(strategy_name.encode('utf-8')).hexdigest()[:8]
-                backtest_dir_name = f"strategy_{strategy_hash}_{self.config.backtest_start}_{self.config.backtest_end}_{backtest_timestamp}"
+                backtest_dir_name = f"strategy_{strategy_hash}_{period_start}_{self.config.backtest_end}_{backtest_timestamp}"
+                if self.backtest_tag:
+                    backtest_dir_name = f"{backtest_dir_name}_{self.backtest_tag}"
                 self._log(f"使用安全目录名: {backtest_dir_name} (原始策略名: {strategy_name})", "INFO")
             except Exception as e:
                 self._log(f"生成目录名时出错: {str(e)}", "ERROR")
                 # 使用默认名称
-                backtest_dir_name = f"unknown_{self.config.backtest_start}_{self.config.backtest_end}_{backtest_timestamp}"
+                backtest_dir_name = f"unknown_{period_start}_{self.config.backtest_end}_{backtest_timestamp}"
                 self._log(f"使用默认目录名: {backtest_dir_name}", "INFO")
 
+            # 从断点继续时沿用原回测的结果目录
+            if resume_state is not None:
+                backtest_dir_name = resume_state['backtest_dir_name']
+                self._log(f"从断点继续回测: {self.resume_from}，结果目录: {backtest_dir_name}", "INFO")
+            elif extend_state is not None:
+                self._log(f"接续回测: {self.extend_from}，从 {self.config.backtest_start} 继续", "INFO")
+
             # 确保backtest_results基础目录存在
             base_results_dir = "backtest_results"
             self._log(f"检查基础目录是否存在: {base_results_dir}", "INFO")
@@ -1566,180 +2006,44 @@ class KhQuantFramework:
                 self._log(error_msg, "ERROR")
                 raise Exception(error_msg)
 
-            benchmark_file = os.path.join(backtest_dir, "benchmark.csv")
-
-            if not os.path.exists(benchmark_file):
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"开始获取基准指数 {benchmark_code} 的每日数据", "INFO")
-                
+            # 获取基准指数日线序列（本地缓存，仅下载缺失的区间）
+            self.benchmark_series = None
+            if benchmark_code:
                 try:
-                    # 先下载数据
-                    xtdata.download_history_data(
-                        stock_code=benchmark_code,
-                        period="1d",
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
-                    benchmark_data = xtdata.get_market_data_ex(
-                        field_list=['time', 'close'],
-                        stock_list=[benchmark_code],
-                        period='1d',
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
+                    self.benchmark_series = get_benchmark_store().get(
+                        benchmark_code, period_start, self.config.backtest_end)
                     if self.trader_callback:
                         self.trader_callback.gui.log_message(
-                            f"获取到的数据结构: {benchmark_data.keys()}", 
-                            "INFO"
-                        )
-                        if benchmark_code in benchmark_data:
-                            self.trader_callback.gui.log_message(
-                                f"数据字段: {benchmark_data[benchmark_code].columns.tolist()}", 
-                                "INFO"
-                            )
-                    
-                    if benchmark_data and benchmark_code in benchmark_data:
-                        df = benchmark_data[benchmark_code]
-                        
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(
-                                f"基准数据形状: {df.shape}",
-                                "INFO"
-                            )
-                        
-                        # 确保有时间和收盘价列
-                        if 'time' in df.columns and 'close' in df.columns:
-                            # 转换时间戳为日期
-                            try:
-                                df['date'] = pd.to_datetime(df['time'], unit='ms')
-                            except:
-                                # 如果转换失败，尝试其他单位
-                                try:
-                                    df['date'] = pd.to_datetime(df['time'], unit='s')
-                                except:
-                                    try:
-                                        df['date'] = pd.to_datetime(df['time'])
-                                    except Exception as e:
-                                        if self.trader_callback:
-                                            self.trader_callback.gui.log_message(f"时间戳转换失败: {str(e)}", "ERROR")
-                            
-                            # 选择需要的列并保存
-                            if 'date' in df.columns:
-                                result_df = df[['date', 'close']].copy()
-                                
-                                if len(result_df) > 0:
-                                    # 确保保存目录存在
-                                    os.makedirs(os.path.dirname(benchmark_file), exist_ok=True)
-                                    result_df.to_csv(benchmark_file, index=False)
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(
-                                            f"基准指数数据已保存到 {benchmark_file}, 共 {len(result_df)} 条记录",
-                                            "INFO"
-                                        )
-                                        
-                                    # 预先缓存所有基准指数数据，提高性能
-                                    for _, row in result_df.iterrows():
-                                        date_str = row['date'].strftime('%Y%m%d')
-                                        cache_key = f"benchmark_{date_str}_{benchmark_code}"
-                                        self._cached_benchmark_close[cache_key] = row['close']
-                                    
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(
-                                            f"已预缓存 {len(self._cached_benchmark_close)} 条基准指数数据",
-                                            "INFO"
-                                        )
+                            f"已加载基准指数 {benchmark_code} 的每日数据，共 {len(self.benchmark_series)} 条记录", "INFO")
                 except Exception as e:
                     if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"获取和保存基准指数数据失败: {str(e)}", "ERROR")
-                    logging.error(f"获取和保存基准指数数据失败: {str(e)}", exc_info=True)
+                        self.trader_callback.gui.log_message(f"获取基准指数数据失败: {str(e)}", "ERROR")
+                    logging.error(f"获取基准指数数据失败: {str(e)}", exc_info=True)
+            
+            # 确定需要加载的字段和数据周期
+            field_list, period = self._history_request()
             
-            # 获取数据周期
-            data_period = self.trigger.get_data_period()
+            # 按批次加载所有股票的历史数据
+            data = self._load_history_data(stock_codes, field_list, period)
             
-            # 一次性加载所有股票的历史数据
             historical_data = {}
             for code in stock_codes:
                 if not self.is_running:
                     break
                     
-                # 确保field_list中包含time和close字段
-                field_list = self.config.config_dict["data"]["fields"]
-                if "time" not in field_list:
-                    field_list = ["time"] + field_list
-                if "close" not in field_list:
-                    field_list.append("close")
-                    
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"加载{code}的历史数据...", "INFO")
-                    
-                # 根据触发器的数据周期加载对应的历史数据
-                period = data_period
-                
-                # 对于自定义定时触发，需要特殊处理数据周期
-                if isinstance(self.trigger, CustomTimeTrigger):
-                    # 检查所有触发时间点是否都是整分钟（秒数为0）
-                    all_whole_minutes = True
-                    for seconds in self.trigger.trigger_seconds:
-                        # 计算秒数部分
-                        seconds_part = seconds % 60
-                        if seconds_part != 0:
-                            all_whole_minutes = False
-                            break
-                    
-                    if all_whole_minutes:
-                        # 如果所有时间点都是整分钟，使用1m数据
-                        period = "1m"
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"所有自定义时间点都是整分钟，使用1分钟K线数据", "INFO")
-                    else:
-                        # 如果有不是整分钟的时间点，使用tick数据
-                        period = "tick"
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"存在非整分钟的自定义时间点，使用tick数据", "INFO")
-                
-                # 对于其他触发器类型，直接使用触发器返回的数据周期
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"使用{period}数据周期进行回测", "INFO")
-                
-                data = xtdata.get_market_data_ex(
-                    field_list=field_list,
-                    stock_list=[code],
-                    period=period,
-                    start_time=self.config.backtest_start,
-                    end_time=self.config.backtest_end,
-                    dividend_type=self.config.config_dict["data"]["dividend_type"],
-                    fill_data=True
-                )
                 if data and code in data:
                     # 判断是否为自定义时间触发
                     if isinstance(self.trigger, CustomTimeTrigger):
                         # 对于自定义时间触发，只保留触发时间点附近的数据
                         df = data[code]
                         if 'time' in df.columns:
-                            # 获取所有时间戳
-                            all_timestamps = df['time'].values
-                            # 转换为秒级时间戳进行比较
-                            filtered_rows = []
-                            
-                            for ts in all_timestamps:
-                                # 转换时间戳为秒级
-                                ts_seconds = float(ts) / 1000 if float(ts) > 1e10 else float(ts)
-                                ts_dt = datetime.datetime.fromtimestamp(ts_seconds)
-                                
-                                # 计算当前时间点的秒数（从午夜开始）
-                                current_seconds = ts_dt.hour * 3600 + ts_dt.minute * 60 + ts_dt.second
-                                
-                                # 检查是否接近任一触发时间点（允许1秒误差）
-                                for trigger_second in self.trigger.trigger_seconds:
-                                    if abs(current_seconds - trigger_second) <= 1:
-                                        filtered_rows.append(ts)
-                                        break
+                            # 向量化计算当日秒数，并与触发时间点匹配（允许1秒误差）
+                            time_values = df['time'].values
+                            near_mask = near_seconds_mask(seconds_of_day(time_values), self.trigger.trigger_seconds, 1)
                             
                             # 只保留触发时间点附近的数据
-                            if filtered_rows:
-                                filtered_df = df[df['time'].isin(filtered_rows)]
+                            if near_mask.any():
+                                filtered_df = df[near_mask]
                                 historical_data[code] = filtered_df
                                 if self.trader_callback:
                                     self.trader_callback.gui.log_message(
@@ -1773,6 +2077,7 @@ class KhQuantFramework:
                     
             # 获取所有时间点
             all_times = []
+            time_positions = None
 
             # 对于自定义时间触发，使用不同的方式获取时间点
             if isinstance(self.trigger, CustomTimeTrigger):
@@ -1780,15 +2085,8 @@ class KhQuantFramework:
                 start_date = datetime.datetime.strptime(self.config.backtest_start, "%Y%m%d").date()
                 end_date = datetime.datetime.strptime(self.config.backtest_end, "%Y%m%d").date()
                 
-                # 获取交易日历（使用KhQuTools的真实交易日判断）
-                current_date = start_date
-                trading_days = []
-                while current_date <= end_date:
-                    # 使用KhQuTools判断是否为真实交易日（排除节假日）
-                    date_str = current_date.strftime("%Y-%m-%d")
-                    if self.tools.is_trade_day(date_str):
-                        trading_days.append(current_date)
-                    current_date += datetime.timedelta(days=1)
+                # 从交易日历获取真实交易日（排除周末和节假日）
+                trading_days = self.tools.calendar.range(start_date, end_date)
                 
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(f"回测期间共有{len(trading_days)}个交易日", "INFO")
@@ -1808,55 +2106,31 @@ class KhQuantFramework:
                         timestamp = int(dt.timestamp())
                         all_times.append(timestamp)
                 
+                all_times = np.array(sorted(set(all_times)), dtype=np.int64)
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(f"自定义时间触发模式：生成了{len(all_times)}个时间点", "INFO")
             else:
-                # 非自定义时间触发模式，使用原来的方式获取时间点
+                # 非自定义时间触发模式，合并各股票数据的时间轴
+                code_times = {}
                 for code, df in historical_data.items():
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"处理{code}的数据...", "INFO")
-                    
-                    # 检查数据结构
-                    if isinstance(df, pd.DataFrame):
-                        # DataFrame结构处理
-                        if 'time' in df.columns:
-                            times = df['time'].values
-                            all_times.extend(times)
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"从{code}的DataFrame中提取了{len(times)}个时间点", "INFO")
-                        else:
-                            # 尝试使用其他可能的时间字段
-                            time_field = None
-                            for field in ['timestamp', 'date', 'datetime']:
-                                if field in df.columns:
-                                    time_field = field
-                                    break
-                            
-                            if time_field is None:
-                                # 如果没有找到任何时间字段，尝试使用索引
-                                if isinstance(df.index, pd.DatetimeIndex):
-                                    times = df.index.astype(np.int64) // 10**9  # 转换为秒级时间戳
-                                    all_times.extend(times)
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(f"从{code}的DataFrame索引中提取了{len(times)}个时间点", "INFO")
-                                else:
-                                    # 如果没有找到任何时间字段，跳过这个股票
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(f"错误: {code}的数据中没有找到任何时间字段，跳过该股票", "ERROR")
-                                    continue
-                            else:
-                                times = df[time_field].values
-                                all_times.extend(times)
-                                if self.trader_callback:
-                                    self.trader_callback.gui.log_message(f"从{code}的DataFrame的{time_field}字段中提取了{len(times)}个时间点", "INFO")
-                    else:
+                    if not isinstance(df, pd.DataFrame):
                         # 处理其他可能的数据结构
                         if self.trader_callback:
                             self.trader_callback.gui.log_message(f"警告: {code}的数据不是DataFrame格式，跳过该股票", "WARNING")
                         continue
-            
-            # 去重并排序
-            all_times = sorted(list(set(all_times)))
+                    times = frame_times(df)
+                    if times is None:
+                        # 如果没有找到任何时间字段，跳过这个股票
+                        if self.trader_callback:
+                            self.trader_callback.gui.log_message(f"错误: {code}的数据中没有找到任何时间字段，跳过该股票", "ERROR")
+                        continue
+                    code_times[code] = times
+                
+                # 拼接后去重排序（全程为int64数组），并记录每只股票在时间轴上的位置
+                all_times, time_positions = merge_timelines(code_times)
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(
+                        f"合并{len(code_times)}只股票的{sum(len(t) for t in code_times.values())}条数据时间点", "INFO")
             
             if len(all_times) == 0:
                 if self.trader_callback:
@@ -1889,42 +2163,59 @@ class KhQuantFramework:
                 # 注意：不要在子线程中调用 QApplication.processEvents()
                 # 这会导致GUI线程阻塞和潜在的线程安全问题
             
-            # 预先构建数据缓存（避免在循环中重复构建）
-            if not hasattr(self, 'historical_data_ref'):
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message("首次运行，正在构建数据缓存...", "INFO")
-                
-                # 创建包含原始DataFrame引用的字典
-                self.historical_data_ref = {}
-                
-                # 创建时间字段到索引的映射，用于快速查找
-                self.time_field_cache = {}
-                self.time_idx_cache = {}
-                
-                # 创建基于当前时间点的数据引用
-                for code, df in historical_data.items():
-                    # 找到时间字段
-                    for field in ['time', 'timestamp', 'date', 'datetime']:
-                        if field in df.columns:
-                            self.time_field_cache[code] = field
-                            # 保存原始DataFrame引用
-                            self.historical_data_ref[code] = df
-                            
-                            # 预先创建时间值到索引的映射（只计算一次）
-                            time_values = df[field].values
-                            time_idx_map = {}
-                            for i, tv in enumerate(time_values):
-                                time_idx_map[tv] = i
-                            self.time_idx_cache[code] = time_idx_map
-                            break
-                
+            # 预先构建 时间×股票×字段 的行情面板，循环内按整数位置索引
+            if self.trader_callback:
+                self.trader_callback.gui.log_message("正在构建行情数据面板...", "INFO")
+            panel_start_time = time.time()
+            self.market_panel = MarketPanel.from_frames(historical_data, all_times, positions=time_positions,
+                                                        memory_limit_mb=self.panel_memory_limit_mb)
+            self.time_table = TimeTable(all_times)
+            time_table = self.time_table
+            panel = self.market_panel
+            panel_codes = list(enumerate(panel.codes))
+            # 面板已持有全部数据，释放逐股票的DataFrame
+            historical_data = None
+            data = None
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"行情数据面板构建完成: {len(panel.times)}个时间点 × {len(panel.codes)}只股票 × {len(panel.fields)}个字段"
+                    f"{'（超过内存上限，按股票存储）' if isinstance(panel, SparseMarketPanel) else ''}，"
+                    f"耗时 {time.time() - panel_start_time:.2f}秒", "INFO")
+
+            # 预计算策略声明的指标（KH_INDICATORS），作为面板字段按时间点提供给策略
+            indicator_specs = {}
+            for slot in slots:
+                for name, spec in (getattr(slot.module, 'KH_INDICATORS', None) or {}).items():
+                    if name in indicator_specs and indicator_specs[name] != spec:
+                        raise ValueError(f"多个策略声明了同名但定义不同的指标: {name}")
+                    indicator_specs[name] = spec
+            if indicator_specs:
+                indicator_start_time = time.time()
+                try:
+                    panel.add_fields(compute_indicators(panel, indicator_specs))
+                except Exception as e:
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(f"预计算指标失败: {str(e)}", "ERROR")
+                    raise
                 if self.trader_callback:
-                    self.trader_callback.gui.log_message("数据缓存构建完成", "INFO")
+                    self.trader_callback.gui.log_message(
+                        f"已预计算 {len(indicator_specs)} 个指标: {', '.join(indicator_specs)}，"
+                        f"耗时 {time.time() - indicator_start_time:.2f}秒", "INFO")
+
+            # 策略声明 KH_HISTORY_BARS 时启用滚动历史，策略中通过 data["__history__"] 读取最近N根K线
+            for slot in slots:
+                history_bars = getattr(slot.module, 'KH_HISTORY_BARS', None)
+                if history_bars:
+                    slot.rolling_history = RollingHistory(panel, history_bars,
+                                                          getattr(slot.module, 'KH_HISTORY_FIELDS', None))
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(
+                            f"已启用滚动历史: 每只股票保留最近 {slot.rolling_history.size} 根K线，"
+                            f"字段: {', '.join(slot.rolling_history.fields)}", "INFO")
             
             # 按时间顺序模拟
             current_date = None
             day_start_time = None
-            day_data = {}
             
             # 获取盘前盘后回调设置
             pre_market_enabled = self.config.config_dict.get("market_callback", {}).get("pre_market_enabled", False)
@@ -1944,23 +2235,49 @@ class KhQuantFramework:
                     self.trader_callback.gui.log_message("警告: 策略模块未实现 khPostMarket 方法，盘后回调将不会执行", "WARNING")
             
             # 获取唯一的交易日列表
-            trading_days = set()
-            for time_point in all_times:
-                try:
-                    timestamp = int(time_point)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                    trading_days.add(dt.strftime("%Y-%m-%d"))
-                except:
-                    pass
-            
-            trading_days = sorted(list(trading_days))
+            trading_days = list(time_table.dates)
+            # 按日期一次性判断是否为交易日，循环内按下标取用
+            if time_table.seconds is not None:
+                trade_day_flags = self.tools.calendar.is_trade_days(time_table.unique_day_keys)
+            else:
+                trade_day_flags = None
             if self.trader_callback:
                 self.trader_callback.gui.log_message(f"回测期间共有 {len(trading_days)} 个交易日", "INFO")
             
+            # 预先计算触发掩码，只遍历触发的时间点以及每日首尾时间点（盘前/盘后回调需要）
+            trigger_mask = np.asarray(self.trigger.compute_mask(all_times, time_table), dtype=bool)
+            
+            # 向量化策略：一次性生成整个回测区间的信号矩阵，只在有信号的触发时间点撮合
+            for slot in slots:
+                slot.trigger_mask = trigger_mask
+                if hasattr(slot.module, 'khVectorStrategy'):
+                    vector_start_time = time.time()
+                    self._use_slot(slot)
+                    slot.vector_signal_matrix = self._build_vector_signals(panel)
+                    slot.trigger_mask = trigger_mask & (slot.vector_signal_matrix != 0).any(axis=1)
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(
+                            f"向量化策略信号计算完成，{int(slot.trigger_mask.sum())} 个触发时间点有信号，"
+                            f"耗时 {time.time() - vector_start_time:.2f}秒", "INFO")
+            self._use_slot(slots[0])
+            # 任一策略需要调用的时间点
+            trigger_mask = np.logical_or.reduce([slot.trigger_mask for slot in slots])
+            slot_stock_lists = [self._slot_stock_list(slot, stock_codes) for slot in slots]
+            if time_table.seconds is not None:
+                visit_indices = np.flatnonzero(trigger_mask | time_table.is_day_start | time_table.is_day_end)
+            else:
+                visit_indices = np.arange(total_times)
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"触发器命中 {int(trigger_mask.sum())} 个时间点，实际遍历 {len(visit_indices)}/{total_times} 个时间点", "INFO")
+            
+            # 按实际遍历的时间点数量计算进度
+            total_times = len(visit_indices)
+            if total_times > 100:
+                progress_increment = max(1, int(total_times / 100))
+            else:
+                progress_increment = 1
+            
             # 初始化时间统计变量
             time_stats = {
                 "构造数据": 0,
@@ -1977,12 +2294,70 @@ class KhQuantFramework:
                 "总时间": 0
             }
             
-            for current_time in all_times:
+            # 待记录的每日统计（在日末时间点处理完后、下一时间点开始前记录）
+            pending_daily_stats = None
+            last_visit_idx = None  # 上一个遍历的时间点（断点中用于恢复当日数据）
+            
+            # 断点文件及保存间隔
+            checkpoint_path = os.path.join(backtest_dir, "checkpoint.pkl")
+            checkpoint_days = int(self.checkpoint_days or 0)
+            days_since_checkpoint = 0
+            keep_checkpoint = False  # 手动停止时保留断点，正常结束后删除
+            interrupted = False  # 回测是否被中止或提前结束
+            
+            # 从断点恢复账户、记录和策略状态，跳过断点之前的时间点
+            if resume_state is not None:
+                resume_idx = self._restore_checkpoint(resume_state, all_times, stock_codes, slot_stock_lists)
+                current_date = resume_state['current_date']
+                day_start_time = resume_state['day_start_time']
+                processed_times = resume_state['processed_times']
+                last_visit_idx = resume_state['last_visit_idx']
+                visit_indices = visit_indices[visit_indices >= resume_idx]
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(
+                        f"已恢复断点状态: 从 {resume_state['current_date']} 之后继续，"
+                        f"已记录 {len(self.backtest_records['daily_stats'])} 个交易日", "INFO")
+            elif extend_state is not None:
+                # 原回测最后一天的盘后回调已执行，新区间从下一交易日的盘前开始
+                self._restore_extension(extend_state, stock_codes, slot_stock_lists)
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(
+                        f"已恢复原回测截至 {extend_state['last_date']} 的最终状态，"
+                        f"已记录 {len(self.backtest_records['daily_stats'])} 个交易日", "INFO")
+
+            # 回测记录在运行中按块写入结果目录
+            self._attach_record_logs(backtest_dir)
+            
+            for time_idx in visit_indices.tolist():
+                current_time = all_times[time_idx]
                 loop_start_time = time.time()
                 
+                # 记录上一个交易日的每日统计（可能触发回撤止损）
+                if pending_daily_stats is not None:
+                    record_start = time.time()
+                    self._record_slots_daily_stats(*pending_daily_stats)
+                    pending_daily_stats = None
+                    time_stats["记录结果"] += time.time() - record_start
+                    
+                    # 定期保存断点（状态为前一交易日收盘后、本时间点处理前）
+                    days_since_checkpoint += 1
+                    if checkpoint_days > 0 and days_since_checkpoint >= checkpoint_days and self.is_running:
+                        self._save_checkpoint(checkpoint_path, self._checkpoint_state(
+                            backtest_dir_name, all_times, time_idx, last_visit_idx,
+                            current_date, day_start_time, processed_times, stock_codes))
+                        days_since_checkpoint = 0
+                
                 if not self.is_running:
                     if self.trader_callback:
-                        self.trader_callback.gui.log_message("回测被中止", "WARNING")
+                        self.trader_callback.gui.log_message(
+                            f"回测提前结束: {self.stop_reason}" if self.stop_reason else "回测被中止", "WARNING")
+                    # 手动停止时保存断点，之后可从此处继续
+                    if checkpoint_days > 0 and self.stop_reason is None:
+                        self._save_checkpoint(checkpoint_path, self._checkpoint_state(
+                            backtest_dir_name, all_times, time_idx, last_visit_idx,
+                            current_date, day_start_time, processed_times, stock_codes))
+                        keep_checkpoint = True
+                    interrupted = True
                     break
                     
                 processed_times += 1
@@ -2003,78 +2378,26 @@ class KhQuantFramework:
                     if self._should_log():
                         self.trader_callback.gui.log_message(f"回测进度: {progress:.2f}%", "INFO")
                 
-                # 进一步优化的构造数据代码
-                data_start_time = time.time()
-                
-                # 创建包含__current_time__的字典结构
-                try:
-                    timestamp = int(current_time)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                        
-                    time_info = {
-                        "timestamp": timestamp,
-                        "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date": dt.strftime("%Y-%m-%d"),
-                        "time": dt.strftime("%H:%M:%S"),
-                        "raw_time": current_time
-                    }
-                except Exception as e:
-                    # 如果转换失败，使用原始时间戳
-                    time_info = {
-                        "timestamp": current_time,
-                        "datetime": str(current_time),
-                        "date": str(current_time),
-                        "time": str(current_time),
-                        "raw_time": current_time
-                    }
-                
-                # 创建当前时间点的数据视图
-                current_data = {"__current_time__": time_info}
-                
-                # 直接添加数据引用，而不是转换为字典
-                for code in self.historical_data_ref:
-                    if code in self.time_field_cache and code in self.time_idx_cache:
-                        time_field = self.time_field_cache[code]
-                        time_idx_map = self.time_idx_cache[code]
-                        df = self.historical_data_ref[code]
-                        
-                        # 尝试直接匹配当前时间
-                        if current_time in time_idx_map:
-                            idx = time_idx_map[current_time]
-                            # 直接存储行引用，而不是转换为字典
-                            current_data[code] = df.iloc[idx]
-                        else:
-                            # 尝试处理精度不一致问题
-                            matched = False
-                            idx = -1
-                            
-                            if isinstance(current_time, (int, float)):
-                                # 处理毫秒/秒的转换
-                                if current_time > 1e10:  # 毫秒级
-                                    sec_time = current_time // 1000
-                                    if sec_time in time_idx_map:
-                                        idx = time_idx_map[sec_time]
-                                        matched = True
-                                else:  # 秒级
-                                    ms_time = current_time * 1000
-                                    if ms_time in time_idx_map:
-                                        idx = time_idx_map[ms_time]
-                                        matched = True
-                            
-                            if matched:
-                                # 直接存储行引用
-                                current_data[code] = df.iloc[idx]
-                            else:
-                                # 没有匹配的数据，存储空Series
-                                current_data[code] = pd.Series({})
-                    else:
-                        # 没有时间字段的情况
-                        current_data[code] = pd.Series({})
+                # 构造时间信息（整条时间轴已预先计算，按下标取用）
+                time_info_start = time.time()
+                time_info = time_table.info(time_idx)
+                time_stats["构造时间信息"] += time.time() - time_info_start
                 
+                # 为每个策略创建当前时间点的数据上下文（股票数据为面板的行视图，按需读取）
+                data_start_time = time.time()
+                slot_data = []
+                for slot, slot_stocks in zip(slots, slot_stock_lists):
+                    if slot.rolling_history is not None:
+                        slot.rolling_history.advance(time_idx)
+                    slot_data.append(BarContext(
+                        panel, time_idx, time_info,
+                        account=slot.trade_mgr.assets,
+                        positions=slot.trade_mgr.positions,
+                        stock_list=slot_stocks,
+                        framework=self,
+                        history=slot.rolling_history
+                    ))
+                current_data = slot_data[0]
                 time_stats["构造数据"] += time.time() - data_start_time
                 
                 # 添加日志，显示第一个股票的数据示例（仅在需要输出日志时执行）
@@ -2099,194 +2422,114 @@ class KhQuantFramework:
                         if sample_str:
                             self.trader_callback.gui.log_message(f"部分字段值: {sample_str[:-2]}", "INFO")
                 
-                # 构造时间信息
-                time_info_start = time.time()
-                try:
-                    timestamp = int(current_time)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                        
-                    time_info = {
-                        "timestamp": timestamp,
-                        "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date": dt.strftime("%Y-%m-%d"),
-                        "time": dt.strftime("%H:%M:%S"),
-                        "raw_time": current_time
-                    }
-                except Exception as e:
-                    # 如果转换失败，使用原始时间戳
-                    time_info = {
-                        "timestamp": current_time,
-                        "datetime": str(current_time),
-                        "date": str(current_time),
-                        "time": str(current_time),
-                        "raw_time": current_time
-                    }
-                
-                # 添加当前时间信息到数据中
-                # 添加时间信息到数据中
-                current_data["__current_time__"] = time_info
-                time_stats["构造时间信息"] += time.time() - time_info_start
-                
-                # 添加账户和持仓信息到数据字典
-                account_data = {
-                    "__account__": self.trade_mgr.assets
-                }
-                # 添加持仓信息
-                positions_data = {
-                    "__positions__": self.trade_mgr.positions
-                }
-                # 添加股票池信息
-                stock_list_data = {
-                    "__stock_list__": stock_codes
-                }
-                # 合并所有信息
-                current_data.update(account_data)
-                current_data.update(positions_data)
-                current_data.update(stock_list_data)
-                
                 # 检查是否是新的一天
                 new_day_start = time.time()
                 if current_date != time_info["date"]:
-                    # 如果有前一天的数据，执行盘后回调
-                    post_market_start = time.time()
-                    if current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
-                        # 执行盘后回调
-                        try:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘后回调 - 日期: {current_date}", "INFO")
-                            
-                            # 设置时间信息为盘后时间
-                            post_time_info = time_info.copy()
-                            post_time_info["time"] = post_market_time
-                            post_time_info["datetime"] = f"{current_date} {post_market_time}"
-                            
-                            # 使用最后一个时间点的数据或创建一个完整的数据结构
-                            post_data = day_data.copy() if day_data else {}
-                            post_data["__current_time__"] = post_time_info
-                            
-                            # 添加账户和持仓信息到数据字典
-                            post_data["__account__"] = self.trade_mgr.assets
-                            post_data["__positions__"] = self.trade_mgr.positions
-                            post_data["__stock_list__"] = stock_codes
-                            
-                            # 添加框架实例到数据字典
-                            post_data["__framework__"] = self
-                            
+                    for slot, slot_current_data in zip(slots, slot_data):
+                        self._use_slot(slot)
+                        # 如果有前一天的数据，执行盘后回调
+                        post_market_start = time.time()
+                        if current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
                             # 执行盘后回调
-                            post_signals = self.strategy_module.khPostMarket(post_data)
-                            
-                            # 处理盘后回调产生的信号
-                            if post_signals:
-                                for signal in post_signals:
-                                    if 'price' in signal:
-                                        signal['price'] = round(float(signal['price']), self.price_decimals)
-                                    signal['timestamp'] = time_info["timestamp"]
+                            try:
+                                if self.trader_callback:
+                                    self.trader_callback.gui.log_message(f"执行盘后回调 - 日期: {current_date}", "INFO")
                                 
-                                # 发送交易指令
-                                self.trade_mgr.process_signals(post_signals)
-                        except Exception as e:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘后回调时出错: {str(e)}", "ERROR")
-                    time_stats["盘后回调"] += time.time() - post_market_start
+                                # 设置时间信息为盘后时间
+                                post_time_info = time_info.copy()
+                                post_time_info["time"] = post_market_time
+                                post_time_info["datetime"] = f"{current_date} {post_market_time}"
+                                
+                                # 使用前一交易日最后一个时间点的数据，时间替换为盘后时间
+                                post_data = slot.day_data.replace(time_info=post_time_info)
+                                
+                                # 执行盘后回调
+                                post_signals = self.strategy_module.khPostMarket(post_data)
+                                
+                                # 处理盘后回调产生的信号
+                                if post_signals:
+                                    for signal in post_signals:
+                                        if 'price' in signal:
+                                            signal['price'] = round(float(signal['price']), self.price_decimals)
+                                        signal['timestamp'] = time_info["timestamp"]
+                                    
+                                    # 发送交易指令
+                                    self.trade_mgr.process_signals(post_signals)
+                            except Exception as e:
+                                if self.trader_callback:
+                                    self.trader_callback.gui.log_message(f"执行盘后回调时出错: {str(e)}", "ERROR")
+                        time_stats["盘后回调"] += time.time() - post_market_start
+
+                        slot.day_data = slot_current_data
+
+                        # T+1模式下，新交易日将 can_use_volume 更新为 volume
+                        if not self.trade_mgr.t0_mode:
+                            self.trade_mgr.positions.settle()
+
+                        # 检查是否需要执行盘前回调
+                        pre_market_start = time.time()
+                        if pre_market_enabled and hasattr(self.strategy_module, 'khPreMarket'):
+                            # 执行盘前回调
+                            try:
+                                if self.trader_callback:
+                                    self.trader_callback.gui.log_message(f"执行盘前回调 - 日期: {time_info['date']}", "INFO")
+                                
+                                # 设置时间信息为盘前时间
+                                pre_time_info = time_info.copy()
+                                pre_time_info["time"] = pre_market_time
+                                pre_time_info["datetime"] = f"{time_info['date']} {pre_market_time}"
+                                
+                                # 使用当前时间点的数据，时间替换为盘前时间
+                                pre_data = slot_current_data.replace(time_info=pre_time_info)
+                                
+                                # 执行盘前回调
+                                pre_signals = self.strategy_module.khPreMarket(pre_data)
+                                
+                                # 处理盘前回调产生的信号
+                                if pre_signals:
+                                    for signal in pre_signals:
+                                        if 'price' in signal:
+                                            signal['price'] = round(float(signal['price']), self.price_decimals)
+                                        signal['timestamp'] = time_info["timestamp"]
+                                    
+                                    # 发送交易指令
+                                    self.trade_mgr.process_signals(pre_signals)
+                            except Exception as e:
+                                if self.trader_callback:
+                                    self.trader_callback.gui.log_message(f"执行盘前回调时出错: {str(e)}", "ERROR")
+                        time_stats["盘前回调"] += time.time() - pre_market_start
 
                     # 更新当前日期
                     current_date = time_info["date"]
                     day_start_time = time_info["timestamp"]
-                    day_data = current_data
-
-                    # T+1模式下，新交易日将 can_use_volume 更新为 volume
-                    if not self.trade_mgr.t0_mode:
-                        for code, pos in self.trade_mgr.positions.items():
-                            if pos.get("volume", 0) > 0:
-                                pos["can_use_volume"] = pos["volume"]
-
-                    # 检查是否需要执行盘前回调
-                    pre_market_start = time.time()
-                    if pre_market_enabled and hasattr(self.strategy_module, 'khPreMarket'):
-                        # 执行盘前回调
-                        try:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘前回调 - 日期: {current_date}", "INFO")
-                            
-                            # 设置时间信息为盘前时间
-                            pre_time_info = time_info.copy()
-                            pre_time_info["time"] = pre_market_time
-                            pre_time_info["datetime"] = f"{current_date} {pre_market_time}"
-                            
-                            # 使用当前时间点的数据或创建一个完整的数据结构
-                            pre_data = current_data.copy()
-                            pre_data["__current_time__"] = pre_time_info
-                            
-                            # 确保包含账户和持仓信息
-                            pre_data["__account__"] = self.trade_mgr.assets
-                            pre_data["__positions__"] = self.trade_mgr.positions
-                            pre_data["__stock_list__"] = stock_codes
-                            
-                            # 添加框架实例到数据字典
-                            pre_data["__framework__"] = self
-                            
-                            # 执行盘前回调
-                            pre_signals = self.strategy_module.khPreMarket(pre_data)
-                            
-                            # 处理盘前回调产生的信号
-                            if pre_signals:
-                                for signal in pre_signals:
-                                    if 'price' in signal:
-                                        signal['price'] = round(float(signal['price']), self.price_decimals)
-                                    signal['timestamp'] = time_info["timestamp"]
-                                
-                                # 发送交易指令
-                                self.trade_mgr.process_signals(pre_signals)
-                        except Exception as e:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘前回调时出错: {str(e)}", "ERROR")
-                    time_stats["盘前回调"] += time.time() - pre_market_start
                 else:
                     # 更新当天的数据
-                    day_data = current_data
+                    for slot, slot_current_data in zip(slots, slot_data):
+                        slot.day_data = slot_current_data
+                last_visit_idx = time_idx
                 time_stats["检查新日期"] += time.time() - new_day_start
                 
+                # 当日最后一个时间点：处理完该时间点后记录每日统计
+                if time_table.is_day_end is not None and time_table.is_day_end[time_idx] and \
+                        (trade_day_flags is None or trade_day_flags[time_table.day_index[time_idx]]):
+                    pending_daily_stats = (time_table.to_date(time_idx), time_table.to_datetime(time_idx), current_data)
+                
                 # 使用触发器判断是否应该触发策略
                 trigger_start = time.time()
-                if not self.trigger.should_trigger(current_time, current_data):
+                if not trigger_mask[time_idx]:
                     time_stats["触发器检查"] += time.time() - trigger_start
                     continue
                 time_stats["触发器检查"] += time.time() - trigger_start
                 
-                # 风控检查
-                risk_start = time.time()
-                if not self.risk_mgr.check_risk(current_data):
-                    time_stats["风控检查"] += time.time() - risk_start
-                    continue
-                time_stats["风控检查"] += time.time() - risk_start
-                
                 # 检查是否是交易日
-                current_date_str = current_data.get("__current_time__", {}).get("date", "")
-                if current_date_str and not self.tools.is_trade_day(current_date_str):
+                if trade_day_flags is not None and not trade_day_flags[time_table.day_index[time_idx]]:
                     # 如果不是交易日，跳过策略调用
                     continue
                 
-                # 添加框架实例到数据字典
-                current_data["__framework__"] = self
-                
-                # 检查股票数据是否为空
-                stock_data_empty = True
-                empty_stocks = []
-                for key, value in current_data.items():
-                    # 跳过框架内部字段
-                    if key.startswith("__"):
-                        continue
-                    # 检查股票数据是否为空
-                    if isinstance(value, pd.Series) and not value.empty:
-                        stock_data_empty = False
-                    elif isinstance(value, pd.Series) and value.empty:
-                        empty_stocks.append(key)
-                    elif not value:  # 处理其他空值情况
-                        empty_stocks.append(key)
+                # 检查股票数据是否为空（直接读取面板的有效性标记）
+                valid_row = panel.valid[time_idx]
+                stock_data_empty = not valid_row.any()
+                empty_stocks = [code for code_idx, code in panel_codes if not valid_row[code_idx]]
                 
                 # 如果所有股票数据都为空，记录错误并跳过策略调用
                 if stock_data_empty:
@@ -2314,36 +2557,56 @@ class KhQuantFramework:
                             "WARNING"
                         )
                 
-                # 调用策略处理
-                strategy_start = time.time()
-                signals = self.strategy_module.khHandlebar(current_data)
-                time_stats["策略处理"] += time.time() - strategy_start
-                
-                # 处理信号中的价格精度
-                signal_process_start = time.time()
-                if signals:
-                    for signal in signals:
-                        if 'price' in signal:
-                            # 使用动态精度
-                            signal['price'] = round(float(signal['price']), self.price_decimals)
-                        # 添加当前回测时间戳
-                        signal['timestamp'] = current_time
-                time_stats["处理信号"] += time.time() - signal_process_start
-                
-                # 发送交易指令
-                trade_start = time.time()
-                if signals:
-                    self.trade_mgr.process_signals(signals)
-                time_stats["交易指令"] += time.time() - trade_start
-                
-                # 记录结果
-                record_start = time.time()
-                self.record_results(current_time, current_data, signals)
-                time_stats["记录结果"] += time.time() - record_start
+                for slot, slot_current_data in zip(slots, slot_data):
+                    if not slot.trigger_mask[time_idx]:
+                        continue
+                    self._use_slot(slot)
+                    
+                    # 风控检查
+                    risk_start = time.time()
+                    if not self.risk_mgr.check_risk(slot_current_data):
+                        time_stats["风控检查"] += time.time() - risk_start
+                        continue
+                    time_stats["风控检查"] += time.time() - risk_start
+                    
+                    # 调用策略处理
+                    strategy_start = time.time()
+                    if self._vector_signal_matrix is not None:
+                        signals = self._vector_signals(slot_current_data, time_idx)
+                    else:
+                        signals = self.strategy_module.khHandlebar(slot_current_data)
+                    time_stats["策略处理"] += time.time() - strategy_start
+                    
+                    # 处理信号中的价格精度
+                    signal_process_start = time.time()
+                    if signals:
+                        for signal in signals:
+                            if 'price' in signal:
+                                # 使用动态精度
+                                signal['price'] = round(float(signal['price']), self.price_decimals)
+                            # 添加当前回测时间戳
+                            signal['timestamp'] = current_time
+                    time_stats["处理信号"] += time.time() - signal_process_start
+                    
+                    # 发送交易指令
+                    trade_start = time.time()
+                    fills = self.trade_mgr.process_signals(signals) if signals else []
+                    time_stats["交易指令"] += time.time() - trade_start
+                    
+                    # 记录结果
+                    record_start = time.time()
+                    self.record_results(current_time, slot_current_data, fills)
+                    time_stats["记录结果"] += time.time() - record_start
                 
                 # 累计总时间
                 time_stats["总时间"] += time.time() - loop_start_time
             
+
+            # 记录最后一个交易日的每日统计
+            if pending_daily_stats is not None:
+                self._record_slots_daily_stats(*pending_daily_stats)
+                pending_daily_stats = None
+            
             # 输出时间统计信息
             if self.trader_callback:
                 total_time = time_stats["总时间"]
@@ -2356,7 +2619,11 @@ class KhQuantFramework:
                     self.trader_callback.gui.log_message(f"总执行时间: {total_time:.4f}秒", "INFO")
             
             # 处理最后一天的盘后回调
-            if current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
+            for slot, slot_stocks in zip(slots, slot_stock_lists):
+                self._use_slot(slot)
+                day_data = slot.day_data
+                if current_date is None or not post_market_enabled or not hasattr(self.strategy_module, 'khPostMarket'):
+                    continue
                 try:
                     if self.trader_callback:
                         self.trader_callback.gui.log_message(f"执行最后一天的盘后回调 - 日期: {current_date}", "INFO")
@@ -2375,17 +2642,8 @@ class KhQuantFramework:
                         time_info["time"] = post_market_time
                         time_info["datetime"] = f"{current_date} {post_market_time}"
                     
-                    # 使用最后一个时间点的数据或创建一个完整的数据结构
-                    post_data = day_data.copy() if day_data else {}
-                    post_data["__current_time__"] = time_info
-                    
-                    # 添加账户和持仓信息到数据字典
-                    post_data["__account__"] = self.trade_mgr.assets
-                    post_data["__positions__"] = self.trade_mgr.positions
-                    post_data["__stock_list__"] = self.get_stock_list()
-                    
-                    # 添加框架实例到数据字典
-                    post_data["__framework__"] = self
+                    # 使用最后一个时间点的数据，时间替换为盘后时间
+                    post_data = day_data.replace(time_info=time_info, stock_list=slot_stocks)
                     
                     # 执行盘后回调
                     post_signals = self.strategy_module.khPostMarket(post_data)
@@ -2402,6 +2660,12 @@ class KhQuantFramework:
                 except Exception as e:
                     if self.trader_callback:
                         self.trader_callback.gui.log_message(f"执行最后一天的盘后回调时出错: {str(e)}", "ERROR")
+            self._use_slot(slots[0])
+
+            # 保存最终状态，供 api.extend_backtest 在新的交易日上接续
+            if self.save_final_state and not interrupted:
+                self._save_checkpoint(os.path.join(backtest_dir, "final_state.pkl"),
+                                      self._final_state(backtest_dir_name, current_date, stock_codes), "最终状态")
                 
             # 回测完成后发送信号
             self.is_running = False
@@ -2448,20 +2712,27 @@ class KhQuantFramework:
                             self._log(f"{desc}保存失败: {e}", "ERROR")
                             raise
 
-                # 保存交易记录
-                trades_df = pd.DataFrame(self.backtest_records['trades'])
+                # 写入回测记录中剩余的缓存
+                self._flush_record_logs()
+
+                # 组合回测：结果目录保存合并后的组合账户记录，各策略的记录另存到 strategies/ 子目录
+                if multi_strategy:
+                    self.backtest_records = self._combined_backtest_records(backtest_dir)
+
+                # 保存交易记录（由 records/trades/ 的分块逐块导出）
+                trades_df = self.backtest_records['trades']
                 if len(trades_df) == 0:
                     trades_df = pd.DataFrame(columns=[
                         'datetime', 'code', 'action', 'price', 'volume', 'amount',
                         'commission', 'stamp_tax', 'transfer_fee', 'flow_fee',
-                        'total_asset', 'cash', 'market_value'
+                        'total_asset', 'cash', 'market_value', 'status'
                     ])
                     if self.trader_callback:
                         self.trader_callback.gui.log_message("回测期间没有产生交易记录", "WARNING")
                 _safe_to_csv(trades_df, os.path.join(backtest_dir, "trades.csv"), "交易记录")
 
                 # 保存每日统计数据
-                daily_stats_df = pd.DataFrame(self.backtest_records['daily_stats'])
+                daily_stats_df = self.backtest_records['daily_stats'].to_frame()
                 if len(daily_stats_df) == 0:
                     daily_stats_df = pd.DataFrame(columns=[
                         'date', 'total_asset', 'cash', 'market_value', 
@@ -2474,35 +2745,9 @@ class KhQuantFramework:
                 # 保存回测汇总指标（即使统计样本不足也写出稳定表头）
                 try:
                     init_capital = self.backtest_records.get('init_capital', 0) or 0
-                    trade_days = len(daily_stats_df)
-                    total_asset_series = pd.Series(dtype=float)
-                    if 'total_asset' in daily_stats_df.columns:
-                        total_asset_series = pd.to_numeric(daily_stats_df['total_asset'], errors='coerce').dropna()
-
-                    final_capital = float(total_asset_series.iloc[-1]) if len(total_asset_series) > 0 else float(init_capital)
-                    total_return = 0.0
-                    annual_return = 0.0
-                    max_drawdown = 0.0
-
-                    if trade_days >= 2 and init_capital > 0 and len(total_asset_series) > 0:
-                        total_return = (final_capital - init_capital) / init_capital * 100
-                        total_return_decimal = (final_capital / init_capital) - 1
-                        annual_return = (pow(1 + total_return_decimal, 250 / trade_days) - 1) * 100
-
-                        cummax = total_asset_series.cummax()
-                        drawdown = (cummax - total_asset_series) / cummax * 100
-                        max_drawdown = float(drawdown.max()) if len(drawdown) > 0 else 0.0
-                    elif self.trader_callback:
+                    summary = summarize_daily_stats(daily_stats_df, init_capital)
+                    if summary['trade_days'] < 2 and self.trader_callback:
                         self.trader_callback.gui.log_message("每日统计数据不足2条，summary.csv写入默认汇总值", "WARNING")
-
-                    summary = {
-                        'init_capital': init_capital,
-                        'final_capital': final_capital,
-                        'total_return': total_return,
-                        'annual_return': annual_return,
-                        'max_drawdown': max_drawdown,
-                        'trade_days': trade_days
-                    }
                     _safe_to_csv(pd.DataFrame([summary]), os.path.join(backtest_dir, "summary.csv"), "回测汇总")
                 except Exception as e:
                     logging.warning(f"保存回测汇总指标时出错: {str(e)}")
@@ -2521,43 +2766,11 @@ class KhQuantFramework:
                 benchmark_df = pd.DataFrame(columns=['date', 'close'])
                 benchmark_code = self.config.config_dict.get("backtest", {}).get("benchmark", "")
                 try:
-                    if benchmark_code:
-                        xtdata.download_history_data(
-                            stock_code=benchmark_code,
-                            period="1d",
-                            start_time=self.config.backtest_start,
-                            end_time=self.config.backtest_end,
-                        )
-
-                        benchmark_data = xtdata.get_market_data(
-                            field_list=['close'],
-                            stock_list=[benchmark_code],
-                            period='1d',
-                            start_time=self.config.backtest_start,
-                            end_time=self.config.backtest_end,
-                        )
-
-                        if benchmark_data and 'close' in benchmark_data and len(benchmark_data['close']) > 0:
-                            close_frame = benchmark_data['close']
-                            closes = np.array(close_frame.values[0]) if len(close_frame.values) > 0 else np.array([])
-                            dates = None
-
-                            if 'date' in benchmark_data and len(benchmark_data['date']) > 0:
-                                dates = benchmark_data['date'][0]
-                            elif hasattr(close_frame, 'columns') and len(close_frame.columns) > 0:
-                                date_cols = [col for col in close_frame.columns if str(col).isdigit()]
-                                if date_cols:
-                                    dates = pd.to_datetime(date_cols, format='%Y%m%d')
-                                    closes = np.array([close_frame.iloc[0][col] for col in date_cols])
-                            elif hasattr(close_frame, 'index') and len(close_frame.index) > 0:
-                                dates = close_frame.index
-
-                            if dates is not None and len(closes) > 0:
-                                min_len = min(len(dates), len(closes))
-                                benchmark_df = pd.DataFrame({
-                                    'date': list(dates)[:min_len],
-                                    'close': list(closes)[:min_len]
-                                })
+                    if self.benchmark_series is not None:
+                        benchmark_df = self.benchmark_series.to_frame()
+                    elif benchmark_code:
+                        benchmark_df = get_benchmark_store().get(
+                            benchmark_code, self.config.backtest_start, self.config.backtest_end).to_frame()
                     elif self.trader_callback:
                         self.trader_callback.gui.log_message("未配置基准指数代码，benchmark.csv将写入空表", "WARNING")
                 except Exception as e:
@@ -2643,10 +2856,20 @@ class KhQuantFramework:
                     'stock_list': stock_list_value,
                     'min_volume': _safe_get_nested(self.config.config_dict, ["backtest", "min_volume"], ""),
                     'kline_period': _safe_get_nested(self.config.config_dict, ["data", "kline_period"], ""),
-                    'dividend_type': _safe_get_nested(self.config.config_dict, ["data", "dividend_type"], "")
+                    'dividend_type': _safe_get_nested(self.config.config_dict, ["data", "dividend_type"], ""),
+                    'stop_reason': self.stop_reason or ""
                 }
+                if multi_strategy:
+                    config_info['strategies'] = ','.join(f"{slot.name}:{slot.weight:g}" for slot in slots)
                 _safe_to_csv(pd.DataFrame([config_info]), os.path.join(backtest_dir, "config.csv"), "配置数据")
 
+                if multi_strategy:
+                    self._save_strategy_results(backtest_dir, benchmark_df, config_info, _safe_to_csv)
+
+                # 回测已完整结束，之前的断点不再需要
+                if not keep_checkpoint and os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+
                 # Record last backtest output directory for headless API.
                 self.last_backtest_dir = backtest_dir
                 
@@ -2677,18 +2900,371 @@ class KhQuantFramework:
                 self.trader_callback.gui.log_message(f"错误详情:\n{traceback.format_exc()}", "ERROR")
             raise  # 重新抛出异常
 
-    def record_results(self, timestamp, data, signals):
+    def _checkpoint_state(self, backtest_dir_name: str, all_times, time_idx, last_visit_idx,
+                          current_date, day_start_time, processed_times: int, stock_codes: List[str]) -> Dict:
+        """收集从 time_idx 继续回测所需的全部状态
+
+        包括各策略子账户的资产、持仓、委托、成交和回测记录，以及策略 khSaveState() 返回的状态。
+        time_idx 为 None 表示回测已运行到数据末尾（最终状态）。
+        """
+        return {
+            'version': CHECKPOINT_VERSION,
+            'backtest_dir_name': backtest_dir_name,
+            'start_time': self.config.backtest_start,
+            'end_time': self.config.backtest_end,
+            'records_start': self.backtest_records.get('start_time', self.config.backtest_start),
+            'stock_codes': list(stock_codes),
+            'strategies': [slot.name for slot in self.strategy_slots],
+            'time_idx': None if time_idx is None else int(time_idx),
+            'timestamp': None if time_idx is None else int(all_times[time_idx]),
+            'last_visit_idx': None if last_visit_idx is None else int(last_visit_idx),
+            'current_date': current_date,
+            'day_start_time': day_start_time,
+            'processed_times': processed_times,
+            'peak_asset': self._peak_asset,
+            'portfolio_daily_stats': self.portfolio_daily_stats,
+            'slots': [
+                {
+                    'assets': slot.trade_mgr.assets,
+                    'positions': slot.trade_mgr.positions,
+                    'orders': slot.trade_mgr.orders,
+                    'trades': slot.trade_mgr.trades,
+                    'backtest_records': slot.backtest_records,
+                    'strategy_state': slot.module.khSaveState() if hasattr(slot.module, 'khSaveState') else None,
+                }
+                for slot in self.strategy_slots
+            ],
+        }
+
+    def _save_checkpoint(self, path: str, state: Dict, description: str = "断点"):
+        """保存断点文件，失败时只记录错误，不中断回测"""
+        try:
+            save_checkpoint(state, path)
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"已保存{description}: {state['current_date']}（{path}）", "INFO")
+        except Exception as e:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"保存{description}失败: {str(e)}", "ERROR")
+            logging.error(f"保存{description}失败: {str(e)}", exc_info=True)
+
+    def _final_state(self, backtest_dir_name: str, current_date, stock_codes: List[str]) -> Dict:
+        """回测正常结束后的最终状态，供 api.extend_backtest 在新的日期上接续回测"""
+        state = self._checkpoint_state(backtest_dir_name, None, None, None, current_date, None, 0, stock_codes)
+        last_date = self.backtest_records['daily_stats'][-1]['date'] if self.backtest_records['daily_stats'] else current_date
+        state.update(
+            final=True,
+            last_date=str(last_date).replace('-', '')[:8],
+            config_dict=self.config.config_dict,
+            config_name=os.path.basename(self.config.config_path),
+            strategy_specs=[
+                {'name': slot.name, 'file': slot.file, 'weight': slot.weight, 'stock_list': slot.stock_list}
+                for slot in self.strategy_slots
+            ],
+        )
+        for slot_state, slot in zip(state['slots'], self.strategy_slots):
+            slot_state['rolling_history'] = slot.rolling_history.state() if slot.rolling_history is not None else None
+        return state
+
+    def _restore_checkpoint(self, state: Dict, all_times, stock_codes: List[str], slot_stock_lists) -> int:
+        """从断点恢复各策略子账户和策略状态
+
+        Returns:
+            int: 继续回测的起始时间点下标
+        """
+        expected = (self.config.backtest_start, self.config.backtest_end, list(stock_codes),
+                    [slot.name for slot in self.strategy_slots])
+        actual = (state['start_time'], state['end_time'], state['stock_codes'], state['strategies'])
+        if expected != actual:
+            raise ValueError("断点与当前回测的区间、股票池或策略不一致，无法继续")
+        time_idx = state['time_idx']
+        if time_idx is None or time_idx >= len(all_times) or int(all_times[time_idx]) != state['timestamp']:
+            raise ValueError("断点中的时间点与当前回测数据的时间轴不一致，无法继续")
+        self._restore_slots(state, slot_stock_lists, state['last_visit_idx'])
+        return time_idx
+
+    def _restore_extension(self, state: Dict, stock_codes: List[str], slot_stock_lists):
+        """在新的日期区间上接续已完成的回测：恢复其最终状态，并检查策略是否可接续"""
+        if list(stock_codes) != state['stock_codes'] or [slot.name for slot in self.strategy_slots] != state['strategies']:
+            raise ValueError("接续回测的股票池或策略与原回测不一致")
+        if self.config.backtest_start <= state['last_date']:
+            raise ValueError(f"接续回测的起始日期 {self.config.backtest_start} 应晚于原回测的最后交易日 {state['last_date']}")
+        for slot, saved in zip(self.strategy_slots, state['slots']):
+            # 面板上的预计算结果只覆盖新加载的区间，与完整回测不一致
+            if getattr(slot.module, 'KH_INDICATORS', None) or hasattr(slot.module, 'khVectorStrategy'):
+                raise ValueError(f"策略 {slot.name} 使用了 KH_INDICATORS 或 khVectorStrategy，需要完整区间的数据，无法接续回测")
+            if slot.rolling_history is not None:
+                if saved.get('rolling_history') is None:
+                    raise ValueError(f"原回测未保存策略 {slot.name} 的滚动历史，无法接续回测")
+                slot.rolling_history.restore(saved['rolling_history'])
+        self._restore_slots(state, slot_stock_lists, None)
+
+    def _restore_slots(self, state: Dict, slot_stock_lists, last_visit_idx):
+        """恢复各策略子账户、回测记录和策略状态；last_visit_idx 不为空时重建该时间点的当日数据"""
+        if last_visit_idx is not None:
+            time_info = self.time_table.info(last_visit_idx)
+        for slot, slot_stocks, saved in zip(self.strategy_slots, slot_stock_lists, state['slots']):
+            # 原地更新，保持策略在 init 中获得的账户、持仓引用有效
+            for name in ('assets', 'positions', 'orders', 'trades'):
+                target = getattr(slot.trade_mgr, name)
+                target.clear()
+                target.update(saved[name])
+            slot.backtest_records.clear()
+            slot.backtest_records.update(saved['backtest_records'])
+            slot.backtest_records['end_time'] = self.config.backtest_end
+            if last_visit_idx is not None:
+                if slot.rolling_history is not None:
+                    slot.rolling_history.advance(last_visit_idx)
+                slot.day_data = BarContext(
+                    self.market_panel, last_visit_idx, time_info,
+                    account=slot.trade_mgr.assets,
+                    positions=slot.trade_mgr.positions,
+                    stock_list=slot_stocks,
+                    framework=self,
+                    history=slot.rolling_history
+                )
+            if saved['strategy_state'] is not None and hasattr(slot.module, 'khLoadState'):
+                slot.module.khLoadState(saved['strategy_state'])
+        self._peak_asset = state['peak_asset']
+        self.portfolio_daily_stats = state['portfolio_daily_stats']
+        self._use_slot(self.strategy_slots[0])
+
+    def _new_record_log(self) -> RecordLog:
+        return RecordLog(self.record_chunk_size, self.record_flush_seconds)
+
+    def _flush_record_logs(self):
+        for slot in self.strategy_slots:
+            slot.backtest_records['trades'].flush()
+            slot.backtest_records['daily_stats'].flush()
+        if self.portfolio_daily_stats is not None:
+            self.portfolio_daily_stats.flush()
+
+    def _attach_record_logs(self, backtest_dir: str):
+        """指定各回测记录的分块目录：records/<记录名>/，组合回测时各策略的记录在 strategies/<策略名>/records/ 下"""
+        multi_strategy = len(self.strategy_slots) > 1
+        for slot in self.strategy_slots:
+            slot_dir = os.path.join(backtest_dir, "strategies", slot.name) if multi_strategy else backtest_dir
+            for name in ('trades', 'daily_stats'):
+                slot.backtest_records[name].attach(os.path.join(slot_dir, "records", name))
+        if self.portfolio_daily_stats is not None:
+            self.portfolio_daily_stats.attach(os.path.join(backtest_dir, "records", "daily_stats"))
+
+    def _combined_backtest_records(self, backtest_dir: str) -> Dict:
+        """合并各策略子账户的回测记录为组合账户的记录
+
+        交易记录按时间合并并增加 strategy 列（逐块读取各策略的记录并写入结果目录的 records/trades/）；
+        每日统计为回测中按日累计的合计账户记录。
+        """
+        slots = self.strategy_slots
+
+        def slot_trades(slot):
+            for trade in slot.backtest_records['trades'].rows():
+                yield {'strategy': slot.name, **trade}
+
+        trades = self._new_record_log()
+        trades.attach(os.path.join(backtest_dir, "records", "trades"))
+        trades.extend(heapq.merge(*(slot_trades(slot) for slot in slots),
+                                  key=lambda trade: str(trade.get('datetime', ''))))
+        trades.flush()
+
+        records = dict(slots[0].backtest_records)
+        records.update(trades=trades, daily_stats=self.portfolio_daily_stats,
+                       init_capital=self.config.config_dict["backtest"]["init_capital"])
+        return records
+
+    def _save_strategy_results(self, backtest_dir: str, benchmark_df: pd.DataFrame, config_info: Dict, save_csv):
+        """组合回测时保存各策略的回测结果
+
+        每个策略在 strategies/<策略名>/ 下保存与单策略回测相同的结果文件（资金为其子账户），
+        并在结果目录下保存各策略汇总指标 strategies.csv。
+        """
+        rows = []
+        for slot in self.strategy_slots:
+            slot_dir = os.path.join(backtest_dir, "strategies", slot.name)
+            os.makedirs(slot_dir, exist_ok=True)
+            records = slot.backtest_records
+
+            trades_df = records['trades']
+            if len(trades_df) == 0:
+                trades_df = pd.DataFrame(columns=[
+                    'datetime', 'code', 'action', 'price', 'volume', 'amount',
+                    'commission', 'stamp_tax', 'transfer_fee', 'flow_fee',
+                    'total_asset', 'cash', 'market_value', 'status'
+                ])
+            daily_stats_df = records['daily_stats'].to_frame()
+            if len(daily_stats_df) == 0:
+                daily_stats_df = pd.DataFrame(columns=[
+                    'date', 'total_asset', 'cash', 'market_value',
+                    'daily_return', 'benchmark_close', 'positions'
+                ])
+            summary = summarize_daily_stats(daily_stats_df, records['init_capital'])
+            slot_config = dict(config_info, init_capital=records['init_capital'], strategy_file=slot.file)
+            slot_config.pop('strategies', None)
+
+            save_csv(trades_df, os.path.join(slot_dir, "trades.csv"), f"{slot.name} 交易记录")
+            save_csv(daily_stats_df, os.path.join(slot_dir, "daily_stats.csv"), f"{slot.name} 每日统计数据")
+            save_csv(pd.DataFrame([summary]), os.path.join(slot_dir, "summary.csv"), f"{slot.name} 回测汇总")
+            save_csv(benchmark_df, os.path.join(slot_dir, "benchmark.csv"), f"{slot.name} 基准数据")
+            save_csv(pd.DataFrame([slot_config]), os.path.join(slot_dir, "config.csv"), f"{slot.name} 配置数据")
+            if os.path.exists(slot.file):
+                shutil.copy2(slot.file, os.path.join(slot_dir, os.path.basename(slot.file)))
+
+            rows.append({'strategy': slot.name, 'strategy_file': slot.file, 'weight': slot.weight,
+                         'trade_count': len(records['trades']), **summary})
+
+        save_csv(pd.DataFrame(rows), os.path.join(backtest_dir, "strategies.csv"), "各策略汇总")
+        if self.trader_callback:
+            for row in rows:
+                self.trader_callback.gui.log_message(
+                    f"策略 {row['strategy']}（资金占比 {row['weight']:.2%}）: 总收益率 {row['total_return']:.2f}%，"
+                    f"最大回撤 {row['max_drawdown']:.2f}%，交易 {row['trade_count']} 笔", "INFO")
+
+    def preload_history(self) -> Dict[str, pd.DataFrame]:
+        """加载本次回测配置所需的全部历史数据（不运行回测）
+
+        供参数扫描等场景一次加载、多次回测共享；将返回值赋给其他框架实例的
+        preloaded_history 后，这些实例运行回测时不再请求数据接口。
+
+        Returns:
+            Dict[str, pd.DataFrame]: {股票代码: 历史数据}
+        """
+        was_running = self.is_running
+        self.is_running = True
+        try:
+            field_list, period = self._history_request()
+            return self._load_history_data(self.get_stock_list(), field_list, period)
+        finally:
+            self.is_running = was_running
+
+    def _history_request(self):
+        """确定回测需要加载的历史数据字段和数据周期
+
+        Returns:
+            tuple: (字段列表, 数据周期)
+        """
+        # 获取数据周期
+        data_period = self.trigger.get_data_period()
+
+        # 确保field_list中包含time和close字段（复制配置中的列表，避免修改配置）
+        field_list = list(self.config.config_dict["data"]["fields"])
+        if "time" not in field_list:
+            field_list = ["time"] + field_list
+        if "close" not in field_list:
+            field_list.append("close")
+
+        # 根据触发器的数据周期加载对应的历史数据
+        period = data_period
+
+        # 对于自定义定时触发，需要特殊处理数据周期
+        if isinstance(self.trigger, CustomTimeTrigger):
+            # 检查所有触发时间点是否都是整分钟（秒数为0）
+            all_whole_minutes = all(seconds % 60 == 0 for seconds in self.trigger.trigger_seconds)
+
+            if all_whole_minutes:
+                # 如果所有时间点都是整分钟，使用1m数据
+                period = "1m"
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(f"所有自定义时间点都是整分钟，使用1分钟K线数据", "INFO")
+            else:
+                # 如果有不是整分钟的时间点，使用tick数据
+                period = "tick"
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(f"存在非整分钟的自定义时间点，使用tick数据", "INFO")
+
+        # 对于其他触发器类型，直接使用触发器返回的数据周期
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(f"使用{period}数据周期进行回测", "INFO")
+        
+        return field_list, period
+
+    def _load_history_data(self, stock_codes: List[str], field_list: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """按批次加载回测区间内的历史数据
+        
+        每个批次用一次多股票的 get_market_data_ex 请求获取，批次大小由配置
+        data.load_batch_size 指定（默认50）；data.load_workers 大于1时用有界线程池
+        并发请求多个批次（默认1，即逐批串行）。每个批次完成后输出耗时。
+        设置了 preloaded_history 时直接截取其中回测区间内的数据，不再请求数据接口。
+        
+        Args:
+            stock_codes: 股票代码列表
+            field_list: 字段列表
+            period: 数据周期
+            
+        Returns:
+            Dict[str, pd.DataFrame]: {股票代码: 历史数据}
+        """
+        if self.preloaded_history is not None:
+            # 使用预先加载（如参数扫描时由主进程共享）的历史数据，截取到本次回测区间
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"使用预加载的历史数据: {len(self.preloaded_history)}只股票", "INFO")
+            preloaded = {code: self.preloaded_history[code] for code in stock_codes if code in self.preloaded_history}
+            return trim_frames(preloaded, self.config.backtest_start, self.config.backtest_end)
+        
+        data_config = self.config.config_dict.get("data", {})
+        batch_size = max(1, int(data_config.get("load_batch_size", 50) or 50))
+        workers = max(1, int(data_config.get("load_workers", 1) or 1))
+        dividend_type = data_config["dividend_type"]
+        batches = [stock_codes[i:i + batch_size] for i in range(0, len(stock_codes), batch_size)]
+        
+        def load_batch(batch):
+            start = time.time()
+            if not self.is_running:
+                return batch, {}, 0.0
+            result = xtdata.get_market_data_ex(
+                field_list=field_list,
+                stock_list=batch,
+                period=period,
+                start_time=self.config.backtest_start,
+                end_time=self.config.backtest_end,
+                dividend_type=dividend_type,
+                fill_data=True
+            )
+            return batch, result or {}, time.time() - start
+        
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(
+                f"开始加载{len(stock_codes)}只股票的历史数据: 共{len(batches)}个批次，每批最多{batch_size}只，并发数{min(workers, len(batches)) if batches else 0}",
+                "INFO")
+        
+        load_start = time.time()
+        loaded = {}
+        
+        def collect(batch_no, batch, result, elapsed):
+            loaded.update(result)
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"批次 {batch_no}/{len(batches)}: {len(batch)}只股票，获取到{len(result)}只，耗时 {elapsed:.2f}秒",
+                    "INFO")
+        
+        if workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(load_batch, batch): no for no, batch in enumerate(batches, 1)}
+                for future in as_completed(futures):
+                    batch, result, elapsed = future.result()
+                    collect(futures[future], batch, result, elapsed)
+        else:
+            for no, batch in enumerate(batches, 1):
+                if not self.is_running:
+                    break
+                batch, result, elapsed = load_batch(batch)
+                collect(no, batch, result, elapsed)
+        
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(f"历史数据加载完成，总耗时 {time.time() - load_start:.2f}秒", "INFO")
+        
+        # 按股票池顺序返回
+        return {code: loaded[code] for code in stock_codes if code in loaded}
+
+    def record_results(self, timestamp, data, fills):
         """记录回测结果
         
         Args:
             timestamp: 当前时间戳
             data: 当前市场数据
-            signals: 交易信号列表
+            fills: 本时间点各信号的成交记录列表（KhTradeManager.process_signals 的返回值，含未成交的信号）
         """
         try:
             # 获取当前时间信息
             current_time_info = data.get("__current_time__", {})
-            current_ts = current_time_info.get("timestamp", timestamp)
             current_datetime = current_time_info.get("datetime", "")
             current_date = current_time_info.get("date", "")
             current_time = current_time_info.get("time", "")
@@ -2701,20 +3277,15 @@ class KhQuantFramework:
                     self.trader_callback.gui.log_message(f"日期 {current_date} 不是交易日，跳过策略执行", "INFO")
                 return
             
-            # 记录交易信号
-            if signals:
-                for signal in signals:
-                    if 'action' not in signal or 'code' not in signal:
-                        continue
-                        
-                    # 记录时间戳
-                    timestamp_ms = signal.get('timestamp', current_ts)
-                    # 如果时间戳是秒级，转换为毫秒级
-                    if timestamp_ms < 1e10:
-                        timestamp_ms *= 1000
-            
-            # 1. 时间戳处理优化 - 使用缓存和类型检查优化
-            if isinstance(timestamp, str):
+            # 1. 时间戳处理优化 - 回测主循环的数据上下文直接使用预先计算的时间信息表
+            time_table = getattr(self, 'time_table', None)
+            time_index = getattr(data, 'time_index', None)
+            if time_table is not None and time_table.seconds is not None and time_index is not None:
+                current_time = time_table.to_datetime(time_index)
+                current_date = time_table.to_date(time_index)
+                ts_float = float(timestamp)
+                current_ts_seconds = ts_float / 1000 if ts_float > 1e10 else ts_float
+            elif isinstance(timestamp, str):
                 if hasattr(self, '_cached_timestamp') and self._cached_timestamp.get('str') == timestamp:
                     current_time = self._cached_timestamp.get('datetime')
                     current_date = self._cached_timestamp.get('date')
@@ -2750,79 +3321,35 @@ class KhQuantFramework:
                         'date': current_date
                     }
             
-            # 2. 交易日检查优化 - 使用缓存避免重复查询
-            cache_key = f"trade_day_{current_date}"
-            if hasattr(self, '_cached_trade_days') and cache_key in self._cached_trade_days:
-                is_trading_day = self._cached_trade_days[cache_key]
-            else:
-                if not hasattr(self, '_cached_trade_days'):
-                    self._cached_trade_days = {}
-                    
-                try:
-                    # 使用KhQuTools的is_trade_day方法进行统一的交易日判断
-                    date_str = current_date.strftime("%Y-%m-%d")
-                    is_trading_day = self.tools.is_trade_day(date_str)
-                    # 缓存结果
-                    self._cached_trade_days[cache_key] = is_trading_day
-                except Exception as e:
-                    logging.warning(f"检查交易日失败: {str(e)}")
-                    is_trading_day = True  # 出错默认为交易日
+            # 2. 交易日检查 - 交易日历为位图查询，无需额外缓存
+            try:
+                is_trading_day = self.tools.calendar.is_trade_day(current_date)
+            except Exception as e:
+                logging.warning(f"检查交易日失败: {str(e)}")
+                is_trading_day = True  # 出错默认为交易日
                     
-            # 3. 持仓更新优化 - 预先获取并缓存持仓列表
+            # 3. 持仓账本（数量、均价、现价、市值等按列存放在数组中）
             positions = self.trade_mgr.positions
-            position_codes = list(positions.keys())
             
             # 4. 非交易日处理优化
             if not is_trading_day:
                 # 非交易日情况下，不更新持仓市值
                 # 只记录每日统计数据，使用前一个交易日的市值数据
-                total_market_value = 0.0
-                for code, position in positions.items():
-                    # 使用已记录的市值，不从当天数据获取
-                    if 'market_value' in position and position['market_value'] > 0:
-                        total_market_value += position['market_value']
+                market_values = positions.column('market_value')
+                total_market_value = float(market_values[market_values > 0].sum())
             else:
-                # 5. 交易日市值计算优化 - 批量获取价格并一次性更新
-                # 预先创建价格字典并批量填充
-                prices = {}
-                
-                # 一次性从数据中提取所有价格
-                for code in position_codes:
-                    # 使用条件短路避免不必要的检查
-                    # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
+                # 5. 交易日盯市：缺少行情的持仓沿用现价（无现价时用持仓均价），再整列计算市值和盈亏
+                current_prices = positions.column('current_price')
+                prices = np.where(current_prices > 0, current_prices, positions.column('avg_price'))
+                for i, code in enumerate(positions):
                     if code in data:
-                        if 'lastPrice' in data[code]:
-                            # Tick数据：优先使用lastPrice字段
-                            prices[code] = data[code]['lastPrice']
-                        elif 'close' in data[code]:
-                            # K线数据：使用close字段
-                            prices[code] = data[code]['close']
-                        elif code in positions and 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                            prices[code] = positions[code]['current_price']
-                        elif code in positions and 'avg_price' in positions[code]:
-                            prices[code] = positions[code]['avg_price']
-                    elif code in positions and 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                        prices[code] = positions[code]['current_price']
-                    elif code in positions and 'avg_price' in positions[code]:
-                        prices[code] = positions[code]['avg_price']
-                
-                # 一次性计算所有持仓的市值和盈亏
-                total_market_value = 0.0
-                for code in position_codes:
-                    if code in prices:
-                        position = positions[code]
-                        current_price = prices[code]
-                        volume = position['volume']
-                        avg_price = position['avg_price']
-                        
-                        # 计算市值和盈亏
-                        market_value = current_price * volume
-                        position['market_value'] = market_value
-                        position['current_price'] = current_price
-                        position['profit'] = (current_price - avg_price) * volume
-                        position['profit_ratio'] = (current_price - avg_price) / avg_price if avg_price != 0 else 0
-                        
-                        total_market_value += market_value
+                        row = data[code]
+                        # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
+                        if 'lastPrice' in row:
+                            prices[i] = row['lastPrice']
+                        elif 'close' in row:
+                            prices[i] = row['close']
+                total_market_value = float(positions.mark_to_market(prices).sum())
             
             # 6. 资产更新优化
             assets = self.trade_mgr.assets
@@ -2830,7 +3357,7 @@ class KhQuantFramework:
             old_market_value = assets.get('market_value', 0)
             
             # 非交易日且没有交易信号时，市值保持不变
-            if not is_trading_day and not signals and old_market_value > 0:
+            if not is_trading_day and not fills and old_market_value > 0:
                 total_market_value = old_market_value
             
             # 更新资产信息
@@ -2841,165 +3368,139 @@ class KhQuantFramework:
             if abs(assets['total_asset'] - old_total_asset) > 0.01 and self.trader_callback:
                 self.trader_callback.on_stock_asset(SimpleNamespace(**assets))
             
-            # 7. 交易信号处理优化
-            if signals:
-                trade_mgr = self.trade_mgr
-                # 预先创建信号记录列表以避免多次append
-                signal_records = []
-                
-                # 提前获取资产数据
+            # 7. 成交记录：成交价和各项交易成本由交易管理器撮合时算出，附上成交后的账户资产；
+            #    资金或持仓不足等未成交的信号同样记录，status 为 rejected
+            if fills:
                 total_asset = assets['total_asset']
                 cash = assets['cash']
                 market_value = assets['market_value']
-                
-                # 使用列表推导式批量处理信号
-                self.backtest_records['trades'].extend([
+                self.backtest_records['trades'].extend(
                     {
                         'datetime': current_time,
-                        'code': signal['code'],
-                        'action': signal['action'],
-                        'price': signal.get('actual_price', signal['price']),
-                        'volume': signal['volume'],
-                        'amount': signal.get('actual_price', signal['price']) * signal['volume'],
-                        'commission': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal else
-                            trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume'])
-                        ),
-                        'stamp_tax': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal and signal['action'] == 'sell' else
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action'])
-                        ),
-                        'transfer_fee': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal and signal['code'].startswith("sh.") else
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume'])
-                        ),
-                        'flow_fee': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_flow_fee() /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal else
-                            trade_mgr.calculate_flow_fee()
-                        ),
+                        **fill.to_record(),
                         'total_asset': total_asset,
                         'cash': cash,
-                        'market_value': market_value
+                        'market_value': market_value,
+                        'status': fill.status
                     }
-                    for signal in signals
-                ])
-            
-            # 8. 最后时间点判断优化
-            # 使用函数字典替代if-else判断
-            is_last_time_point = False
-            
-            if isinstance(self.trigger, CustomTimeTrigger):
-                # 对于自定义时间触发，使用缓存优化
-                trigger_seconds = self.trigger.trigger_seconds
-                if trigger_seconds:
-                    # 缓存当天的触发时间点
-                    cache_key = f"time_points_{current_date}"
-                    if not hasattr(self, '_cached_time_points') or cache_key not in self._cached_time_points:
-                        if not hasattr(self, '_cached_time_points'):
-                            self._cached_time_points = {}
-                            
-                        # 获取当天所有触发时间点并缓存
-                        today_times = []
-                        max_trigger_second = max(trigger_seconds)
-                        
-                        # 使用列表推导式优化循环
-                        today_times = [
-                            int(datetime.datetime.combine(current_date, datetime.time(
-                                seconds // 3600,
-                                (seconds % 3600) // 60,
-                                seconds % 60
-                            )).timestamp())
-                            for seconds in trigger_seconds
-                        ]
-                        
-                        # 缓存计算结果
-                        self._cached_time_points[cache_key] = {
-                            'times': sorted(today_times),
-                            'max_second': max_trigger_second
-                        }
-                    
-                    # 使用缓存数据
-                    max_trigger_second = self._cached_time_points[cache_key]['max_second']
-                    
-                    # 计算当前时间点的秒数(使用已有变量避免重复计算)
-                    current_ts_dt = current_time
-                    current_seconds = current_ts_dt.hour * 3600 + current_ts_dt.minute * 60 + current_ts_dt.second
-                    
-                    # 检查是否是当天最后一个触发点
-                    is_last_time_point = abs(current_seconds - max_trigger_second) < 0.1
-            else:
-                # 非自定义时间触发，使用all_times缓存优化
-                cache_key = f"daily_times_{current_date}"
-                if not hasattr(self, '_cached_daily_times') or cache_key not in self._cached_daily_times:
-                    if not hasattr(self, '_cached_daily_times'):
-                        self._cached_daily_times = {}
-                        
-                    # 获取当天的时间点，使用生成器表达式优化
-                    today_times = []
-                    
-                    # 使用列表推导式和异常处理优化
-                    try:
-                        today_times = [
-                            t for t in self.all_times
-                            if datetime.datetime.fromtimestamp(
-                                float(t) / 1000 if float(t) > 1e10 else float(t)
-                            ).date() == current_date
-                        ]
-                    except Exception:
-                        # 出错时使用传统循环方式作为备选
-                        for t in self.all_times:
-                            try:
-                                t_float = float(t)
-                                t_seconds = t_float / 1000 if t_float > 1e10 else t_float
-                                t_time = datetime.datetime.fromtimestamp(t_seconds)
-                                
-                                if t_time.date() == current_date:
-                                    today_times.append(t)
-                            except Exception:
-                                continue
-                    
-                    # 缓存结果
-                    self._cached_daily_times[cache_key] = sorted(today_times)
-                
-                # 使用缓存的时间点
-                today_times = self._cached_daily_times[cache_key]
-                
-                # 检查是否是最后时间点
-                if today_times:
-                    # 直接使用数值比较，避免创建新的datetime对象
-                    last_time = float(today_times[-1])
-                    last_time_seconds = last_time / 1000 if last_time > 1e10 else last_time
-                    is_last_time_point = abs(last_time_seconds - current_ts_seconds) < 0.1
+                    for fill in fills
+                )
             
-            # 9. 每日统计记录优化 - 只在最后时间点记录
-            if is_last_time_point and is_trading_day:
-                self._record_daily_stats(current_date, current_time, data)
+            # 每日统计由回测主循环在每个交易日的最后一个时间点记录（见 TimeTable.is_day_end）
             
         except Exception as e:
             if self.trader_callback:
                 self.trader_callback.gui.log_message(f"记录回测结果时出错: {str(e)}", "ERROR")
             logging.error(f"记录回测结果时出错: {str(e)}", exc_info=True)
     
+    def _build_vector_signals(self, panel: MarketPanel) -> np.ndarray:
+        """调用策略的 khVectorStrategy(panel)，整理为与面板对齐的 (T, N) 信号矩阵
+
+        信号取值与 generate_signal 的 ratio 一致：正数为买入（≤1 为占可用资金比例，>1 为股数），
+        负数为卖出（绝对值 ≤1 为占可卖持仓比例，>1 为股数），0 或 NaN 表示不操作。
+        第 t 行的信号在第 t 个时间点按该时间点的价格撮合，策略计算时只应使用第 t 行及之前的数据。
+
+        Args:
+            panel: 行情面板
+
+        Returns:
+            np.ndarray: float64 信号矩阵，形状 (T, N)
+        """
+        result = self.strategy_module.khVectorStrategy(panel)
+        if isinstance(result, pd.DataFrame):
+            result = result.reindex(columns=panel.codes).to_numpy(dtype=np.float64)
+        matrix = np.asarray(result, dtype=np.float64)
+        expected = (len(panel.times), len(panel.codes))
+        if matrix.shape != expected:
+            raise ValueError(f"khVectorStrategy返回的信号矩阵形状为 {matrix.shape}，应为 {expected}（时间点 × 股票）")
+        # 无数据的位置不产生信号
+        return np.where(np.isfinite(matrix) & panel.valid, matrix, 0.0)
+
+    def _vector_signals(self, data, time_idx: int) -> List[Dict]:
+        """将信号矩阵第 time_idx 行转换为交易信号（先卖后买）"""
+        panel = self.market_panel
+        row = self._vector_signal_matrix[time_idx]
+        price_field = getattr(self.strategy_module, 'KH_VECTOR_PRICE', None)
+        if price_field is None:
+            price_field = 'close' if 'close' in panel.field_index else 'lastPrice'
+        prices = panel.cross_section(time_idx, [panel.field_index[price_field]])[:, 0]
+        signals = []
+        for side in (-1, 1):
+            for n in np.flatnonzero(row * side > 0).tolist():
+                price = prices[n]
+                if not np.isfinite(price) or price <= 0:
+                    continue
+                ratio = abs(float(row[n]))
+                action = 'buy' if side > 0 else 'sell'
+                signals.extend(generate_signal(data, panel.codes[n], float(price), ratio, action, "向量化策略信号"))
+        return signals
+
+    def _get_daily_close_panel(self) -> DailyClosePanel:
+        """获取回测区间的日线收盘价矩阵（首次调用时一次性加载股票池的全部数据）"""
+        if self.daily_close_panel is None:
+            load_start = time.time()
+            self.daily_close_panel = DailyClosePanel.load(
+                self.get_stock_list(),
+                self.config.backtest_start,
+                self.config.backtest_end,
+                # 与回测数据保持一致的复权方式，避免"下单用复权价、估值用未复权价"的不一致
+                dividend_type=self.config.config_dict["data"].get("dividend_type", "none")
+            )
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"已加载日线收盘价矩阵: {len(self.daily_close_panel.day_keys)}个交易日 × "
+                    f"{len(self.daily_close_panel.codes)}只股票，耗时 {time.time() - load_start:.2f}秒", "INFO")
+        return self.daily_close_panel
+
+    def request_stop(self, reason: str):
+        """请求在当前时间点处理完后结束回测，已产生的记录照常保存
+
+        Args:
+            reason: 结束原因（写入 config.csv 的 stop_reason 列）
+        """
+        if self.stop_reason is None:
+            self.stop_reason = reason
+        self.is_running = False
+
+    def _record_slots_daily_stats(self, current_date, current_time, data):
+        """记录各策略子账户的每日统计，并按合计总资产检查回撤止损
+
+        Args:
+            current_date: 当前日期
+            current_time: 当前时间对象
+            data: 市场数据
+        """
+        for slot in self.strategy_slots:
+            self._use_slot(slot)
+            self._record_daily_stats(current_date, current_time, data)
+        self._use_slot(self.strategy_slots[0])
+        day_stats = [slot.backtest_records['daily_stats'][-1] for slot in self.strategy_slots]
+        total_asset = sum(stat['total_asset'] for stat in day_stats)
+
+        # 组合回测：资产、现金、市值按日相加，持仓按股票合并，日收益率按合计总资产重新计算
+        if self.portfolio_daily_stats is not None:
+            if len(self.portfolio_daily_stats):
+                prev_asset = self.portfolio_daily_stats[-1]['total_asset']
+            else:
+                prev_asset = self.config.config_dict["backtest"]["init_capital"]
+            self.portfolio_daily_stats.append({
+                'date': day_stats[0]['date'],
+                'total_asset': total_asset,
+                'cash': sum(stat['cash'] for stat in day_stats),
+                'market_value': sum(stat['market_value'] for stat in day_stats),
+                'daily_return': (total_asset - prev_asset) / prev_asset if prev_asset != 0 else 0,
+                'benchmark_close': day_stats[0]['benchmark_close'],
+                'positions': _merge_positions([stat['positions'] for stat in day_stats])
+            })
+
+        # 回撤止损：净值自最高点回撤达到阈值时提前结束回测
+        if self._peak_asset is None or total_asset > self._peak_asset:
+            self._peak_asset = total_asset
+        if self.stop_drawdown and self._peak_asset > 0:
+            drawdown = (self._peak_asset - total_asset) / self._peak_asset * 100
+            if drawdown >= float(self.stop_drawdown):
+                self.request_stop(f"{current_date} 回撤 {drawdown:.2f}% 达到止损阈值 {float(self.stop_drawdown):.2f}%")
+
     def _record_daily_stats(self, current_date, current_time, data):
         """记录每日统计数据（从record_results中分离出来的功能）
         
@@ -3028,83 +3529,40 @@ class KhQuantFramework:
         # 转换日期为YYYYMMDD格式，用于获取日线数据
         yyyymmdd_date = date_str.replace('-', '') if '-' in date_str else date_str
         
-        # 批量获取收盘价
-        daily_prices = {}
+        # 从预加载的日线收盘价矩阵取当日收盘价，按持仓向量一次性计算市值
         if position_codes:
-            # 检查缓存中是否已有当日数据
-            cache_date_key = f"daily_prices_{yyyymmdd_date}"
-            if cache_date_key in self.daily_price_cache:
-                # 直接使用缓存中的数据
-                daily_prices = self.daily_price_cache[cache_date_key]
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"使用缓存的日线数据，日期: {yyyymmdd_date}", "INFO")
-            else:
-                try:
-                    # 一次性获取所有持仓股票的日线数据
-                    daily_data = xtdata.get_market_data(
-                        field_list=['close'],
-                        stock_list=position_codes,
-                        period='1d',
-                        start_time=yyyymmdd_date,
-                        end_time=yyyymmdd_date,
-                        # 与回测数据保持一致的复权方式，避免"下单用复权价、估值用未复权价"的不一致
-                        dividend_type=self.config.config_dict["data"].get("dividend_type", "none")
-                    )
-                    
-                    # 优化数据提取逻辑
-                    if daily_data is not None and isinstance(daily_data, dict) and 'close' in daily_data:
-                        close_data = daily_data['close']
-                        # 检查close_data的类型
-                        if isinstance(close_data, pd.DataFrame):
-                            # 使用向量化操作处理DataFrame
-                            if any(code in close_data.index for code in position_codes):
-                                latest_date = close_data.columns[-1]
-                                # 使用向量化操作获取所有股票的价格
-                                valid_codes = [code for code in position_codes if code in close_data.index]
-                                daily_prices.update({
-                                    code: close_data.loc[code, latest_date]
-                                    for code in valid_codes
-                                    if close_data.loc[code, latest_date] is not None and close_data.loc[code, latest_date] > 0
-                                })
-                    
-                    # 缓存获取的数据，避免同一天重复请求
-                    self.daily_price_cache[cache_date_key] = daily_prices
-                except Exception as e:
-                    logging.error(f"获取日线数据失败: {e}")
-        
-        # 批量计算持仓市值
-        for code in position_codes:
-            # 优先使用日线收盘价
-            if code in daily_prices and daily_prices[code] > 0:
-                current_price = daily_prices[code]
-            # 备选方案：使用触发数据中的价格
-            # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
-            elif code in data and 'lastPrice' in data[code]:
-                # Tick数据：优先使用lastPrice字段
-                current_price = data[code]['lastPrice']
-            elif code in data and 'close' in data[code]:
-                # K线数据：使用close字段
-                current_price = data[code]['close']
-            # 备选方案：使用持仓记录的价格
-            elif 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                current_price = positions[code]['current_price']
-            # 最后备选：使用持仓均价
-            else:
-                current_price = positions[code]['avg_price']
-            
-            # 计算市值
-            volume = positions[code]['volume']
-            market_value = current_price * volume
-            day_end_market_value += market_value
-            
-            # 更新持仓信息
-            positions[code]['current_price'] = current_price
-            positions[code]['market_value'] = market_value
+            close_panel = self._get_daily_close_panel()
+            try:
+                prices = close_panel.prices(int(yyyymmdd_date), position_codes)
+            except Exception as e:
+                logging.error(f"获取日线数据失败: {e}")
+                prices = np.full(len(position_codes), np.nan)
+            
+            # 日线收盘价缺失时逐个回退
+            missing = np.flatnonzero(~(prices > 0))
+            if len(missing):
+                current_prices = positions.column('current_price')
+                avg_prices = positions.column('avg_price')
+            for i in missing:
+                code = position_codes[i]
+                # 备选方案：使用触发数据中的价格
+                # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
+                if code in data and 'lastPrice' in data[code]:
+                    # Tick数据：优先使用lastPrice字段
+                    prices[i] = data[code]['lastPrice']
+                elif code in data and 'close' in data[code]:
+                    # K线数据：使用close字段
+                    prices[i] = data[code]['close']
+                # 备选方案：使用持仓记录的价格
+                elif current_prices[i] > 0:
+                    prices[i] = current_prices[i]
+                # 最后备选：使用持仓均价
+                else:
+                    prices[i] = avg_prices[i]
             
-            # 计算盈亏
-            avg_price = positions[code]['avg_price']
-            positions[code]['profit'] = (current_price - avg_price) * volume
-            positions[code]['profit_ratio'] = (current_price - avg_price) / avg_price if avg_price > 0 else 0
+            # 整列更新持仓的现价、市值和盈亏
+            positions.mark_to_market(prices)
+            day_end_market_value = float(np.dot(prices, positions.column('volume').astype(np.float64)))
         
         # 计算总资产
         total_asset = cash + day_end_market_value
@@ -3113,33 +3571,18 @@ class KhQuantFramework:
         benchmark_code = self.config.config_dict["backtest"]["benchmark"]
         benchmark_close = None
         
-        # 使用缓存避免重复获取基准数据
-        cache_key = f"benchmark_{yyyymmdd_date}_{benchmark_code}"
-        if cache_key in self._cached_benchmark_close:
-            benchmark_close = self._cached_benchmark_close[cache_key]
-        else:
-            try:
-                # 备选：使用触发数据中的价格
-                # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
-                if benchmark_code in data:
-                    if 'lastPrice' in data[benchmark_code]:
-                        # Tick数据：优先使用lastPrice字段
-                        benchmark_close = data[benchmark_code]['lastPrice']
-                        # 缓存结果
-                        self._cached_benchmark_close[cache_key] = benchmark_close
-                    elif 'close' in data[benchmark_code]:
-                        # K线数据：使用close字段
-                        benchmark_close = data[benchmark_code]['close']
-                        # 缓存结果
-                        self._cached_benchmark_close[cache_key] = benchmark_close
-            except Exception as e:
-                logging.error(f"获取基准指数数据失败: {e}")
-                # 备选方案：先检查lastPrice判断是否是tick数据
-                if benchmark_code in data:
-                    if 'lastPrice' in data[benchmark_code]:
-                        benchmark_close = data[benchmark_code]['lastPrice']
-                    elif 'close' in data[benchmark_code]:
-                        benchmark_close = data[benchmark_code]['close']
+        # 优先使用预加载的基准日线序列
+        if self.benchmark_series is not None:
+            benchmark_close = self.benchmark_series.close_on(int(yyyymmdd_date))
+        if benchmark_close is None and benchmark_code in data:
+            # 备选：使用触发数据中的价格
+            # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
+            if 'lastPrice' in data[benchmark_code]:
+                # Tick数据：优先使用lastPrice字段
+                benchmark_close = data[benchmark_code]['lastPrice']
+            elif 'close' in data[benchmark_code]:
+                # K线数据：使用close字段
+                benchmark_close = data[benchmark_code]['close']
         
         # 计算当日收益率
         daily_stats = self.backtest_records['daily_stats']
@@ -19,7 +19,8 @@ if is_subprocess():
 
 import csv
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+import threading
 import pandas as pd
 from xtquant import xtdata
 # from xtquant.xtdata import get_client
@@ -31,6 +32,7 @@ import holidays  # 添加这个导入，用于处理holidays.China()
 from typing import Dict, List, Union, Optional
 import math
 from khTrade import KhTradeManager
+from khData import get_history_cache
 from types import SimpleNamespace
 
 # 延迟导入Qt相关模块，避免在子进程中意外启动Qt应用
@@ -293,6 +295,184 @@ def is_trade_time() -> bool:
             return True
     return False
 
+class TradingCalendar:
+    """交易日历（工作日且非法定节假日）
+
+    按年份区间一次性生成全部交易日：
+    - days: 升序的整数日期数组（YYYYMMDD），用于 searchsorted 计数/区间查询
+    - 以日期序数为下标的位图，O(1) 判断是否为交易日
+    查询超出已生成年份时自动扩展区间。日期参数支持 "YYYY-MM-DD"、"YYYYMMDD"、
+    "YYYY/MM/DD" 字符串、YYYYMMDD 整数以及 date/datetime 对象。
+    """
+
+    def __init__(self, start_year: int = 2005, end_year: int = None):
+        self._lock = threading.Lock()
+        if end_year is None:
+            end_year = datetime.now().year + 1
+        self._build(start_year, end_year)
+
+    def _build(self, start_year: int, end_year: int):
+        """生成 [start_year, end_year] 区间内的交易日"""
+        cn_holidays = holidays.China(years=range(start_year, end_year + 1))
+        base = date(start_year, 1, 1).toordinal()
+        last = date(end_year, 12, 31).toordinal()
+        ordinals = np.arange(base, last + 1, dtype=np.int64)
+        # date.toordinal() 中 1 为公元1年1月1日（周一），(ordinal - 1) % 7 即 weekday()
+        bitmap = (ordinals - 1) % 7 < 5
+        for holiday in cn_holidays.keys():
+            offset = holiday.toordinal() - base
+            if 0 <= offset < len(bitmap):
+                bitmap[offset] = False
+        trade_ordinals = ordinals[bitmap]
+        trade_dates = [date.fromordinal(int(o)) for o in trade_ordinals]
+
+        self.start_year = start_year
+        self.end_year = end_year
+        self._base = base
+        self._bitmap = bitmap
+        self._ordinals = trade_ordinals
+        self.days = np.array([d.year * 10000 + d.month * 100 + d.day for d in trade_dates], dtype=np.int64)
+
+    def _ensure_year(self, year: int):
+        """确保日历覆盖指定年份"""
+        if self.start_year <= year <= self.end_year:
+            return
+        with self._lock:
+            if not (self.start_year <= year <= self.end_year):
+                self._build(min(self.start_year, year), max(self.end_year, year))
+
+    @staticmethod
+    def to_date(value) -> date:
+        """将各种格式的日期参数转换为 date"""
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if isinstance(value, (int, np.integer)):
+            value = int(value)
+            return date(value // 10000, value // 100 % 100, value % 100)
+        if isinstance(value, str):
+            text = value.strip()
+            if len(text) == 10 and text[4] in '-/' and text[7] in '-/':
+                return date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+            if len(text) == 8 and text.isdigit():
+                return date(int(text[0:4]), int(text[4:6]), int(text[6:8]))
+            for fmt in ["%Y-%m-%d", "%Y%m%d", "%Y/%m/%d"]:
+                try:
+                    return datetime.strptime(text, fmt).date()
+                except ValueError:
+                    continue
+        raise ValueError(f"无法解析日期格式: {value}")
+
+    def _ordinal(self, value) -> int:
+        d = self.to_date(value)
+        self._ensure_year(d.year)
+        return d.toordinal()
+
+    def is_trade_day(self, value) -> bool:
+        """判断是否为交易日"""
+        ordinal = self._ordinal(value)
+        return bool(self._bitmap[ordinal - self._base])
+
+    def is_trade_days(self, day_keys) -> np.ndarray:
+        """批量判断整数日期（YYYYMMDD）数组是否为交易日"""
+        day_keys = np.asarray(day_keys, dtype=np.int64)
+        if len(day_keys) == 0:
+            return np.zeros(0, dtype=bool)
+        self._ensure_year(int(day_keys.min()) // 10000)
+        self._ensure_year(int(day_keys.max()) // 10000)
+        pos = np.searchsorted(self.days, day_keys)
+        pos_clipped = np.minimum(pos, len(self.days) - 1)
+        return (pos < len(self.days)) & (self.days[pos_clipped] == day_keys)
+
+    def count(self, start, end) -> int:
+        """[start, end] 闭区间内的交易日数量"""
+        lo, hi = self._ordinal(start), self._ordinal(end)
+        if lo > hi:
+            return 0
+        return int(np.searchsorted(self._ordinals, hi, side='right') - np.searchsorted(self._ordinals, lo, side='left'))
+
+    def range(self, start, end) -> List[date]:
+        """[start, end] 闭区间内的交易日列表"""
+        lo, hi = self._ordinal(start), self._ordinal(end)
+        i = np.searchsorted(self._ordinals, lo, side='left')
+        j = np.searchsorted(self._ordinals, hi, side='right')
+        return [date.fromordinal(int(o)) for o in self._ordinals[i:j]]
+
+    def shift(self, value, n: int) -> date:
+        """从指定日期起偏移 n 个交易日
+
+        n > 0 时返回其后第 n 个交易日，n < 0 时返回其前第 |n| 个交易日（均不含当日）；
+        n == 0 时若当日为交易日返回当日，否则返回其后第一个交易日。
+        """
+        o = self._ordinal(value)
+        while True:
+            if n > 0:
+                idx = np.searchsorted(self._ordinals, o, side='right') + n - 1
+            elif n < 0:
+                idx = np.searchsorted(self._ordinals, o, side='left') + n
+            else:
+                idx = np.searchsorted(self._ordinals, o, side='left')
+            if idx < 0:
+                self._ensure_year(self.start_year - 1 - (-idx) // 240)
+            elif idx >= len(self._ordinals):
+                self._ensure_year(self.end_year + 1 + (idx - len(self._ordinals)) // 240)
+            else:
+                return date.fromordinal(int(self._ordinals[idx]))
+
+    def next(self, value) -> date:
+        """下一个交易日（不含当日）"""
+        return self.shift(value, 1)
+
+    def prev(self, value) -> date:
+        """上一个交易日（不含当日）"""
+        return self.shift(value, -1)
+
+
+_trading_calendar = None
+_trading_calendar_lock = threading.Lock()
+
+
+def get_trading_calendar() -> TradingCalendar:
+    """获取全局共享的交易日历（首次调用时构建）"""
+    global _trading_calendar
+    if _trading_calendar is None:
+        with _trading_calendar_lock:
+            if _trading_calendar is None:
+                _trading_calendar = TradingCalendar()
+    return _trading_calendar
+
+
+# A股连续竞价每个交易日共240分钟，用于估算各周期每日的K线数量
+_SESSION_MINUTES = 240
+# khHistory 支持的原生周期每日K线数量（tick快照约3秒一笔）
+_BARS_PER_DAY = {'1m': 240, '5m': 48, '15m': 16, '30m': 8, '60m': 4, '1h': 4, 'tick': 4800}
+
+
+def _lookback_start(end_datetime, bar_count: int, bars_per_day: int = 1, include_end_day: bool = True) -> str:
+    """按交易日历计算获取 bar_count 根K线所需的起始日期
+
+    日内周期从截止日往前取 ceil(bar_count / bars_per_day) 个完整交易日（截止日当天的K线另计）；
+    日线在截止日计入且为交易日时少取一天。
+
+    Args:
+        end_datetime: 截止时间（date/datetime）
+        bar_count: 需要的K线数量
+        bars_per_day: 每个交易日的K线数量，日线为1
+        include_end_day: 截止日当天的日线是否计入结果
+
+    Returns:
+        str: 起始日期，YYYYMMDD格式
+    """
+    calendar = get_trading_calendar()
+    days = -(-bar_count // bars_per_day)
+    if bars_per_day == 1 and include_end_day and calendar.is_trade_day(end_datetime):
+        days -= 1
+    if days <= 0:
+        return end_datetime.strftime('%Y%m%d')
+    return calendar.shift(end_datetime, -days).strftime('%Y%m%d')
+
+
 def is_trade_day(date_str: str = None) -> bool:
     """判断是否为交易日（工作日且非法定节假日）
     
@@ -308,71 +488,12 @@ def is_trade_day(date_str: str = None) -> bool:
     if date_str is None:
         date_str = datetime.now().strftime("%Y-%m-%d")
     
-    # 标准化日期格式
     try:
-        # 尝试解析不同的日期格式
-        date_obj = None
-        
-        # 格式1: YYYY-MM-DD
-        if '-' in date_str and len(date_str) == 10:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        # 格式2: YYYYMMDD
-        elif date_str.isdigit() and len(date_str) == 8:
-            date_obj = datetime.strptime(date_str, "%Y%m%d")
-        else:
-            # 尝试其他可能的格式
-            for fmt in ["%Y-%m-%d", "%Y%m%d", "%Y/%m/%d"]:
-                try:
-                    date_obj = datetime.strptime(date_str, fmt)
-                    break
-                except ValueError:
-                    continue
-        
-        if date_obj is None:
-            raise ValueError(f"无法解析日期格式: {date_str}")
-        
-        # 首先排除周末 (5代表周六, 6代表周日)
-        if date_obj.weekday() >= 5:
-            return False
-        
-        # 使用holidays库判断是否为法定节假日
-        date_only = date_obj.date()
-        if date_only in _cn_holidays:
-            return False
-        
-        # 非周末且非法定节假日，则视为交易日
-        return True
-        
+        return get_trading_calendar().is_trade_day(date_str)
     except Exception as e:
-        print(f"判断交易日异常: {str(e)}")
-        # 如果出现异常，尝试基本的日期解析
-        try:
-            # 再次尝试解析常见格式
-            date_obj = None
-            for fmt in ["%Y-%m-%d", "%Y%m%d"]:
-                try:
-                    date_obj = datetime.strptime(date_str, fmt)
-                    break
-                except ValueError:
-                    continue
-            
-            if date_obj is None:
-                print(f"无法解析日期格式: {date_str}，默认按交易日处理")
-                return True
-                
-            date_only = date_obj.date()
-            if date_only in _cn_holidays:
-                print(f"日期 {date_str} 是法定节假日（{_cn_holidays.get(date_only)}），非交易日")
-                return False
-            # 如果是周末，非交易日
-            if date_obj.weekday() >= 5:
-                print(f"日期 {date_str} 是周末，非交易日")
-                return False
-            return True
-        except:
-            # 实在判断不出来，默认为交易日
-            print(f"无法确定 {date_str} 是否为交易日，默认按普通工作日处理")
-            return True
+        # 实在判断不出来，默认为交易日
+        print(f"判断交易日异常: {str(e)}，默认按交易日处理")
+        return True
 
 def get_trade_days_count(start_date: str, end_date: str) -> int:
     """计算指定日期范围内的交易日天数
@@ -394,19 +515,7 @@ def get_trade_days_count(start_date: str, end_date: str) -> int:
             logging.error(f"起始日期 {start_date} 晚于结束日期 {end_date}")
             return 0
             
-        # 初始化计数器
-        trade_days = 0
-        
-        # 遍历日期范围内的每一天
-        current_dt = start_dt
-        while current_dt <= end_dt:
-            current_date_str = current_dt.strftime("%Y-%m-%d")
-            # 使用is_trade_day函数判断是否为交易日
-            if is_trade_day(current_date_str):
-                trade_days += 1
-            
-            # 前进到下一天
-            current_dt += timedelta(days=1)
+        trade_days = get_trading_calendar().count(start_dt, end_dt)
             
         logging.info(f"从 {start_date} 到 {end_date} 共有 {trade_days} 个交易日")
         return trade_days
@@ -426,6 +535,8 @@ class KhQuTools:
         # 为了兼容性保留这些属性，但实际会使用模块级函数
         self.trading_periods = _trading_periods
         self.cn_holidays = _cn_holidays
+        # 全局共享的交易日历
+        self.calendar = get_trading_calendar()
         
     def is_trade_time(self) -> bool:
         """判断是否为交易时间（调用模块级函数）"""
@@ -2479,6 +2590,52 @@ def get_stock_names(stock_codes, stock_list_file):
     
     return stock_names
 
+def _history_start(period: str, bar_count: int, current_datetime: datetime) -> str:
+    """计算 khHistory 获取 current_datetime 之前 bar_count 根K线所需的起始日期（YYYYMMDD）"""
+    if period == '1d':
+        # 日线不包含当前日期
+        return _lookback_start(current_datetime, bar_count, include_end_day=False)
+    if period in _BARS_PER_DAY:
+        return _lookback_start(current_datetime, bar_count, _BARS_PER_DAY[period])
+    # 其他周期无法按交易日精确估算，沿用按自然日的宽松窗口
+    return (current_datetime - timedelta(days=bar_count * 3)).strftime('%Y%m%d')
+
+
+# K线数量不足时向前扩大查询窗口的最大次数（每次窗口翻倍）
+_HISTORY_REFETCH_ROUNDS = 6
+
+
+def _history_bar_count(stock_data, period: str, current_datetime: datetime, skip_paused: bool) -> int:
+    """统计 current_datetime 之前可返回的K线数量（跳过停牌时只计成交量大于0的K线），time 列为毫秒时间戳"""
+    if stock_data is None or stock_data.empty or 'time' not in stock_data.columns:
+        return 0
+    times = pd.to_datetime(stock_data['time'].astype(float), unit='ms') + pd.Timedelta(hours=8)
+    if period in ('tick', '1m', '5m'):
+        mask = times < current_datetime
+    else:
+        mask = times.dt.date < current_datetime.date()
+    if skip_paused and 'volume' in stock_data.columns:
+        mask &= stock_data['volume'] > 0
+    return int(mask.sum())
+
+
+def _download_history(stock_codes, period: str, start_date: str, end_date: str) -> int:
+    """逐只下载历史数据到本地，返回下载成功的股票数量"""
+    download_count = 0
+    for stock_code in stock_codes:
+        try:
+            xtdata.download_history_data(
+                stock_code=stock_code,
+                period=period,
+                start_time=start_date,
+                end_time=end_date
+            )
+            download_count += 1
+        except Exception as e:
+            print(f"下载 {stock_code} 数据失败: {str(e)}")
+    return download_count
+
+
 def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_paused=False, fq='pre', force_download=False):
     """
     获取股票历史数据（不包含当前时间点）
@@ -2589,22 +2746,8 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
             # 根据当前时间和bar_count计算开始时间
             start_date = None
             try:
-                # 根据数据类型确定需要的历史天数
-                if period == 'tick':
-                    # tick数据只需要当天的数据，但要向前多取一些天以防当天无数据
-                    target_days = 3
-                elif period in ['1m', '5m']:
-                    # 分钟数据，计算需要的天数，增加缓冲
-                    target_days = max(10, (bar_count * 10 + 1439) // 1440)  # 增加缓冲
-                elif period in ['1d']:
-                    # 日线数据，增加缓冲天数
-                    target_days = bar_count * 5  # 增加缓冲
-                else:
-                    target_days = bar_count * 3
-                
-                # 计算开始日期（往前推target_days天）
-                start_dt = current_datetime - timedelta(days=target_days)
-                start_date = start_dt.strftime('%Y%m%d')
+                # 按交易日历计算恰好覆盖bar_count根K线的起始日期，不足时在获取阶段再向前补下载
+                start_date = _history_start(period, bar_count, current_datetime)
                 
                 print(f"计算的数据范围: {start_date} 到 {current_date_str}")
                 
@@ -2615,40 +2758,43 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
                 start_date = start_dt.strftime('%Y%m%d')
             
             # 使用xtdata.download_history_data下载数据到指定时间
-            download_count = 0
-            for stock_code in stock_codes:
-                try:
-                    xtdata.download_history_data(
-                        stock_code=stock_code,
-                        period=period,
-                        start_time=start_date,
-                        end_time=current_date_str
-                    )
-                    download_count += 1
-                except Exception as e:
-                    print(f"下载 {stock_code} 数据失败: {str(e)}")
+            download_count = _download_history(stock_codes, period, start_date, current_date_str)
             
             print(f"成功下载 {download_count}/{len(stock_codes)} 只股票的数据")
         
+        # 指定了current_time（回测场景）时，从进程内缓存按时间点切片，避免每次调用都读取和转换数据
+        # tick数据量过大，不做整段缓存
+        if current_time is not None and period != 'tick':
+            history_cache = get_history_cache()
+            if force_download:
+                history_cache.invalidate(stock_codes, period, dividend_type)
+            result = history_cache.history(stock_codes, list(fields), bar_count, period, dividend_type,
+                                           current_datetime, skip_paused)
+            if force_download:
+                # 只下载了按交易日历估算的窗口，遇到停牌、交易所额外休市等情况K线会不足，
+                # 对不足的股票逐步向前翻倍补下载，直到数量足够或数据不再增加（已到上市首日）
+                lookback = bar_count
+                pending = list(stock_codes)
+                for _ in range(_HISTORY_REFETCH_ROUNDS):
+                    pending = [code for code in pending if len(result.get(code, ())) < bar_count]
+                    if not pending:
+                        break
+                    lookback *= 2
+                    lengths = history_cache.series_lengths(pending, period, dividend_type)
+                    _download_history(pending, period, _history_start(period, lookback, current_datetime),
+                                      current_date_str)
+                    history_cache.invalidate(pending, period, dividend_type)
+                    result.update(history_cache.history(pending, list(fields), bar_count, period, dividend_type,
+                                                        current_datetime, skip_paused))
+                    new_lengths = history_cache.series_lengths(pending, period, dividend_type)
+                    pending = [code for code in pending if new_lengths[code] > lengths[code]]
+            return result
+        
         # 使用xtdata.get_market_data_ex获取数据
         #print(f"从本地获取数据，基于时间: {current_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # 计算实际的数据获取范围
-        # 根据频率确定往前推算的天数，增加缓冲以确保有足够的历史数据
-        if period == 'tick':
-            # tick数据只获取当天的，但向前多取几天
-            lookback_days = 3
-        elif period in ['1m', '5m']:
-            # 分钟数据，往前推算较多天数以确保有足够数据
-            lookback_days = max(10, (bar_count * 10 + 1439) // 1440)  # 增加缓冲
-        elif period in ['1d']:
-            # 日线数据，往前推算更多天数以确保有足够的交易日
-            lookback_days = bar_count * 5  # 增加缓冲
-        else:
-            lookback_days = bar_count * 3
-        
-        start_dt = current_datetime - timedelta(days=lookback_days)
-        start_time = start_dt.strftime('%Y%m%d')
+        # 计算实际的数据获取范围（按交易日历恰好覆盖bar_count根K线）
+        start_time = _history_start(period, bar_count, current_datetime)
         end_time = current_date_str
         
         #print(f"实际查询范围: {start_time} 到 {end_time}")
@@ -2669,6 +2815,38 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
             print("未获取到任何数据")
             return {}
         
+        # 按交易日历估算的窗口遇到停牌（跳过停牌时）、交易所额外休市、成交稀疏等情况K线会不足，
+        # 对不足的股票逐步向前翻倍扩大窗口补取，直到数量足够或数据不再增加（已到上市首日）
+        lookback = bar_count
+        pending = list(stock_codes)
+        for _ in range(_HISTORY_REFETCH_ROUNDS):
+            pending = [code for code in pending
+                       if _history_bar_count(data.get(code), period, current_datetime, skip_paused) < bar_count]
+            if not pending:
+                break
+            lookback *= 2
+            refetch_start = _history_start(period, lookback, current_datetime)
+            if force_download:
+                _download_history(pending, period, refetch_start, end_time)
+            more = xtdata.get_market_data_ex(
+                field_list=['time'] + fields,
+                stock_list=pending,
+                period=period,
+                start_time=refetch_start,
+                end_time=end_time,
+                count=-1,
+                dividend_type=dividend_type,
+                fill_data=True
+            ) or {}
+            grown = []
+            for code in pending:
+                old_data, new_data = data.get(code), more.get(code)
+                old_len = 0 if old_data is None else len(old_data)
+                if new_data is not None and len(new_data) > old_len:
+                    data[code] = new_data
+                    grown.append(code)
+            pending = grown
+        
         # 处理每只股票的数据
         for stock_code in stock_codes:
             if stock_code not in data:
@@ -2917,35 +3095,24 @@ def _parse_period(period: str) -> tuple:
 
 def _get_year_first_trade_day(year: int) -> datetime:
     """获取指定年份的第一个交易日"""
-    from datetime import datetime, timedelta
-    
-    # 从1月1日开始查找
-    current_date = datetime(year, 1, 1)
-    end_date = datetime(year, 2, 1)  # 最多查到2月1日
-    
-    while current_date < end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        if is_trade_day(date_str):
-            return current_date
-        current_date += timedelta(days=1)
-    
-    # 如果找不到，返回1月1日（理论上不应该发生）
-    logging.warning(f"未找到{year}年的第一个交易日，使用1月1日")
-    return datetime(year, 1, 1)
+    first_day = get_trading_calendar().shift(date(year, 1, 1), 0)
+    if first_day.year != year:
+        # 如果找不到，返回1月1日（理论上不应该发生）
+        logging.warning(f"未找到{year}年的第一个交易日，使用1月1日")
+        return datetime(year, 1, 1)
+    return datetime(first_day.year, first_day.month, first_day.day)
 
 
 def _get_trade_days_list(start_date: datetime, end_date: datetime) -> List[datetime]:
     """获取指定日期范围内的所有交易日列表"""
-    trade_days = []
-    current = start_date
-    
-    while current <= end_date:
-        date_str = current.strftime('%Y-%m-%d')
-        if is_trade_day(date_str):
-            trade_days.append(current)
-        current += timedelta(days=1)
-    
-    return trade_days
+    if start_date > end_date:
+        return []
+    # 与原逐日遍历保持一致：返回的交易日沿用 start_date 的时分秒
+    start_time = start_date.time() if isinstance(start_date, datetime) else datetime.min.time()
+    last_day = end_date.date() if isinstance(end_date, datetime) else end_date
+    if isinstance(end_date, datetime) and end_date.time() < start_time:
+        last_day = last_day - timedelta(days=1)
+    return [datetime.combine(d, start_time) for d in get_trading_calendar().range(start_date, last_day)]
 
 
 def _process_930_data(df: pd.DataFrame, fields: List[str]) -> pd.DataFrame:
@@ -3065,10 +3232,8 @@ def _get_minute_kline(
         # 使用原生周期直接获取
         period_str = f"{period_minutes}m"
         
-        # 计算需要获取的数据范围
-        lookback_days = max(10, (bar_count * period_minutes + 1439) // 1440)
-        start_dt = target_datetime - timedelta(days=lookback_days)
-        start_time = start_dt.strftime('%Y%m%d')
+        # 计算需要获取的数据范围（按交易日历恰好覆盖bar_count根K线）
+        start_time = _lookback_start(target_datetime, bar_count, -(-_SESSION_MINUTES // period_minutes))
         end_time = target_datetime.strftime('%Y%m%d')
         
         if force_download:
@@ -3122,10 +3287,8 @@ def _get_minute_kline(
             result[stock_code] = df
     
     else:
-        # 非原生周期，需要聚合1分钟数据
-        lookback_days = max(10, (bar_count * period_minutes + 1439) // 1440)
-        start_dt = target_datetime - timedelta(days=lookback_days)
-        start_time = start_dt.strftime('%Y%m%d')
+        # 非原生周期，需要聚合1分钟数据（每个交易日聚合为 ceil(240/周期) 根）
+        start_time = _lookback_start(target_datetime, bar_count, -(-_SESSION_MINUTES // period_minutes))
         end_time = target_datetime.strftime('%Y%m%d')
         
         if force_download:
@@ -3230,9 +3393,7 @@ def _get_hour_kline(
     
     # 小时周期通过聚合1分钟数据实现
     period_minutes = period_hours * 60
-    lookback_days = max(10, (bar_count * period_minutes + 1439) // 1440)
-    start_dt = target_datetime - timedelta(days=lookback_days)
-    start_time = start_dt.strftime('%Y%m%d')
+    start_time = _lookback_start(target_datetime, bar_count, -(-_SESSION_MINUTES // period_minutes))
     end_time = target_datetime.strftime('%Y%m%d')
     
     if force_download:
@@ -3334,10 +3495,8 @@ def _get_day_kline(
     result = {}
     
     if period_days == 1:
-        # 1日线直接获取
-        lookback_days = bar_count * 5
-        start_dt = target_datetime - timedelta(days=lookback_days)
-        start_time = start_dt.strftime('%Y%m%d')
+        # 1日线直接获取（包含目标日当天）
+        start_time = _lookback_start(target_datetime, bar_count)
         end_time = target_datetime.strftime('%Y%m%d')
         
         if force_download:
@@ -3402,10 +3561,11 @@ def _get_day_kline(
             target_year -= 1
             year_first_day = _get_year_first_trade_day(target_year)
         
-        # 计算需要获取的数据范围
-        lookback_days = bar_count * period_days * 5
-        start_dt = max(year_first_day, target_datetime - timedelta(days=lookback_days))
-        start_time = start_dt.strftime('%Y%m%d')
+        # 计算需要获取的数据范围：从最近bar_count组中第一组的首个交易日开始（不早于年初）
+        calendar = get_trading_calendar()
+        target_index = calendar.count(year_first_day, target_datetime) - 1
+        first_group = max(0, target_index // period_days - bar_count + 1)
+        start_time = calendar.shift(year_first_day, first_group * period_days).strftime('%Y%m%d')
         end_time = target_datetime.strftime('%Y%m%d')
         
         if force_download:
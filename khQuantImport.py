@@ -32,7 +32,8 @@ import khQTTools as _khq
 from khQTTools import (
     generate_signal, calculate_max_buy_volume, KhQuTools, khMA,
     # 新增的独立函数，可以直接使用，无需实例化类
-    is_trade_time, is_trade_day, get_trade_days_count
+    is_trade_time, is_trade_day, get_trade_days_count,
+    TradingCalendar, get_trading_calendar
 )
 # 同时将 khQTTools 的其他常用工具函数暴露出来（如 khHistory 等）
 from khQTTools import *
@@ -557,6 +558,7 @@ __all__ = [
     
     # 时间工具函数 - 可直接使用，无需实例化类
     'is_trade_time', 'is_trade_day', 'get_trade_days_count',
+    'TradingCalendar', 'get_trading_calendar',
     
     # 新增类和函数
     'TimeInfo', 'StockDataParser', 'PositionParser', 'StockPoolParser',
@@ -1,11 +1,221 @@
 # coding: utf-8
 from typing import Dict, List, Optional
 import datetime
+from collections.abc import Mapping, MutableMapping
 from types import SimpleNamespace
 
+import numpy as np
+
 from xtquant.xttrader import XtQuantTraderCallback
 from xtquant import xtconstant
 
+
+class Fill:
+    """一笔成交：滑点后的成交价和各项交易成本
+
+    交易成本在撮合前由 KhTradeManager.calculate_fill 一次算出，下单、日志和交易记录都直接使用。
+    资金或持仓不足等未成交的信号同样写入交易记录，status 标记为 REJECTED。
+    """
+
+    FILLED = 'filled'
+    REJECTED = 'rejected'
+
+    __slots__ = ('code', 'action', 'price', 'volume', 'amount',
+                 'commission', 'stamp_tax', 'transfer_fee', 'flow_fee', 'trade_cost', 'status')
+
+    # 写入交易记录（trades.csv）的字段
+    RECORD_FIELDS = ('code', 'action', 'price', 'volume', 'amount',
+                     'commission', 'stamp_tax', 'transfer_fee', 'flow_fee')
+
+    def __init__(self, code, action, price, volume, commission=0.0, stamp_tax=0.0, transfer_fee=0.0, flow_fee=0.0,
+                 status=FILLED):
+        self.code = code
+        self.action = action
+        self.price = price
+        self.volume = volume
+        self.amount = price * volume
+        self.commission = commission
+        self.stamp_tax = stamp_tax
+        self.transfer_fee = transfer_fee
+        self.flow_fee = flow_fee
+        self.trade_cost = commission + stamp_tax + transfer_fee + flow_fee
+        self.status = status
+
+    def to_record(self) -> Dict:
+        """交易记录中的成交字段"""
+        return {name: getattr(self, name) for name in self.RECORD_FIELDS}
+
+
+class PositionView(MutableMapping):
+    """持仓账本中单只股票的字典视图，读写直接作用于账本
+
+    与原先的持仓字典用法一致：pos['volume']、pos.get('avg_price')、pos['volume'] += 100、
+    SimpleNamespace(**pos)、pos.copy() 等；数值字段返回 Python 标量。
+    """
+    __slots__ = ('_ledger', '_code')
+
+    def __init__(self, ledger: 'PositionLedger', code: str):
+        self._ledger = ledger
+        self._code = code
+
+    def __getitem__(self, key):
+        ledger = self._ledger
+        row = ledger._ids[self._code]
+        array = ledger._arrays.get(key)
+        if array is not None:
+            return array[row].item()
+        return ledger._extra[row][key]
+
+    def __setitem__(self, key, value):
+        ledger = self._ledger
+        row = ledger._ids[self._code]
+        array = ledger._arrays.get(key)
+        if array is not None:
+            array[row] = value
+        else:
+            ledger._extra[row][key] = value
+
+    def __delitem__(self, key):
+        if key in self._ledger._arrays:
+            raise KeyError(f"持仓字段 {key} 不能删除")
+        del self._ledger._extra[self._ledger._ids[self._code]][key]
+
+    def __iter__(self):
+        yield from self._ledger._arrays
+        yield from self._ledger._extra[self._ledger._ids[self._code]]
+
+    def __len__(self) -> int:
+        return len(self._ledger._arrays) + len(self._ledger._extra[self._ledger._ids[self._code]])
+
+    def copy(self) -> Dict:
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class PositionLedger(MutableMapping):
+    """数组存储的持仓账本
+
+    每只持仓股票分配一个行号，数量、可用数量、均价、现价、市值、盈亏保存在 NumPy 数组中，
+    逐日盯市、T+1 结算和持仓市值汇总都是整列运算；其余字段（账户、方向等）按行保存在字典中。
+    对外仍是 {股票代码: 持仓字典} 的映射，按买入顺序遍历，取值时才生成 PositionView，
+    策略、风控和回调中原有的字典用法不变。
+    """
+
+    FIELDS = {
+        'volume': np.int64,
+        'can_use_volume': np.int64,
+        'avg_price': np.float64,
+        'current_price': np.float64,
+        'market_value': np.float64,
+        'profit': np.float64,
+        'profit_ratio': np.float64,
+    }
+
+    def __init__(self, capacity: int = 16):
+        self._ids = {}  # 股票代码 -> 行号（按建仓顺序）
+        self._free = []  # 清仓后可复用的行号
+        self._extra = []  # 各行的非数值字段
+        self._arrays = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.FIELDS.items()}
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        row = len(self._extra)
+        capacity = len(self._arrays['volume'])
+        if row >= capacity:
+            for name, array in self._arrays.items():
+                grown = np.zeros(capacity * 2, dtype=array.dtype)
+                grown[:capacity] = array
+                self._arrays[name] = grown
+        self._extra.append({})
+        return row
+
+    def __getitem__(self, code) -> PositionView:
+        if code not in self._ids:
+            raise KeyError(code)
+        return PositionView(self, code)
+
+    def __setitem__(self, code, position: Mapping):
+        position = dict(position)
+        row = self._ids.get(code)
+        if row is None:
+            row = self._allocate()
+            self._ids[code] = row
+        extra = {}
+        for name, array in self._arrays.items():
+            array[row] = 0
+        for key, value in position.items():
+            array = self._arrays.get(key)
+            if array is not None:
+                array[row] = value
+            else:
+                extra[key] = value
+        self._extra[row] = extra
+
+    def __delitem__(self, code):
+        row = self._ids.pop(code)
+        self._extra[row] = {}
+        self._free.append(row)
+
+    def __contains__(self, code) -> bool:
+        return code in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def clear(self):
+        self._ids.clear()
+        self._free.clear()
+        self._extra.clear()
+
+    def copy(self) -> Dict[str, Dict]:
+        """复制为普通的 {股票代码: 持仓字典}"""
+        return {code: dict(view) for code, view in self.items()}
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def rows(self) -> np.ndarray:
+        """持仓股票的行号（与遍历顺序一致）"""
+        return np.fromiter(self._ids.values(), dtype=np.int64, count=len(self._ids))
+
+    def column(self, name: str) -> np.ndarray:
+        """持仓股票的某个数值字段（与遍历顺序一致，返回副本）"""
+        return self._arrays[name][self.rows()]
+
+    def settle(self):
+        """T+1 结算：新交易日将可用数量更新为持仓数量"""
+        rows = self.rows()
+        volume = self._arrays['volume'][rows]
+        held = volume > 0
+        self._arrays['can_use_volume'][rows[held]] = volume[held]
+
+    def mark_to_market(self, prices: np.ndarray) -> np.ndarray:
+        """按价格（与遍历顺序一致）更新现价、市值和盈亏
+
+        Returns:
+            np.ndarray: 各持仓市值
+        """
+        rows = self.rows()
+        volume = self._arrays['volume'][rows]
+        avg_price = self._arrays['avg_price'][rows]
+        prices = np.asarray(prices, dtype=np.float64)
+        market_value = prices * volume
+        gain = prices - avg_price
+        profit_ratio = np.zeros(len(rows))
+        np.divide(gain, avg_price, out=profit_ratio, where=avg_price > 0)
+        self._arrays['current_price'][rows] = prices
+        self._arrays['market_value'][rows] = market_value
+        self._arrays['profit'][rows] = gain * volume
+        self._arrays['profit_ratio'][rows] = profit_ratio
+        return market_value
+
+
 class KhTradeManager:
     """交易管理类"""
     
@@ -15,7 +225,7 @@ class KhTradeManager:
         self.orders = {}  # 订单管理
         self.assets = {}  # 资产管理
         self.trades = {}  # 成交管理
-        self.positions = {}  # 持仓管理
+        self.positions = PositionLedger()  # 持仓管理
         
         # 获取交易成本配置
         trade_cost = self.config.config_dict.get("backtest", {}).get("trade_cost", {})
@@ -158,42 +368,49 @@ class KhTradeManager:
         """计算流量费（每笔交易固定收取）"""
         return self.flow_fee
 
-    def calculate_trade_cost(self, price, volume, direction, stock_code):
+    def calculate_fill(self, stock_code, direction, price, volume) -> Fill:
         """
-        计算交易成本
+        按委托价格计算一笔成交的实际成交价和各项交易成本
         
         Args:
-            price: float, 交易价格
-            volume: int, 交易数量
-            direction: str, 交易方向 'buy' 或 'sell'
             stock_code: str, 股票代码
+            direction: str, 交易方向 'buy' 或 'sell'
+            price: float, 委托价格
+            volume: int, 交易数量
             
         Returns:
-            tuple: (实际成交价格, 总交易成本)
+            Fill: 成交记录
         """
         # 如果数量为0，不产生交易成本
         if volume <= 0:
-            return price, 0.0
+            return Fill(stock_code, direction, price, volume)
             
         # 计算滑点后的价格
         actual_price = self.calculate_slippage(price, direction)
         
-        # 计算佣金
-        commission = self.calculate_commission(actual_price, volume)
-        
-        # 计算印花税（只收取卖出印花税）
-        stamp_tax = self.calculate_stamp_tax(actual_price, volume, direction)
-        
-        # 计算过户费（沪市股票）
-        transfer_fee = self.calculate_transfer_fee(stock_code, actual_price, volume)
-        
-        # 计算流量费（每笔交易固定收取）
-        flow_fee = self.calculate_flow_fee()
-        
-        # 总交易成本
-        total_cost = commission + stamp_tax + transfer_fee + flow_fee
+        return Fill(
+            stock_code, direction, actual_price, volume,
+            commission=self.calculate_commission(actual_price, volume),
+            stamp_tax=self.calculate_stamp_tax(actual_price, volume, direction),  # 只收取卖出印花税
+            transfer_fee=self.calculate_transfer_fee(stock_code, actual_price, volume),  # 沪市股票
+            flow_fee=self.calculate_flow_fee()  # 每笔交易固定收取
+        )
+
+    def calculate_trade_cost(self, price, volume, direction, stock_code):
+        """
+        计算交易成本
         
-        return actual_price, total_cost
+        Args:
+            price: float, 交易价格
+            volume: int, 交易数量
+            direction: str, 交易方向 'buy' 或 'sell'
+            stock_code: str, 股票代码
+            
+        Returns:
+            tuple: (实际成交价格, 总交易成本)
+        """
+        fill = self.calculate_fill(stock_code, direction, price, volume)
+        return fill.price, fill.trade_cost
 
     def process_signals(self, signals: List[Dict]):
         """处理交易信号
@@ -213,7 +430,11 @@ class KhTradeManager:
                 "order_time": str, # 可选，委托时间，格式"HH:MM:SS"
                 "remark": str      # 可选，备注信息
             }
+
+        Returns:
+            List[Fill]: 回测中各信号的成交记录（数量为0、资金或持仓不足未成交的信号 status 为 Fill.REJECTED）
         """
+        fills = []
         for signal in signals:
             # 跳过数量为0的交易信号
             if signal["volume"] <= 0:
@@ -221,29 +442,40 @@ class KhTradeManager:
                 print(f"[WARNING] {error_msg}")
                 if self.callback:
                     self.callback.gui.log_message(error_msg, "WARNING")
+                # 与原先的交易记录一致：按委托价计算各项费用
+                price, volume = signal["price"], signal["volume"]
+                fills.append(Fill(
+                    signal["code"], signal["action"], price, volume,
+                    commission=self.calculate_commission(price, volume),
+                    stamp_tax=self.calculate_stamp_tax(price, volume, signal["action"]),
+                    transfer_fee=self.calculate_transfer_fee(signal["code"], price, volume),
+                    flow_fee=self.calculate_flow_fee(),
+                    status=Fill.REJECTED
+                ))
                 continue
                 
             # 计算交易成本
             direction = "buy" if signal["action"].lower() == "buy" else "sell"
-            actual_price, trade_cost = self.calculate_trade_cost(
-                signal["price"],
-                signal["volume"],
-                direction,
-                signal["code"]
-            )
+            fill = self.calculate_fill(signal["code"], direction, signal["price"], signal["volume"])
             
             # 添加交易成本信息
-            signal["trade_cost"] = trade_cost
-            signal["actual_price"] = actual_price
+            signal["trade_cost"] = fill.trade_cost
+            signal["actual_price"] = fill.price
             
             # 执行下单
-            self.place_order(signal)
+            if self.place_order(signal, fill) is not None:
+                fills.append(fill)
+        return fills
             
-    def place_order(self, signal: Dict):
+    def place_order(self, signal: Dict, fill: Optional[Fill] = None) -> Optional[Fill]:
         """下单
         
         Args:
             signal: 交易信号
+            fill: 已计算的成交价和交易成本，为空时按信号计算
+
+        Returns:
+            Fill: 回测时返回成交记录（传入的 fill 未成交时 status 为 Fill.REJECTED），实盘和模拟返回 None
         """
         # 根据运行模式选择不同的下单逻辑
         if self.config.run_mode == "live":
@@ -251,7 +483,12 @@ class KhTradeManager:
         elif self.config.run_mode == "simulate":
             self._place_order_simulate(signal)
         else:
-            self._place_order_backtest(signal)
+            filled = self._place_order_backtest(signal, fill)
+            if filled is None and fill is not None:
+                fill.status = Fill.REJECTED
+                return fill
+            return filled
+        return None
         
     def _place_order_live(self, signal: Dict):
         """实盘下单逻辑"""
@@ -266,19 +503,16 @@ class KhTradeManager:
         # 更新模拟数据字典
         self.update_dic(signal)
         
-    def _place_order_backtest(self, signal: Dict):
-        """回测下单逻辑"""
+    def _place_order_backtest(self, signal: Dict, fill: Optional[Fill] = None) -> Optional[Fill]:
+        """回测下单逻辑，成交时返回成交记录"""
         try:
             # 生成订单ID
             order_id = len(self.orders) + 1
             
             # -- 提前计算交易成本和实际价格 --
-            actual_price, trade_cost = self.calculate_trade_cost(
-                signal["price"],
-                signal["volume"],
-                signal["action"],
-                signal["code"]
-            )
+            if fill is None:
+                fill = self.calculate_fill(signal["code"], signal["action"], signal["price"], signal["volume"])
+            actual_price, trade_cost = fill.price, fill.trade_cost
             
             # 计算买入所需的总资金（包括交易成本）
             if signal["action"] == "buy":
@@ -462,11 +696,6 @@ class KhTradeManager:
             
             # 输出交易成本信息到GUI日志
             if self.callback:
-                commission = self.calculate_commission(actual_price, signal["volume"])
-                stamp_tax = self.calculate_stamp_tax(actual_price, signal["volume"], signal["action"])
-                transfer_fee = self.calculate_transfer_fee(signal["code"], actual_price, signal["volume"])
-                flow_fee = self.calculate_flow_fee()
-                
                 cost_msg = (
                     f"交易成本 - "
                     f"股票代码: {signal['code']} | "
@@ -474,10 +703,10 @@ class KhTradeManager:
                     f"成交数量: {signal['volume']} | "
                     f"成交价格: {actual_price:.{decimals}f} | "
                     f"交易金额: {actual_price * signal['volume']:.{decimals}f} | "
-                    f"佣金: {commission:.2f} | "
-                    f"印花税: {stamp_tax:.2f} | "
-                    f"过户费: {transfer_fee:.2f} | "
-                    f"流量费: {flow_fee:.2f} | "
+                    f"佣金: {fill.commission:.2f} | "
+                    f"印花税: {fill.stamp_tax:.2f} | "
+                    f"过户费: {fill.transfer_fee:.2f} | "
+                    f"流量费: {fill.flow_fee:.2f} | "
                     f"总成本: {trade_cost:.2f}"
                 )
                 self.callback.gui.log_message(cost_msg, "TRADE")
@@ -493,6 +722,8 @@ class KhTradeManager:
                 self.callback.on_stock_order(SimpleNamespace(**order))
                 self.callback.on_stock_trade(SimpleNamespace(**trade))
                 # 资产和持仓回调在资产/持仓实际变化时触发
+
+            return fill
                 
         except Exception as e:
             print(f"回测下单异常: {str(e)}")